@@ -3,51 +3,201 @@ from __future__ import division, print_function
 ## Import General Tools
 import sys
 import os
+import csv
+import argparse
+from pathlib import Path
 
+import numpy as np
 from astropy.table import Table, Column
 
-import matplotlib.pyplot as plt
-import matplotlib as mpl
-mpl.rcParams['font.size'] = 24
-
-def main():
-    history_file = 'HIRES_history.csv'
-    sched = Table.read(history_file, format='ascii.csv', guess=False)
-    year = [int(x[0:4]) for x in sched['Date']]
-    sched.add_column(Column(year, name='year'))
-#     nightfrac = [1./min([2,len(x.split('/'))]) for x in sched['Instrument']]
-    nightfrac = [1. for x in sched['Instrument']]
-    sched.add_column(Column(nightfrac, name='fraction'))
-    
-    years = []
-    nights = []
-    byyear = sched.group_by('year')
-    for i,val in enumerate(byyear.groups):
-        years.append(byyear.groups[i]['year'][0])
-        nights.append(sum(byyear.groups[i]['fraction']))
-    
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from utils.reporting import pyplot, render, render_all
+
+
+##-------------------------------------------------------------------------
+## Read History Files
+##-------------------------------------------------------------------------
+def repaired_lines(filename, fallback='cp1252'):
+    '''Yield the lines of a file as text, decoding each line as UTF-8 and
+    falling back to the given encoding for lines which are not valid UTF-8.
+    '''
+    with open(filename, 'rb') as FO:
+        for i,line in enumerate(FO):
+            if i == 0 and line.startswith(b'\xef\xbb\xbf'):
+                line = line[3:]
+            try:
+                yield line.decode('utf-8')
+            except UnicodeDecodeError:
+                yield line.decode(fallback, errors='replace')
+
+
+def read_history(filename):
+    '''Stream the Date and Instrument columns of a history CSV file in to
+    numpy arrays.
+    '''
+    dates = []
+    instruments = []
+    for row in csv.DictReader(repaired_lines(filename)):
+        dates.append(row['Date'].strip())
+        instruments.append(row.get('Instrument', '').strip())
+    return np.array(dates, dtype='U10'), np.array(instruments, dtype=str)
+
+
+def fix_csv(infile='HIRES_history2.csv', outfile='HIRES_history2b.csv'):
+    '''Write a copy of a history file with the encoding repaired.
+    '''
+    with open(outfile, 'w') as OFO:
+        for line in repaired_lines(infile):
+            OFO.write(line)
+
+
+##-------------------------------------------------------------------------
+## Nights per Year
+##-------------------------------------------------------------------------
+def year_of(dates):
+    '''Year of an array of date strings starting with the year (e.g.
+    YYYY-MM-DD, YYYY/M/D).  Returns the years and a boolean array which is
+    False for dates without a four digit year (e.g. blank), whose year is 0.
+    '''
+    head = np.asarray(dates, dtype=str).astype('U4')
+    valid = (np.char.str_len(head) == 4) & np.char.isdigit(head)
+    years = np.zeros(len(head), dtype=int)
+    years[valid] = head[valid].astype(int)
+    return years, valid
+
+
+def night_fractions(instruments, instrument=None, split=False):
+    '''Weight of each night: 1 or, if split is set, one over the number of
+    instruments sharing the night (e.g. HIRES/LRIS).  If instrument is
+    given, nights which do not include it have zero weight.
+    '''
+    instruments = np.asarray(instruments, dtype=str)
+    weights = np.ones(len(instruments))
+    if split is True:
+        weights /= np.char.count(instruments, '/') + 1
+    if instrument is not None:
+        # Delimit both so that e.g. HIRES does not match HIRESr
+        shared = np.char.add(np.char.add('/', instruments), '/')
+        weights *= np.char.find(shared, f'/{instrument}/') >= 0
+    return weights
+
+
+def nights_per_year(years, weights):
+    '''Sum of the weights in each year, returned as (years, nights).
+    '''
+    if len(years) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0)
+    first = years.min()
+    nights = np.bincount(years - first, weights=weights)
+    return np.arange(first, first + len(nights)), nights
+
+
+def instrument_history(filename, instrument=None, split=False):
+    dates, instruments = read_history(filename)
+    weights = night_fractions(instruments, instrument=instrument, split=split)
+    years, valid = year_of(dates)
+    if not np.all(valid):
+        print(f'WARNING: Skipping {np.sum(~valid)} rows of {filename} with '
+              f'unparseable dates: {sorted(set(dates[~valid]))}')
+    years, nights = nights_per_year(years[valid], weights[valid])
+    return Table([Column(years, name='year'), Column(nights, name='nights')])
+
+
+def draw_history(data):
+    plt = pyplot()
     plt.figure(figsize=(16,9))
-    plt.bar(years, nights, width=0.8)
+    plt.bar(data['year'], data['nights'], width=0.8)
+    plt.title(data['instrument'])
     plt.xlabel('Year')
     plt.ylabel('Nights / Year')
-    plt.xlim(1993,2018)
+    plt.xlim(min(data['year'])-1, max(data['year'])+1)
     plt.grid()
-    plt.savefig('HIRES.png', dpi=72, bbox_inches='tight', pad_inches=0.1)
-    
-
-def fix_csv():
-
-    with open('HIRES_history2.csv', 'r') as FO:
-        contents = FO.read()
-    lines = contents.split('\n')
-
-    if os.path.exists('HIRES_history2b.csv'):
-        os.remove('HIRES_history2b.csv')
-    with open('HIRES_history2b.csv', 'w') as OFO:
-        for line in lines:
-            OFO.write('{}\n'.format(line.encode('utf-8').decode()))
-    
-    
+
+
+def history_job(history, instrument, plotfile=None):
+    '''Job for render_all drawing one instrument's history.
+    '''
+    if plotfile is None:
+        plotfile = f'{instrument}.png'
+    data = {'instrument': instrument,
+            'year': np.asarray(history['year']),
+            'nights': np.asarray(history['nights'])}
+    return (draw_history, data, plotfile,
+            {'rc': {'font.size': 24}, 'dpi': 72, 'bbox_inches': 'tight',
+             'pad_inches': 0.1})
+
+
+def plot_history(history, instrument, plotfile=None, fmt='png'):
+    plot, data, plotfile, kwargs = history_job(history, instrument, plotfile=plotfile)
+    return render(plot, data, plotfile, fmt=fmt, **kwargs)
+
+
+def main(history_files=['HIRES_history.csv'], instruments=None, split=False,
+         plot=True, fmt='png', processes=1):
+    '''Nights per year for each instrument.  Without instruments, each file
+    is the history of the instrument named by its prefix (e.g.
+    HIRES_history.csv), otherwise each instrument is counted from the
+    Instrument column of all of the files.
+    '''
+    histories = {}
+    if instruments is None:
+        for history_file in history_files:
+            instrument = os.path.basename(history_file).split('_')[0]
+            histories[instrument] = instrument_history(history_file, split=split)
+    else:
+        for instrument in instruments:
+            tabs = [instrument_history(f, instrument=instrument, split=split)
+                    for f in history_files]
+            years = np.concatenate([tab['year'] for tab in tabs])
+            nights = np.concatenate([tab['nights'] for tab in tabs])
+            years, nights = nights_per_year(years, nights)
+            keep = nights > 0
+            histories[instrument] = Table([Column(years[keep], name='year'),
+                                           Column(nights[keep], name='nights')])
+
+    jobs = []
+    for instrument, history in histories.items():
+        print(f'{instrument}: {np.sum(history["nights"]):.1f} nights')
+        print(history)
+        if plot is True and len(history) > 0:
+            jobs.append(history_job(history, instrument))
+    render_all(jobs, fmt=fmt, processes=processes)
+    return histories
+
+
 if __name__ == '__main__':
-#     main()
-    fix_csv()
\ No newline at end of file
+    ## create a parser object for understanding command-line arguments
+    p = argparse.ArgumentParser(description='''
+    Plot the number of nights per year an instrument was scheduled from its
+    history CSV file (with Date and Instrument columns).
+    ''')
+    ## add flags
+    p.add_argument("--split", dest="split",
+        default=False, action="store_true",
+        help="Count shared nights (e.g. HIRES/LRIS) as a fraction of a night.")
+    p.add_argument("--noplot", dest="noplot",
+        default=False, action="store_true",
+        help="Do not make plots.")
+    ## add options
+    p.add_argument("-i", "--instruments", dest="instruments", type=str,
+        nargs='+',
+        help="Instruments to count from the Instrument column of all files.")
+    p.add_argument("--fix", dest="fix", type=str,
+        help="Write a copy of the (single) input file with the encoding repaired.")
+    p.add_argument("--format", dest="format", type=str,
+        default='png', choices=['png', 'svg', 'pdf', 'data'],
+        help="Output format of the plots (data writes the plotted data as JSON)")
+    p.add_argument("-j", "--processes", dest="processes", type=int,
+        default=1,
+        help="Number of processes used to render the plots")
+    ## add arguments
+    p.add_argument('files', nargs='*', default=['HIRES_history.csv'],
+                   help="History CSV files")
+    args = p.parse_args()
+
+    if args.fix is not None:
+        fix_csv(args.files[0], args.fix)
+    else:
+        main(history_files=args.files, instruments=args.instruments,
+             split=args.split, plot=not args.noplot, fmt=args.format,
+             processes=args.processes)
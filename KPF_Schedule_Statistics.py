@@ -1,13 +1,14 @@
 ## Import General Tools
 import sys
 import copy
+import argparse
 from pathlib import Path
 import datetime
 from astropy.table import Table
 import numpy as np
-from matplotlib import pyplot as plt
 
 from utils.observatoryAPIs import *
+from utils.reporting import pyplot, render
 
 
 def get_instrument_frac_from_schedule_entry(sched, instrument='KPF'):
@@ -37,7 +38,35 @@ def get_instrument_frac_from_schedule_entry(sched, instrument='KPF'):
     return result
 
 
-def kpf_use_by_partner():
+def plot_use_by_semester(data):
+    '''Bar chart of the fraction of science time scheduled for KPF, KPF-CC
+    and KCWI by semester.
+    '''
+    plt = pyplot()
+    snames = data['semesters']
+    plt.figure(figsize=(10,4))
+
+    plt.title('Scheduled Science Time')
+    width = 0.42
+    xind = np.arange(0,len(snames))
+    plt.bar(xind+width/2, data['KCWI'],   color='g', alpha=0.9, width=width, label='KCWI')
+    plt.bar(xind-width/2, data['KPF'],    color='b', alpha=0.9, width=width, label='KPF', bottom=0)
+    plt.bar(xind-width/2, data['KPF-CC'], color='c', alpha=0.9, width=width, label='KPF-CC', bottom=data['KPF'])
+
+#     plt.plot(snames, data['KCWI'], 'go-', alpha=1, label='KCWI')
+#     plt.plot(snames, data['KPF'], 'cx-', alpha=0.5, label='KPF')
+#     plt.plot(snames, data['KPF-CC'], 'yx-', alpha=1, label='KPF-CC')
+#     plt.plot(snames, data['All KPF'], 'bo-', label='All KPF')
+
+    plt.xticks(xind, snames)
+    plt.xlabel('Semester')
+    plt.ylabel('Fraction of Nights')
+    plt.ylim(0, 0.47)
+    plt.grid(axis='y')
+    plt.legend(loc='best')
+
+
+def kpf_use_by_partner(fmt='png'):
     initial_semester_data = {'KPF': 0, 'KPF-CC': 0, 'All': 0,
                              'KCWI': 0, 'All_K2': 0}
     semesters = {'2023A': copy.deepcopy(initial_semester_data),
@@ -111,30 +140,10 @@ def kpf_use_by_partner():
     fkpfcc = [semesters[s]['KPF-CC']/semesters[s]['All'] for s in snames]
     fallkpf = [(semesters[s]['KPF']+semesters[s]['KPF-CC'])/semesters[s]['All'] for s in snames]
     fkcwi = [semesters[s]['KCWI']/semesters[s]['All_K2'] for s in snames]
-    plt.figure(figsize=(10,4))
-
-    plt.title('Scheduled Science Time')
-    width = 0.42
-    xind = np.arange(0,len(snames))
-    bottom = np.zeros(len(snames))
-    plt.bar(xind+width/2, fkcwi,  color='g', alpha=0.9, width=width, label='KCWI')
-    plt.bar(xind-width/2, fkpf,   color='b', alpha=0.9, width=width, label='KPF', bottom=0)
-    plt.bar(xind-width/2, fkpfcc, color='c', alpha=0.9, width=width, label='KPF-CC', bottom=fkpf)
-
-#     plt.plot(snames, fkcwi, 'go-', alpha=1, label='KCWI')
-#     plt.plot(snames, fkpf, 'cx-', alpha=0.5, label='KPF')
-#     plt.plot(snames, fkpfcc, 'yx-', alpha=1, label='KPF-CC')
-#     plt.plot(snames, fallkpf, 'bo-', label='All KPF')
-
-    plt.xticks(xind, snames)
-    plt.xlabel('Semester')
-    plt.ylabel('Fraction of Nights')
-    plt.ylim(0, 0.47)
-    plt.grid(axis='y')
-    plt.legend(loc='best')
-
-#     plt.show()
-    plt.savefig('KPF_Use_By_Semester.png', bbox_inches='tight', pad_inches=0.10)
+    data = {'semesters': snames, 'KPF': fkpf, 'KPF-CC': fkpfcc,
+            'All KPF': fallkpf, 'KCWI': fkcwi}
+    render(plot_use_by_semester, data, 'KPF_Use_By_Semester.png', fmt=fmt,
+           bbox_inches='tight', pad_inches=0.10)
 
     # Summarize KPF Use by Institution
     institutional_totals = {}
@@ -170,7 +179,26 @@ def kpf_use_by_partner():
 
 
 
-def old_kpf_nights_vs_kcwi():
+def plot_nights_vs_kcwi(t):
+    '''Fraction of nights assigned to KPF, KPF-CC and KCWI by semester.
+    '''
+    plt = pyplot()
+    plt.figure(figsize=(10,4))
+
+    plt.title('Assigned Time (Science+Engineering)')
+    nnights = t['semester_length'] - t['shutdown']
+    plt.plot(t['semester'], t['KCWI']/nnights, 'go-', alpha=1, label='KCWI')
+    plt.plot(t['semester'], t['KPF']/nnights, 'cx-', alpha=0.5, label='KPF')
+    plt.plot(t['semester'], t['KPF-CC']/nnights, 'yx-', alpha=1, label='KPF-CC')
+    plt.plot(t['semester'], (t['KPF']+t['KPF-CC'])/nnights, 'bo-', label='All KPF')
+    plt.xlabel('Semester')
+    plt.ylabel('Fraction of Nights')
+    plt.ylim(-0.01, 0.51)
+    plt.grid()
+    plt.legend(loc='best')
+
+
+def old_kpf_nights_vs_kcwi(fmt='png'):
     datafile = Path('KPF_Schedule_Statistics.txt')
     if datafile.exists():
         # Read the data from disk if present
@@ -271,24 +299,20 @@ def old_kpf_nights_vs_kcwi():
         t.write(datafile, format='ascii.csv')
 
     # Analysis
-    plt.figure(figsize=(10,4))
-
-    plt.title('Assigned Time (Science+Engineering)')
-    nnights = t['semester_length'] - t['shutdown']
-    plt.plot(t['semester'], t['KCWI']/nnights, 'go-', alpha=1, label='KCWI')
-    plt.plot(t['semester'], t['KPF']/nnights, 'cx-', alpha=0.5, label='KPF')
-    plt.plot(t['semester'], t['KPF-CC']/nnights, 'yx-', alpha=1, label='KPF-CC')
-    plt.plot(t['semester'], (t['KPF']+t['KPF-CC'])/nnights, 'bo-', label='All KPF')
-    plt.xlabel('Semester')
-    plt.ylabel('Fraction of Nights')
-    plt.ylim(-0.01, 0.51)
-    plt.grid()
-    plt.legend(loc='best')
+    render(plot_nights_vs_kcwi, t, 'KPF_Schedule_Statistics.png', fmt=fmt,
+           bbox_inches='tight', pad_inches=0.10)
 
-#     plt.show()
-    plt.savefig('KPF_Schedule_Statistics.png', bbox_inches='tight', pad_inches=0.10)
-    
 
 if __name__ == '__main__':
+    ## create a parser object for understanding command-line arguments
+    p = argparse.ArgumentParser(description='''
+    KPF use by partner and semester from the telescope schedule.
+    ''')
+    ## add options
+    p.add_argument("--format", dest="format", type=str,
+        default='png', choices=['png', 'svg', 'pdf', 'data'],
+        help="Output format of the plot (data writes the plotted data as JSON)")
+    args = p.parse_args()
+
 #     kpf_nights_vs_kcwi()
-    kpf_use_by_partner()
\ No newline at end of file
+    kpf_use_by_partner(fmt=args.format)
\ No newline at end of file
@@ -0,0 +1,58 @@
+#!/usr/env/python
+
+## Import General Tools
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+
+##-------------------------------------------------------------------------
+## CoverageIndex
+##-------------------------------------------------------------------------
+class CoverageIndex(object):
+    '''Time ranges covered by the log files analyzed so far.
+
+    Ranges are closed intervals stored as two sorted lists of datetime64
+    values.  Overlapping or touching ranges are merged when added, so the
+    lists never overlap and a lookup is a single bisect.
+    '''
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, start, end):
+        start, end = np.datetime64(start, 's'), np.datetime64(end, 's')
+        # Indices of the existing ranges which overlap or touch [start, end]
+        i = bisect_left(self.ends, start)
+        j = bisect_right(self.starts, end)
+        if i < j:
+            start = min(start, self.starts[i])
+            end = max(end, self.ends[j-1])
+        self.starts[i:j] = [start]
+        self.ends[i:j] = [end]
+
+    def overlapping(self, start, end):
+        '''Return the covered parts of [start, end] as a list of (start, end)
+        tuples.
+        '''
+        start, end = np.datetime64(start, 's'), np.datetime64(end, 's')
+        i = bisect_left(self.ends, start)
+        j = bisect_right(self.starts, end)
+        return [(max(start, self.starts[k]), min(end, self.ends[k]))
+                for k in range(i, j)]
+
+    def contains(self, times):
+        '''Vectorized test of whether each of an array of times is covered.
+        '''
+        times = np.asarray(times, dtype='datetime64[s]')
+        if len(self.starts) == 0:
+            return np.zeros(times.shape, dtype=bool)
+        starts = np.array(self.starts, dtype='datetime64[s]')
+        ends = np.array(self.ends, dtype='datetime64[s]')
+        k = np.searchsorted(starts, times, side='right') - 1
+        covered = k >= 0
+        covered[covered] = times[covered] <= ends[k[covered]]
+        return covered
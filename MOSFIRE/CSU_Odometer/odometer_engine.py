@@ -0,0 +1,269 @@
+#!/usr/env/python
+
+## Import General Tools
+import os
+import re
+import json
+from datetime import datetime as dt
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from coverage_index import CoverageIndex
+
+nbars = 92
+live_log_file = '/s/sdata1300/syslogs/CSU.log'
+
+## Syslog style lines:
+##   Jan 12 10:11:12 host CSU: ... Record=<01,status,123.456,...
+## Position is the third comma separated field of the line.
+precord = re.compile(rb'^(\w+)\s+(\d+)\s+(\d+):(\d+):(\d+).*?Record=<(\d\d),[^,\n]*,([^,\n]*)',
+                     re.MULTILINE)
+months = {b'Jan': 1, b'Feb': 2, b'Mar': 3, b'Apr': 4, b'May': 5, b'Jun': 6,
+          b'Jul': 7, b'Aug': 8, b'Sep': 9, b'Oct': 10, b'Nov': 11, b'Dec': 12}
+
+
+##-------------------------------------------------------------------------
+## Read records
+##-------------------------------------------------------------------------
+def read_chunks(log_file, chunk_size=16*1024*1024):
+    '''Yield blocks of complete lines from the log file without reading the
+    whole file in to memory.
+    '''
+    remainder = b''
+    with open(log_file, 'rb') as FO:
+        while True:
+            chunk = FO.read(chunk_size)
+            if not chunk:
+                break
+            chunk = remainder + chunk
+            last_newline = chunk.rfind(b'\n')
+            if last_newline < 0:
+                remainder = chunk
+                continue
+            remainder = chunk[last_newline+1:]
+            yield chunk[:last_newline+1]
+    if remainder:
+        yield remainder
+
+
+def get_log_year(log_file):
+    '''The log files do not record the year.  Archived logs are in folders
+    named by date (YYYYMMDD), the live log is assumed to end this year.
+    '''
+    folder = os.path.split(os.path.split(log_file)[0])[1]
+    try:
+        return dt.strptime(folder, '%Y%m%d').year
+    except ValueError:
+        return dt.utcnow().year
+
+
+def scan_log(log_file, chunk_size=16*1024*1024):
+    '''Extract the (time, bar, position) records from a CSU.log file in to
+    numpy arrays.  Time is returned as datetime64[s].
+    '''
+    fields = [[] for i in range(7)]
+    nskipped = 0
+    for chunk in read_chunks(log_file, chunk_size=chunk_size):
+        matches = precord.findall(chunk)
+        nskipped += chunk.count(b'Record=<') - len(matches)
+        if len(matches) > 0:
+            for i,field in enumerate(zip(*matches)):
+                fields[i].extend(field)
+    if nskipped > 0:
+        print(f'  Skipped {nskipped} unparseable records in {log_file}')
+
+    month = np.array([months.get(m, 0) for m in fields[0]], dtype=np.int64)
+    day = np.array(fields[1], dtype=np.int64)
+    seconds = (np.array(fields[2], dtype=np.int64)*3600
+               + np.array(fields[3], dtype=np.int64)*60
+               + np.array(fields[4], dtype=np.int64))
+    bar = np.array(fields[5], dtype=np.int64)
+    position = np.array(fields[6], dtype=np.float64)
+    valid = (bar >= 1) & (bar <= nbars) & (month > 0)
+    month, day, seconds = month[valid], day[valid], seconds[valid]
+    bar, position = bar[valid], position[valid]
+
+    # Assign years: the year increments each time the month goes backwards
+    # and the file ends in the year given by get_log_year
+    year_iteration = np.zeros(len(month), dtype=np.int64)
+    if len(month) > 1:
+        year_iteration[1:] = np.cumsum(month[1:] < month[:-1])
+    year = get_log_year(log_file) - year_iteration[-1:] + year_iteration
+
+    time = ((year-1970)*12 + month-1).astype('datetime64[M]').astype('datetime64[D]')
+    time = time + (day-1).astype('timedelta64[D]')
+    time = time.astype('datetime64[s]') + seconds.astype('timedelta64[s]')
+
+    return {'time': time, 'bar': bar, 'position': position}
+
+
+##-------------------------------------------------------------------------
+## Odometer
+##-------------------------------------------------------------------------
+def bar_moves(records):
+    '''For each record determine whether it represents a move of the bar and
+    how far the bar moved.  A bar's first record in a file (or a previous
+    position of 0) does not count as a move.
+    '''
+    bar = records['bar']
+    position = records['position']
+    order = np.argsort(bar, kind='stable')
+    sorted_bar = bar[order]
+    sorted_pos = position[order]
+    last_pos = np.zeros(len(sorted_pos), dtype=np.float64)
+    last_pos[1:] = sorted_pos[:-1]
+    first = np.ones(len(sorted_bar), dtype=bool)
+    first[1:] = sorted_bar[1:] != sorted_bar[:-1]
+    last_pos[first] = 0
+    delta = np.abs(last_pos - sorted_pos)
+    moved = (last_pos != 0) & (delta > 0)
+
+    distance = np.zeros(len(bar), dtype=np.float64)
+    distance[order] = np.where(moved, delta, 0)
+    is_move = np.zeros(len(bar), dtype=bool)
+    is_move[order] = moved
+    return is_move, distance
+
+
+def odometer(records, exclude=None):
+    '''Return the number of moves and the mileage for each bar.  Moves which
+    occur in a time range covered by the CoverageIndex given as exclude are
+    not counted.
+    '''
+    is_move, distance = bar_moves(records)
+    if exclude is not None:
+        is_move &= ~exclude.contains(records['time'])
+    bar = records['bar'][is_move]
+    nmoves = np.bincount(bar-1, minlength=nbars)
+    mileage = np.bincount(bar-1, weights=distance[is_move], minlength=nbars)
+    return nmoves.astype(np.int64), mileage
+
+
+def process_log(log_file, exclude=None):
+    '''Scan a single log file and return the odometer result in the same
+    form as is saved to the odometer.json cache.
+    '''
+    print(f'Reading {log_file}')
+    records = scan_log(log_file)
+    if len(records['time']) == 0:
+        print(f'  Unable to read {log_file}')
+        return None
+    print(f'  Analyzed {len(records["time"]):,} records')
+    nmoves, mileage = odometer(records, exclude=exclude)
+    file_start = records['time'][0].astype(dt)
+    file_end = records['time'][-1].astype(dt)
+    result = {'odometer': mileage.tolist(), 'nmoves': nmoves.tolist(),
+              'dates': [file_start.isoformat(timespec='seconds'),
+                        file_end.isoformat(timespec='seconds')]}
+    return result
+
+
+##-------------------------------------------------------------------------
+## Per directory cache
+##-------------------------------------------------------------------------
+def cache_file(log_file):
+    return os.path.join(os.path.split(log_file)[0], 'odometer.json')
+
+
+def read_cache(log_file):
+    if not os.path.exists(cache_file(log_file)):
+        return None
+    print(f"Loading results from {cache_file(log_file)}")
+    with open(cache_file(log_file), 'r') as FO:
+        result = json.load(FO)
+    return result
+
+
+def write_cache(log_file, result):
+    if log_file == live_log_file:
+        return
+    with open(cache_file(log_file), 'w') as FO:
+        json.dump(result, FO)
+
+
+##-------------------------------------------------------------------------
+## analyze_log_files
+##-------------------------------------------------------------------------
+def analyze_log_files(log_files, nprocesses=None):
+    '''Get the odometer result for each log file, reading from the cache
+    where possible and scanning the remaining files in a process pool.
+    Returns a dict of results keyed by log file, in the order given.
+    '''
+    results = {}
+    for log_file in log_files:
+        results[log_file] = read_cache(log_file)
+
+    to_scan = [log_file for log_file in log_files if results[log_file] is None]
+    if len(to_scan) > 0:
+        with ProcessPoolExecutor(max_workers=nprocesses) as executor:
+            for log_file, result in zip(to_scan, executor.map(process_log, to_scan)):
+                results[log_file] = result
+                if result is not None:
+                    write_cache(log_file, result)
+
+    results = {log_file: results[log_file] for log_file in log_files
+               if results[log_file] is not None}
+    return resolve_overlaps(results, nprocesses=nprocesses)
+
+
+##-------------------------------------------------------------------------
+## resolve_overlaps
+##-------------------------------------------------------------------------
+def exclude_key(exclude):
+    '''Key of the trimmed result of a log file in its cache: the time ranges
+    of the CoverageIndex of excluded moves.
+    '''
+    return ','.join(f'{start}/{end}' for start,end in zip(exclude.starts, exclude.ends))
+
+
+def resolve_overlaps(results, nprocesses=None):
+    '''Log files are taken in order and each time range is credited to the
+    first file which covers it.  Any file which overlaps the coverage of
+    earlier files is rescanned with the moves in the overlapping time
+    ranges removed so that each bar move is counted exactly once.  The
+    trimmed result is added to the cache next to the untrimmed one, keyed
+    by the excluded time ranges, so a file is only rescanned when the
+    ranges change.
+    '''
+    coverage = CoverageIndex()
+    to_trim = {}
+    for log_file, result in results.items():
+        file_start, file_end = result['dates']
+        overlaps = coverage.overlapping(file_start, file_end)
+        if len(overlaps) > 0:
+            print(f'WARNING: {log_file} overlaps earlier log files, trimming')
+            for overlap in overlaps:
+                print(f'  {overlap[0]} to {overlap[1]}')
+            to_trim[log_file] = CoverageIndex()
+            for overlap in overlaps:
+                to_trim[log_file].add(*overlap)
+        coverage.add(file_start, file_end)
+
+    trimmed = {}
+    for log_file, exclude in to_trim.items():
+        cached = results[log_file].get('trimmed', {}).get(exclude_key(exclude), None)
+        if cached is not None:
+            trimmed[log_file] = cached
+
+    trim_files = [log_file for log_file in to_trim if log_file not in trimmed]
+    if len(trim_files) > 0:
+        excludes = [to_trim[log_file] for log_file in trim_files]
+        with ProcessPoolExecutor(max_workers=nprocesses) as executor:
+            for log_file, result in zip(trim_files,
+                                        executor.map(process_log, trim_files, excludes)):
+                if result is not None:
+                    trimmed[log_file] = {'odometer': result['odometer'],
+                                         'nmoves': result['nmoves']}
+                    untrimmed = results[log_file]
+                    key = exclude_key(to_trim[log_file])
+                    untrimmed.setdefault('trimmed', {})[key] = trimmed[log_file]
+                    write_cache(log_file, untrimmed)
+
+    resolved = {}
+    for log_file, result in results.items():
+        result = {k: v for k,v in result.items() if k != 'trimmed'}
+        if log_file in trimmed:
+            result.update(trimmed[log_file])
+        resolved[log_file] = result
+    return resolved
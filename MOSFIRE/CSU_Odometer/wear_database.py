@@ -0,0 +1,197 @@
+#!/usr/env/python
+
+## Import General Tools
+import os
+import argparse
+import json
+from glob import glob
+
+import numpy as np
+
+from odometer_engine import scan_log, bar_moves, nbars, live_log_file
+from coverage_index import CoverageIndex
+
+
+##-------------------------------------------------------------------------
+## WearDatabase
+##-------------------------------------------------------------------------
+class WearDatabase(object):
+    '''Daily per bar move counts and mileage for the CSU.
+
+    The data are two (ndays, 92) arrays indexed by day since first_day and
+    bar number - 1, saved in a single compressed npz file along with the
+    time ranges and log files which have already been ingested.  Adding a
+    log file (or re-reading the growing live log) only counts moves outside
+    of the time ranges already in the database.
+    '''
+    def __init__(self, filename='CSU_wear.npz'):
+        self.filename = filename
+        self.first_day = None
+        self.nmoves = np.zeros((0, nbars), dtype=np.int32)
+        self.mileage = np.zeros((0, nbars), dtype=np.float64)
+        self.coverage = CoverageIndex()
+        self.files = {}
+        if os.path.exists(filename):
+            self.load()
+
+    def load(self):
+        with np.load(self.filename) as data:
+            self.first_day = data['first_day'][0] if len(data['first_day']) > 0 else None
+            self.nmoves = data['nmoves']
+            self.mileage = data['mileage']
+            for start, end in zip(data['coverage_start'], data['coverage_end']):
+                self.coverage.add(start, end)
+            self.files = json.loads(str(data['files']))
+
+    def save(self):
+        first_day = np.array([] if self.first_day is None else [self.first_day],
+                             dtype='datetime64[D]')
+        np.savez_compressed(self.filename,
+                            first_day=first_day,
+                            nmoves=self.nmoves,
+                            mileage=self.mileage,
+                            coverage_start=np.array(self.coverage.starts, dtype='datetime64[s]'),
+                            coverage_end=np.array(self.coverage.ends, dtype='datetime64[s]'),
+                            files=np.array(json.dumps(self.files)))
+
+    @property
+    def days(self):
+        if self.first_day is None:
+            return np.array([], dtype='datetime64[D]')
+        return self.first_day + np.arange(len(self.nmoves))
+
+    ##---------------------------------------------------------------------
+    ## Building
+    ##---------------------------------------------------------------------
+    def extend(self, first_day, last_day):
+        '''Grow the arrays so that they cover first_day through last_day.
+        '''
+        if self.first_day is None:
+            self.first_day = first_day
+        npre = max(int((self.first_day - first_day).astype(int)), 0)
+        new_first_day = self.first_day - npre
+        ndays = max(len(self.nmoves) + npre,
+                    int((last_day - new_first_day).astype(int)) + 1)
+        npost = ndays - len(self.nmoves) - npre
+        if npre > 0 or npost > 0:
+            self.nmoves = np.pad(self.nmoves, ((npre, npost), (0, 0)))
+            self.mileage = np.pad(self.mileage, ((npre, npost), (0, 0)))
+            self.first_day = new_first_day
+
+    def ingest(self, log_file):
+        '''Add the moves in a log file which are not already in the database.
+        Log files should be ingested in chronological order, as for the
+        odometer.  Returns the number of moves added.
+        '''
+        stat = os.stat(log_file)
+        signature = [stat.st_size, stat.st_mtime]
+        if self.files.get(log_file, None) == signature:
+            return 0
+
+        print(f'Reading {log_file}')
+        records = scan_log(log_file)
+        if len(records['time']) == 0:
+            print(f'  Unable to read {log_file}')
+            return 0
+        is_move, distance = bar_moves(records)
+        is_move &= ~self.coverage.contains(records['time'])
+
+        day = records['time'][is_move].astype('datetime64[D]')
+        if len(day) > 0:
+            self.extend(day.min(), day.max())
+            index = (day - self.first_day).astype(int)*nbars + records['bar'][is_move] - 1
+            size = self.nmoves.size
+            self.nmoves += np.bincount(index, minlength=size).reshape(self.nmoves.shape).astype(np.int32)
+            self.mileage += np.bincount(index, weights=distance[is_move],
+                                        minlength=size).reshape(self.mileage.shape)
+
+        self.coverage.add(records['time'][0], records['time'][-1])
+        self.files[log_file] = signature
+        print(f'  Added {len(day):,} moves')
+        return len(day)
+
+    ##---------------------------------------------------------------------
+    ## Queries
+    ##---------------------------------------------------------------------
+    def window(self, start=None, end=None):
+        '''Return the slice of days in [start, end] (inclusive dates).
+        '''
+        if self.first_day is None:
+            return slice(0, 0)
+        i = 0 if start is None else int((np.datetime64(start, 'D') - self.first_day).astype(int))
+        j = len(self.nmoves) if end is None\
+            else int((np.datetime64(end, 'D') - self.first_day).astype(int)) + 1
+        return slice(min(max(i, 0), len(self.nmoves)), min(max(j, 0), len(self.nmoves)))
+
+    def wear(self, start=None, end=None):
+        '''Number of moves and mileage (mm) per bar over a time window.
+        '''
+        w = self.window(start, end)
+        return self.nmoves[w].sum(axis=0), self.mileage[w].sum(axis=0)
+
+    def slit_asymmetry(self, start=None, end=None, key='mileage'):
+        '''Compare the wear of the left (odd) and right (even) bar of each
+        slit.  Returns the left and right wear and the fractional asymmetry
+        (left-right)/(left+right) for slits 1-46.
+        '''
+        nmoves, mileage = self.wear(start, end)
+        values = {'nmoves': nmoves, 'mileage': mileage}[key].astype(np.float64)
+        left = values[0::2]
+        right = values[1::2]
+        total = left + right
+        asymmetry = np.zeros(len(total))
+        w = total > 0
+        asymmetry[w] = (left[w] - right[w])/total[w]
+        return left, right, asymmetry
+
+    def top_worn(self, n=10, start=None, end=None, key='mileage'):
+        '''Return the n most worn bars as a list of (bar, nmoves, mileage).
+        '''
+        nmoves, mileage = self.wear(start, end)
+        values = {'nmoves': nmoves, 'mileage': mileage}[key]
+        order = np.argsort(values)[::-1][:n]
+        return [(int(i+1), int(nmoves[i]), float(mileage[i])) for i in order]
+
+
+if __name__ == '__main__':
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    p = argparse.ArgumentParser(description='''
+    Build and query a database of daily CSU bar moves and mileage.
+    ''')
+    ## add flags
+    p.add_argument("-u", "--update", dest="update",
+        default=False, action="store_true",
+        help="Ingest new CSU log files before querying.")
+    ## add options
+    p.add_argument("--db", dest="db", type=str,
+        default='CSU_wear.npz',
+        help="Database file.")
+    p.add_argument("-f", "--from", dest="fromdate", type=str,
+        help="Start date of query (YYYY-MM-DD).")
+    p.add_argument("-t", "--to", dest="todate", type=str,
+        help="End date of query (YYYY-MM-DD).")
+    p.add_argument("-n", "--top", dest="top", type=int,
+        default=10,
+        help="Number of most worn bars to list.")
+    args = p.parse_args()
+
+    db = WearDatabase(args.db)
+    if args.update is True:
+        log_files = sorted(glob('/h/instrlogs/mosfire/*/CSU.log*'))
+        log_files.append(live_log_file)
+        for log_file in log_files:
+            if os.path.exists(log_file):
+                db.ingest(log_file)
+        db.save()
+
+    print(f'Most worn bars from {args.fromdate} to {args.todate}:')
+    for bar, nmoves, mileage in db.top_worn(args.top, args.fromdate, args.todate):
+        print(f'  Bar {bar:02d}: {nmoves:8d} moves {mileage/1000:8.2f} m')
+
+    left, right, asymmetry = db.slit_asymmetry(args.fromdate, args.todate)
+    print('Slit left/right mileage asymmetry:')
+    for i,a in enumerate(asymmetry):
+        print(f'  Slit {i+1:02d}: {left[i]/1000:8.2f} m {right[i]/1000:8.2f} m {a:+.3f}')
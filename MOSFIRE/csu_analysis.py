@@ -0,0 +1,361 @@
+#!python3
+
+## Import General Tools
+import sys
+import json
+from pathlib import Path
+
+import numpy as np
+from astropy.table import Table, Column
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from utils.reporting import pyplot, render_all
+
+
+##-------------------------------------------------------------------------
+## Analysis Configuration
+##-------------------------------------------------------------------------
+## Rotator positions were not recorded reliably before this row of the
+## history table, so the rotator analysis starts here.
+ROTPOSN_START_ROW = 21028
+
+nbars_bins = np.arange(0,92,1)
+rotposn_bins = np.arange(-450,360,10)
+accel_bins = np.arange(0,10000,100)
+bad_rotposn_ranges = [(170, 190), (-10, 10), (-190, -170), (-370, -350)]
+
+
+##-------------------------------------------------------------------------
+## label_failed_moves
+##-------------------------------------------------------------------------
+def label_failed_moves(history_table):
+    '''A move has failed if the entry which follows it is an Error.  Returns
+    a boolean array with one entry per row of the history table.
+    '''
+    status = np.asarray(history_table['status']).astype(str)
+    next_status = np.roll(status, -1)
+    move_failed = (status == 'Moving') & (next_status == 'Error')
+    return move_failed
+
+
+##-------------------------------------------------------------------------
+## preprocess_history
+##-------------------------------------------------------------------------
+def preprocess_history(history_table):
+    '''Build a table of only the moves in the history table with the columns
+    needed for analysis converted to numpy types once.
+    '''
+    status = np.asarray(history_table['status']).astype(str)
+    if 'MoveFailed' in history_table.colnames:
+        # Column is stored as text when read back from the fixed width file
+        failed = np.asarray(history_table['MoveFailed']).astype(str) == 'True'
+    else:
+        failed = label_failed_moves(history_table)
+
+    w = np.where(status == 'Moving')[0]
+    begin = np.asarray(history_table['begin']).astype('U19')[w]
+    moves = Table()
+    moves.add_column(Column(w, name='row'))
+    moves.add_column(Column(begin.astype('datetime64[s]'), name='time'))
+    moves.add_column(Column(failed[w], name='failed'))
+    for colname in ['nbars', 'ROTPOSN', 'xaccels', 'yaccels']:
+        moves.add_column(Column(np.asarray(history_table[colname])[w], name=colname))
+    return moves
+
+
+##-------------------------------------------------------------------------
+## Histogram helpers
+##-------------------------------------------------------------------------
+def split_histogram(values, failed, bins):
+    '''Histogram successful and failed moves on the same bins.
+    '''
+    n, bins = np.histogram(values[~failed], bins=bins)
+    nf, bins = np.histogram(values[failed], bins=bins)
+    return n, nf, bins
+
+
+def fail_rate(n, nf):
+    '''Percentage of failed moves per bin, zero where there were no
+    successful moves.
+    '''
+    total = n + nf
+    rate = np.zeros(len(n), dtype=np.float64)
+    w = n > 0
+    rate[w] = nf[w]/total[w]*100
+    return rate
+
+
+def value_statistics(values):
+    values = np.asarray(values, dtype=np.float64)
+    values = values[values >= 0] # -1 flags a missing accelerometer value
+    if len(values) == 0:
+        return {'n': 0, 'mean': None, 'median': None, 'std': None}
+    return {'n': int(len(values)),
+            'mean': float(np.mean(values)),
+            'median': float(np.median(values)),
+            'std': float(np.std(values)),
+            }
+
+
+##-------------------------------------------------------------------------
+## analyze_history
+##-------------------------------------------------------------------------
+def analyze_history(history_table, rot_start=ROTPOSN_START_ROW):
+    '''Compute all statistics used by the plots in a single pass over the
+    preprocessed table of moves.
+    '''
+    moves = preprocess_history(history_table)
+    failed = np.asarray(moves['failed'])
+    time = np.asarray(moves['time'])
+
+    stats = {'moves': moves}
+
+    # Per month fail rate
+    months = time.astype('datetime64[M]')
+    if len(months) > 0:
+        month_bins = np.arange(months.min(), months.max()+2)
+        month_index = (months - months.min()).astype(int)
+    else:
+        month_bins = np.array([], dtype='datetime64[M]')
+        month_index = np.array([], dtype=int)
+    nmonths = max(len(month_bins)-1, 0)
+    n = np.bincount(month_index[~failed], minlength=nmonths)
+    nf = np.bincount(month_index[failed], minlength=nmonths)
+    stats['month'] = {'bins': month_bins, 'n': n, 'nf': nf, 'rate': fail_rate(n, nf)}
+
+    # Number of bars
+    n, nf, bins = split_histogram(np.asarray(moves['nbars']), failed, nbars_bins)
+    stats['nbars'] = {'bins': bins, 'n': n, 'nf': nf, 'rate': fail_rate(n, nf)}
+
+    # Rotator angle
+    rot = np.asarray(moves['row']) >= rot_start
+    n, nf, bins = split_histogram(np.asarray(moves['ROTPOSN'])[rot], failed[rot],
+                                  rotposn_bins)
+    stats['ROTPOSN'] = {'bins': bins, 'n': n, 'nf': nf, 'rate': fail_rate(n, nf),
+                        'mask': rot}
+
+    # Accelerometers
+    for accel in ['xaccels', 'yaccels']:
+        values = np.asarray(moves[accel])
+        n, nf, bins = split_histogram(values, failed, accel_bins)
+        stats[accel] = {'bins': bins, 'n': n, 'nf': nf,
+                        'successful': value_statistics(values[~failed]),
+                        'failed': value_statistics(values[failed]),
+                        }
+    return stats
+
+
+def summarize(stats):
+    '''Convert the result of analyze_history to a JSON serializable dict.
+    '''
+    failed = np.asarray(stats['moves']['failed'])
+    summary = {'n moves': int(len(failed)),
+               'n failed moves': int(np.sum(failed)),
+               'fail rate (%)': float(np.sum(failed)/len(failed)*100) if len(failed) > 0 else 0.,
+               'month': {'month': [str(m) for m in stats['month']['bins'][:-1]],
+                         'n': stats['month']['n'].tolist(),
+                         'nf': stats['month']['nf'].tolist(),
+                         'rate': stats['month']['rate'].tolist()},
+               }
+    for key in ['nbars', 'ROTPOSN']:
+        summary[key] = {'bins': stats[key]['bins'].tolist(),
+                        'n': stats[key]['n'].tolist(),
+                        'nf': stats[key]['nf'].tolist(),
+                        'rate': stats[key]['rate'].tolist()}
+    for key in ['xaccels', 'yaccels']:
+        summary[key] = {'successful': stats[key]['successful'],
+                        'failed': stats[key]['failed']}
+    return summary
+
+
+def figure_data(stats):
+    '''Split the result of analyze_history in to the data drawn by each
+    figure, so that each render job (and each --format data file) carries
+    only what its figure uses.
+    '''
+    moves = stats['moves']
+    failed = np.asarray(moves['failed'])
+    time = np.asarray(moves['time'])
+    counts = {'nsuccess': int(np.sum(~failed)), 'nfailed': int(np.sum(failed))}
+    histogram = lambda key: {k: stats[key][k] for k in ['bins', 'n', 'nf']}
+    rot = stats['ROTPOSN']['mask']
+    return {'nbars': dict(counts, histogram=histogram('nbars'), time=time,
+                          nbars=np.asarray(moves['nbars']), failed=failed),
+            'ROTPOSN': {'histogram': histogram('ROTPOSN'),
+                        'rate': stats['ROTPOSN']['rate'],
+                        'time': time[rot],
+                        'ROTPOSN': np.asarray(moves['ROTPOSN'])[rot],
+                        'failed': failed[rot]},
+            'accels': dict(counts, xaccels=histogram('xaccels'),
+                           yaccels=histogram('yaccels')),
+            'month': dict(counts, **stats['month']),
+            }
+
+
+##-------------------------------------------------------------------------
+## Plots
+##-------------------------------------------------------------------------
+def plot_split_histogram(ax, result, nsuccess, nfailed):
+    bins = result['bins']
+    widths = np.diff(bins)
+    ax.bar(bins[:-1], result['n'], width=widths, align='edge', color='g', alpha=0.4,
+           label=f'Successful Moves ({nsuccess})')
+    ax.bar(bins[:-1], result['nf'], width=widths, align='edge', color='r', alpha=0.1,
+           label=f'Failed Moves ({nfailed})')
+    ymax = max(max(result['n'], default=0)*1.1, 1)
+    ax.set_ylim(0, ymax)
+    ax.set_ylabel('N Successful Moves')
+    ax.legend(loc='best')
+
+    failed_ax = ax.twinx()
+    failed_ax.bar(bins[:-1], result['nf'], width=widths, align='edge', color='r',
+                  alpha=0.4)
+    failed_ax.set_ylim(0, ymax/50)
+    failed_ax.set_ylabel('N Failed Moves')
+    return failed_ax
+
+
+def plot_accel(data):
+    print('Plotting acceleration histograms')
+    plt = pyplot()
+    nsuccess, nfailed = data['nsuccess'], data['nfailed']
+
+    plt.figure(figsize=(12,12))
+    for i,accel in enumerate(['xaccels', 'yaccels']):
+        ax = plt.subplot(2,1,i+1)
+        if i == 0:
+            plt.title('Acceleration Values')
+        plot_split_histogram(ax, data[accel], nsuccess, nfailed)
+        ax.set_xlabel(accel[:-1])
+        ax.set_xlim(1000,9000)
+        ax.grid()
+
+
+def plot_nbars(data):
+    print('Plotting nbars in move')
+    plt = pyplot()
+    failed = data['failed']
+    time = data['time']
+    nbars = data['nbars']
+
+    plt.figure(figsize=(12,12))
+
+    ax = plt.subplot(2,1,1)
+    plt.title('Number of Bars Moving')
+    plot_split_histogram(ax, data['histogram'], data['nsuccess'], data['nfailed'])
+    ax.set_xlabel('Number of Bars')
+    ax.set_xlim(0,93)
+    ax.grid()
+
+    plt.subplot(2,1,2)
+    plt.title('Behavior over Time')
+    plt.plot(time[~failed], nbars[~failed], 'go',
+             alpha=0.2, mew=0, label=f'Successful Moves ({data["nsuccess"]})')
+    plt.plot(time[failed], nbars[failed], 'rv',
+             alpha=0.4, ms=10, label=f'Failed Moves ({data["nfailed"]})')
+    plt.xlabel('Time')
+    plt.ylabel('Number of Bars')
+    plt.ylim(-1,93)
+    plt.grid()
+    plt.legend(loc='best')
+
+
+def plot_rotposn(data):
+    print('Plotting rotator position in move')
+    plt = pyplot()
+    failed = data['failed']
+    time = data['time']
+    rotposn = data['ROTPOSN']
+
+    plt.figure(figsize=(12,12))
+
+    ax = plt.subplot(3,1,1)
+    plt.title('Rotator Angle')
+    failed_ax = plot_split_histogram(ax, data['histogram'], np.sum(~failed), np.sum(failed))
+    for r in bad_rotposn_ranges:
+        failed_ax.axvspan(r[0], r[1], color='r', alpha=0.1)
+    ax.set_xlabel('ROTPPOSN')
+    ax.set_xticks(np.arange(-450,390,30))
+    ax.grid()
+
+    plt.subplot(3,1,2)
+    bins = data['histogram']['bins']
+    plt.plot((bins[1:]+bins[:-1])/2, data['rate'], 'ro')
+    plt.xlabel('ROTPPOSN')
+    plt.xticks(np.arange(-450,390,30))
+    plt.ylabel('Failure Rate (%)')
+    plt.grid()
+
+    plt.subplot(3,1,3)
+    plt.plot(time[~failed], rotposn[~failed], 'go',
+             alpha=0.2, mew=0, label=f'Successful Moves ({np.sum(~failed)})')
+    plt.plot(time[failed], rotposn[failed], 'rv',
+             alpha=0.4, ms=10, label=f'Failed Moves ({np.sum(failed)})')
+    for r in bad_rotposn_ranges:
+        plt.axhspan(r[0], r[1], xmin=0, xmax=1, color='r', alpha=0.2)
+    plt.xlabel('Time')
+    plt.ylabel('ROTPOSN')
+    plt.yticks(np.arange(-450,390,90))
+    plt.grid()
+    plt.legend(loc='best')
+
+
+def plot_fail_rate(month):
+    print('Plotting failure rate vs. time')
+    plt = pyplot()
+    import matplotlib.dates as mdates
+    bins = month['bins'].astype('datetime64[D]')
+    widths = np.diff(bins).astype(int)
+
+    plt.figure(figsize=(12,12))
+    ax = plt.subplot(2,1,1)
+    ax.bar(bins[:-1], month['n'], width=widths, align='edge', color='g', alpha=0.4,
+           label=f'Successful Moves ({month["nsuccess"]})')
+    ax.bar(bins[:-1], month['nf'], width=widths, align='edge', color='r', alpha=0.1,
+           label=f'Failed Moves ({month["nfailed"]})')
+    ymax = max(max(month['n'], default=0)*1.1, 1)
+    ax.set_ylim(0, ymax)
+    ax.set_ylabel('N Successful Moves')
+    ax.legend(loc='best')
+    ax.xaxis.set_major_locator(mdates.MonthLocator(interval=6))
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
+    ax.set_xlabel('Time')
+    ax.grid()
+
+    failed_ax = ax.twinx()
+    failed_ax.bar(bins[:-1], month['nf'], width=widths, align='edge', color='r',
+                  alpha=0.4)
+    failed_ax.set_ylim(0, ymax/50)
+    failed_ax.set_ylabel('N Failed Moves')
+
+    ax = plt.subplot(2,1,2)
+    rate = np.append(month['rate'], month['rate'][-1:])
+    ax.plot(bins, rate, 'r-', drawstyle='steps-post')
+    ax.plot(bins, np.zeros(len(bins)), 'k-', drawstyle='steps-post', alpha=0.5)
+    ax.set_ylabel('Move Failure Rate (%)')
+    ax.xaxis.set_major_locator(mdates.MonthLocator(interval=6))
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
+    ax.set_xlabel('Time')
+    ax.grid()
+
+
+##-------------------------------------------------------------------------
+## report
+##-------------------------------------------------------------------------
+def report(history_table, summary_file=Path('csu_summary.json'), fmt='png',
+           processes=1):
+    '''Analyze the history table once and generate all plots and the JSON
+    summary from that result.  Each plot is given only the data it draws.
+    '''
+    stats = analyze_history(history_table)
+    data = figure_data(stats)
+    savefig_kwargs = {'bbox_inches': 'tight', 'pad_inches': 0.10}
+    render_all([(plot_nbars, data['nbars'], 'number_of_bars_moving.png', savefig_kwargs),
+                (plot_rotposn, data['ROTPOSN'], 'rotator_position.png', savefig_kwargs),
+                (plot_accel, data['accels'], 'acceleration_values.png', savefig_kwargs),
+                (plot_fail_rate, data['month'], 'failure_rate.png', savefig_kwargs),
+                ], fmt=fmt, processes=processes)
+    print(f'Writing summary: {summary_file}')
+    with open(summary_file, 'w') as FO:
+        json.dump(summarize(stats), FO, indent=2)
+    return stats
@@ -11,8 +11,7 @@ from astropy.table import Table, Column, Row
 import numpy as np
 import subprocess
 
-from matplotlib import pyplot as plt
-import matplotlib.dates as mdates
+from csu_analysis import label_failed_moves, report
 
 
 ##-------------------------------------------------------------------------
@@ -25,36 +24,149 @@ p = argparse.ArgumentParser(description='''
 p.add_argument("-n", "--nodcs", dest="nodcs",
     default=False, action="store_true",
     help="Do not query dcs keyword history for rotator position values")
+## add options
+p.add_argument("--format", dest="format", type=str,
+    default='png', choices=['png', 'svg', 'pdf', 'data'],
+    help="Output format of the plots (data writes the plotted data as JSON)")
+p.add_argument("-j", "--processes", dest="processes", type=int,
+    default=1,
+    help="Number of processes used to render the plots")
 args = p.parse_args()
 
 
 ##-------------------------------------------------------------------------
-## parse_eavesdrop_log
+## CSU state machine
+##-------------------------------------------------------------------------
+## Every CSU property change in the eavesdrop log looks like:
+##   <timestamp> [mosfire] DEBUG edu.ucla.astro.irlab.util.Property -
+##   Setting property <CSUStatus> to new value <Move completed...>
+## The property name is split in to a family and an (optional) bar number so
+## that per-bar properties (e.g. CSUBarStatus12) share a single table entry.
+## The value is the text up to the first ">" and is compared literally.
+match_str = (r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d+) \[mosfire\] DEBUG '
+             'edu.ucla.astro.irlab.util.Property - Setting property ')
+pproperty = re.compile(match_str+r'<(CSU[A-Za-z]+?)(\d*)> to new value <(.*?)>(.*)$')
+pstart_time = re.compile(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d+) \[')
+pnumber = re.compile(r'[\d\.]+$')
+
+CSU_STATES = ['Idle', 'Setup', 'Moving', 'Error', 'PowerDown', 'Initialize']
+not_error = [s for s in CSU_STATES if s != 'Error']
+
+## Transitions: (property, value, new state, action, states it applies from)
+## A value of None matches any non-empty value of that property.
+csu_transitions = [
+    ('CSUSetupMaskName', None, 'Setup', 'start_setup', not_error),
+    ('CSUStatus', 'Setup complete.', 'Idle', 'end_setup', not_error),
+    ('CSUStatus', 'Starting group move.', 'Moving', 'start_move', not_error),
+    ('CSUStatus', 'Move completed.  Ready for next move.', 'Idle', 'end_move', not_error),
+    ('CSUStatus', 'FATAL ERROR ', 'Error', 'fatal_error', CSU_STATES),
+    ('CSUStatus', 'Powering down CSU system', 'PowerDown', None, CSU_STATES),
+    ('CSUStatus', 'Bar initialization command sent.', 'Initialize', None, CSU_STATES),
+    ('CSUStatus', 'Initialization complete.', 'Idle', None, CSU_STATES),
+]
+
+## Lookup table keyed by (current state, property, value)
+TRANSITION_TABLE = {(state, prop, value): (new_state, action)
+                    for prop, value, new_state, action, from_states in csu_transitions
+                    for state in from_states}
+
+## Per bar properties which are counted while in a given state:
+## (current state, property): name of list in parser context
+BAR_COUNTERS = {('Setup', 'CSUBarTargetPosition'): 'setup_bars',
+                ('Moving', 'CSUBarStatus'): 'moving_bars',
+               }
+## Patterns of the bar number and value of a counted property change
+BAR_COUNTER_PATTERNS = {'CSUBarTargetPosition': (re.compile(r'\d\d$'), pnumber),
+                        'CSUBarStatus': (re.compile(r'\d+$'), re.compile('MOVING$')),
+                       }
+
+ACCEL_PROPERTIES = {'CSUXAccelerometer': 'xaccels',
+                    'CSUYAccelerometer': 'yaccels',
+                   }
+
+
+def parse_timestamp(timestamp):
+    return datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S,%f')
+
+
+def lookup_transition(state, prop, value):
+    '''Return the (new state, action) tuple for this property change or None
+    if the property change does not cause a transition from this state.
+    '''
+    transition = TRANSITION_TABLE.get((state, prop, value), None)
+    if transition is None and value != '':
+        transition = TRANSITION_TABLE.get((state, prop, None), None)
+    return transition
+
+
+def make_history_entry(status, transition_time):
+    duration = (transition_time-status[1]).total_seconds()
+    dcs1 = get_dcs_keywords(status[1])
+    dcs2 = get_dcs_keywords(transition_time)
+    history_entry = {'status': status[0],
+                     'begin': status[1],
+                     'end': transition_time,
+                     'duration (s)': duration,
+                     'xaccels': -1,
+                     'yaccels': -1,
+                     'accel age (s)': -1,
+                     'ROTPOSN': dcs1['ROTPOSN'],
+                     'ROTPOSN end': dcs2['ROTPOSN'],
+                     'bad': dcs1['bad'],
+                     'nbars': 0,
+                     }
+    return history_entry
+
+
+##-------------------------------------------------------------------------
+## Transition actions
 ##-------------------------------------------------------------------------
-def check_for_transition(line, status, pattern, new_state):
-    matched = pattern.match(line)
-    if matched is not None:
-        transition_time = datetime.strptime(matched.group(1), '%Y-%m-%d %H:%M:%S,%f')
-        duration = (transition_time-status[1]).total_seconds()
-        dcs1 = get_dcs_keywords(status[1])
-        dcs2 = get_dcs_keywords(transition_time)
-        history_entry = {'status': status[0],
-                         'begin': status[1],
-                         'end': transition_time,
-                         'duration (s)': duration,
-                         'xaccels': -1,
-                         'yaccels': -1,
-                         'accel age (s)': -1,
-                         'ROTPOSN': dcs1['ROTPOSN'],
-                         'ROTPOSN end': dcs2['ROTPOSN'],
-                         'bad': dcs1['bad'],
-                         'nbars': 0,
-                         }
-        return (new_state, transition_time), history_entry
+def start_setup(history_entry, context, status_history):
+    context['moving_bars'] = []
+
+
+def end_setup(history_entry, context, status_history):
+    history_entry['nbars'] = len(context['setup_bars'])
+    context['setup_bars'] = []
+
+
+def start_move(history_entry, context, status_history):
+    context['moving_bars'] = []
+
+
+def end_move(history_entry, context, status_history):
+    history_entry['nbars'] = len(context['moving_bars'])
+    context['moving_bars'] = []
+
+
+def fatal_error(history_entry, context, status_history):
+    # Check what previous state was
+    if len(status_history) > 1:
+        if status_history[-1]['duration (s)'] >= 120:
+            print(f'  {history_entry["begin"]}: Fatal Error after: {status_history[-1]["status"]} ({status_history[-1]["duration (s)"]} s)')
+        else:
+            print(f'  {history_entry["begin"]}: Fatal Error quickly after: {status_history[-1]["status"]} ({status_history[-1]["duration (s)"]} s)')
+            if len(status_history) > 2:
+                print(f'                      after: {status_history[-2]["status"]} ({status_history[-2]["duration (s)"]} s)')
     else:
-        return status, None
+        print(f'  {history_entry["begin"]}: Fatal Error')
+
+    if history_entry['status'] == 'Moving':
+        history_entry['nbars'] = len(context['moving_bars'])
+        context['moving_bars'] = []
+
 
+TRANSITION_ACTIONS = {'start_setup': start_setup,
+                      'end_setup': end_setup,
+                      'start_move': start_move,
+                      'end_move': end_move,
+                      'fatal_error': fatal_error,
+                     }
 
+
+##-------------------------------------------------------------------------
+## parse_eavesdrop_log
+##-------------------------------------------------------------------------
 def parse_eavesdrop_log(logfile):
 
 #     cmd = ['grep', 'CSU', f'{logfile}']
@@ -70,167 +182,63 @@ def parse_eavesdrop_log(logfile):
     except:
         print(f'  Failed to read {logfile}')
 
-    match_str = ('(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d+) \[mosfire\] DEBUG '
-                 'edu.ucla.astro.irlab.util.Property - Setting property ')
-
-    pxaccel = re.compile(match_str+'<CSUXAccelerometer> to new value <(\d+)>')
-    pyaccel = re.compile(match_str+'<CSUYAccelerometer> to new value <(\d+)>')
-
-    pstart_setup = re.compile(match_str+'<CSUSetupMaskName> to new value <(.+)>')
-    pbartarget = re.compile(match_str+'<CSUBarTargetPosition(\d\d)> to new value <([\d\.]+)>.')
-    pend_setup = re.compile(match_str+'<CSUStatus> to new value <Setup complete.>')
-
-    pstart_move = re.compile(match_str+'<CSUStatus> to new value <Starting group move.>')
-    pbarmoving = re.compile(match_str+'<CSUBarStatus(\d+)> to new value <MOVING>.')
-    pend_move = re.compile(match_str+'<CSUStatus> to new value <Move completed.  Ready for next move.>')
-    pfatal_error = re.compile(match_str+'<CSUStatus> to new value <FATAL ERROR >')
-    ppower_down = re.compile(match_str+'<CSUStatus> to new value <Powering down CSU system>')
-    pinitialize = re.compile(match_str+'<CSUStatus> to new value <Bar initialization command sent.>')
-    pinitialize_complete = re.compile(match_str+'<CSUStatus> to new value <Initialization complete.>')
-
     status_history = list()
-    xaccels = 0
-    yaccels = 0
-    moving_bars = []
-    setup_bars = []
+    context = {'moving_bars': [],
+               'setup_bars': [],
+               'xaccels': None,
+               'yaccels': None,
+               'xaccels time': None,
+               'yaccels time': None,
+              }
     status = (None, None)
-    xaccels = None
-    yaccels = None
     for line in lines:
 
         if status[0] is None:
-#             print(f'No Status: {line}')
-            mstart_time = re.match('(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d+) \[', line)
+            mstart_time = pstart_time.match(line)
             if mstart_time is not None:
-                start_time = datetime.strptime(mstart_time.group(1), '%Y-%m-%d %H:%M:%S,%f')
-#                 print(f'Found start time: {start_time}')
-                status = ('Idle', start_time)
+                status = ('Idle', parse_timestamp(mstart_time.group(1)))
             continue
 
-        if re.search('<CSU', line) is None:
-#             print(f'Skipping: {line}')
+        if '<CSU' not in line:
             continue
 
+        # Extract the property name and value once per line
+        matched = pproperty.match(line)
+        if matched is None:
+            continue
+        timestamp, prop, barno, value, tail = matched.groups()
+
         # Read Xaccel and Yaccel
-        mxaccel = pxaccel.match(line)
-        if mxaccel is not None:
-            xaccel_time = datetime.strptime(mxaccel.group(1), '%Y-%m-%d %H:%M:%S,%f')
-            xaccels = int(mxaccel.group(2))
-        myaccel = pyaccel.match(line)
-        if myaccel is not None:
-            yaccel_time = datetime.strptime(myaccel.group(1), '%Y-%m-%d %H:%M:%S,%f')
-            yaccels = int(myaccel.group(2))
-#             print(f'Accelerations ({status[0]}): {xaccels} {yaccels} ({yaccel_time.strftime("%Y-%m-%d %H:%M:%S")})')
-
-        # Check for Setup start
-        if status[0] != 'Error':
-            status, history_entry = check_for_transition(line, status, pstart_setup, 'Setup')
-            if history_entry is not None:
-                if xaccels is not None and yaccels is not None:
-                    history_entry['xaccels'] = xaccels
-                    history_entry['yaccels'] = yaccels
-                    history_entry['accel age (s)'] = (status[1] - min([xaccel_time, xaccel_time])).total_seconds()
-                status_history.append(history_entry)
-                moving_bars = []
-
-        # Check for new BarTarget
-        if status[0] is not None:
-            if status[0] == 'Setup':
-                matched = pbartarget.match(line)
-                if matched is not None:
-                    setup_bars.append(matched.group(2))
-
-        # Check for setup end
-        if status[0] != 'Error':
-            status, history_entry = check_for_transition(line, status, pend_setup, 'Idle')
-            if history_entry is not None:
-                history_entry['nbars'] = len(setup_bars)
-                setup_bars = []
-                if xaccels is not None and yaccels is not None:
-                    history_entry['xaccels'] = xaccels
-                    history_entry['yaccels'] = yaccels
-                    history_entry['accel age (s)'] = (status[1] - min([xaccel_time, xaccel_time])).total_seconds()
-                status_history.append(history_entry)
-
-        # Check for move start
-        if status[0] != 'Error':
-            status, history_entry = check_for_transition(line, status, pstart_move, 'Moving')
-            if history_entry is not None:
-                if xaccels is not None and yaccels is not None:
-                    history_entry['xaccels'] = xaccels
-                    history_entry['yaccels'] = yaccels
-                    history_entry['accel age (s)'] = (status[1] - min([xaccel_time, xaccel_time])).total_seconds()
-                status_history.append(history_entry)
-                moving_bars = []
-
-        # Count moving bars
-        if status[0] is not None:
-            if status[0] == 'Moving':
-                matched = pbarmoving.match(line)
-                if matched is not None:
-                    moving_bars.append(matched.group(2))
-
-        # Check for move end
-        if status[0] != 'Error':
-            status, history_entry = check_for_transition(line, status, pend_move, 'Idle')
-            if history_entry is not None:
-                history_entry['nbars'] = len(moving_bars)
-                moving_bars = []
-                if xaccels is not None and yaccels is not None:
-                    history_entry['xaccels'] = xaccels
-                    history_entry['yaccels'] = yaccels
-                    history_entry['accel age (s)'] = (status[1] - min([xaccel_time, xaccel_time])).total_seconds()
-                status_history.append(history_entry)
-
-        # Check for fatal error
-        status, history_entry = check_for_transition(line, status, pfatal_error, 'Error')
-        if history_entry is not None:
-            # Check what previous state was
-            if len(status_history) > 1:
-                if status_history[-1]['duration (s)'] >= 120:
-                    print(f'  {history_entry["begin"]}: Fatal Error after: {status_history[-1]["status"]} ({status_history[-1]["duration (s)"]} s)')
-                else:
-                    print(f'  {history_entry["begin"]}: Fatal Error quickly after: {status_history[-1]["status"]} ({status_history[-1]["duration (s)"]} s)')
-                    if len(status_history) > 2:
-                        print(f'                      after: {status_history[-2]["status"]} ({status_history[-2]["duration (s)"]} s)')
-            else:
-                print(f'  {history_entry["begin"]}: Fatal Error')
-
-            if history_entry['status'] == 'Moving':
-                history_entry['nbars'] = len(moving_bars)
-                moving_bars = []
-            if xaccels is not None and yaccels is not None:
-                history_entry['xaccels'] = xaccels
-                history_entry['yaccels'] = yaccels
-                history_entry['accel age (s)'] = (status[1] - min([xaccel_time, xaccel_time])).total_seconds()
-            status_history.append(history_entry)
-
-        # Check for power cycle
-        status, history_entry = check_for_transition(line, status, ppower_down, 'PowerDown')
-        if history_entry is not None:
-            if xaccels is not None and yaccels is not None:
-                history_entry['xaccels'] = xaccels
-                history_entry['yaccels'] = yaccels
-                history_entry['accel age (s)'] = (status[1] - min([xaccel_time, xaccel_time])).total_seconds()
-            status_history.append(history_entry)
-
-        # Check for initialization
-        status, history_entry = check_for_transition(line, status, pinitialize, 'Initialize')
-        if history_entry is not None:
-            if xaccels is not None and yaccels is not None:
-                history_entry['xaccels'] = xaccels
-                history_entry['yaccels'] = yaccels
-                history_entry['accel age (s)'] = (status[1] - min([xaccel_time, xaccel_time])).total_seconds()
-            status_history.append(history_entry)
-
-        # Check for initialization complete
-        status, history_entry = check_for_transition(line, status, pinitialize_complete, 'Idle')
-        if history_entry is not None:
-            if xaccels is not None and yaccels is not None:
-                history_entry['xaccels'] = xaccels
-                history_entry['yaccels'] = yaccels
-                history_entry['accel age (s)'] = (status[1] - min([xaccel_time, xaccel_time])).total_seconds()
-            status_history.append(history_entry)
+        accel = ACCEL_PROPERTIES.get(prop, None)
+        if accel is not None:
+            if value.isdigit():
+                context[accel] = int(value)
+                context[f'{accel} time'] = timestamp
+            continue
+
+        # Count bars in setup or move
+        counter = BAR_COUNTERS.get((status[0], prop), None)
+        if counter is not None:
+            pbarno, pvalue = BAR_COUNTER_PATTERNS[prop]
+            if len(tail) > 0 and pbarno.match(barno) and pvalue.match(value):
+                context[counter].append(barno)
+            continue
+
+        transition = lookup_transition(status[0], prop, value)
+        if transition is None:
+            continue
+        new_state, action = transition
+        transition_time = parse_timestamp(timestamp)
+        history_entry = make_history_entry(status, transition_time)
+        status = (new_state, transition_time)
+        if action is not None:
+            TRANSITION_ACTIONS[action](history_entry, context, status_history)
+        if context['xaccels'] is not None and context['yaccels'] is not None:
+            xaccel_time = parse_timestamp(context['xaccels time'])
+            history_entry['xaccels'] = context['xaccels']
+            history_entry['yaccels'] = context['yaccels']
+            history_entry['accel age (s)'] = (status[1] - xaccel_time).total_seconds()
+        status_history.append(history_entry)
 
     return status_history
 
@@ -319,244 +327,6 @@ def get_csu_keywords(timestamp):
     return result
 
 
-##-------------------------------------------------------------------------
-## Plot: acceleration values histogram
-##-------------------------------------------------------------------------
-def plot_accel(history_table):
-    print('Plotting acceleration histograms')
-    moves = history_table[history_table['status'] == 'Moving']
-    successful_moves = moves[moves['MoveFailed'] == 'False']
-    failed_moves = moves[moves['MoveFailed'] == 'True']
-
-    plt.figure(figsize=(12,12))
-
-    bins = np.arange(0,10000,100)
-    ax = plt.subplot(2,1,1)
-    plt.title('Acceleration Values')
-    n, bins, _ = ax.hist(successful_moves['xaccels'], bins=bins, color='g', alpha=0.4,
-                         label=f'Successful Moves ({len(successful_moves)})')
-    ax.hist(failed_moves['xaccels'], bins=bins, color='r', alpha=0.1,
-            label=f'Failed Moves ({len(failed_moves)})')
-    ax.set_ylim(0, max(n)*1.1)
-    ax.set_ylabel('N Successful Moves')
-    plt.legend(loc='best')
-    plt.xlabel('xaccel')
-
-    failed_ax = ax.twinx()
-    fn, fbins, _ = failed_ax.hist(failed_moves['xaccels'], bins=bins, color='r', alpha=0.4,
-                                  label=f'Failed Moves ({len(failed_moves)})')
-    failed_ax.set_ylim(0, max(n)*1.1/50)
-    failed_ax.set_ylabel('N Failed Moves')
-    plt.xlim(1000,9000)
-    plt.grid()
-
-    ax = plt.subplot(2,1,2)
-    n, bins, _ = plt.hist(successful_moves['yaccels'], bins=bins, color='g', alpha=0.4,
-                          label=f'Successful Moves ({len(successful_moves)})')
-    plt.hist(failed_moves['yaccels'], bins=bins, color='r', alpha=0.1,
-             label=f'Failed Moves ({len(failed_moves)})')
-    plt.legend(loc='best')
-    ax.set_ylim(0, max(n)*1.1)
-    ax.set_ylabel('N Successful Moves')
-    plt.xlabel('yaccel')
-
-    failed_ax = ax.twinx()
-    plt.hist(failed_moves['yaccels'], bins=bins, color='r', alpha=0.4,
-             label=f'Failed Moves ({len(failed_moves)})')
-    failed_ax.set_ylim(0, max(n)*1.1/50)
-    failed_ax.set_ylabel('N Failed Moves')
-
-    plt.xlim(1000,9000)
-    plt.grid()
-
-    plot_file = Path('acceleration_values.png')
-    plt.savefig(plot_file, bbox_inches='tight', pad_inches=0.10)
-#     plt.show()
-
-
-##-------------------------------------------------------------------------
-## Plot: nbars in move
-##-------------------------------------------------------------------------
-def plot_nbars(history_table):
-    print('Plotting nbars in move')
-    moves = history_table[history_table['status'] == 'Moving']
-
-    successful_moves = moves[moves['MoveFailed'] == 'False']
-    failed_moves = moves[moves['MoveFailed'] == 'True']
-    time_successful_moves = [datetime.strptime(x[:19], '%Y-%m-%d %H:%M:%S')\
-                             for x in successful_moves['begin']]
-    time_failed_moves = [datetime.strptime(x[:19], '%Y-%m-%d %H:%M:%S')\
-                         for x in failed_moves['begin']]
-
-    plt.figure(figsize=(12,12))
-
-    ax = plt.subplot(2,1,1)
-    plt.title('Number of Bars Moving')
-    bins = np.arange(0,92,1)
-    n, bins, _ = plt.hist(successful_moves['nbars'], bins=bins, color='g', alpha=0.4,
-                          label=f'Successful Moves ({len(successful_moves)})')
-    plt.hist(failed_moves['nbars'], bins=bins, color='r', alpha=0.1,
-             label=f'Failed Moves ({len(failed_moves)})')
-    plt.legend(loc='best')
-    ax.set_ylim(0, max(n)*1.1)
-    ax.set_ylabel('N Successful Moves')
-
-    failed_ax = ax.twinx()
-    plt.hist(failed_moves['nbars'], bins=bins, color='r', alpha=0.4,
-             label=f'Failed Moves ({len(failed_moves)})')
-    failed_ax.set_ylim(0, max(n)*1.1/50)
-    failed_ax.set_ylabel('N Failed Moves')
-
-    plt.xlabel('Number of Bars')
-    plt.xlim(0,93)
-    plt.grid()
-
-    plt.subplot(2,1,2)
-    plt.title('Behavior over Time')
-    plt.plot(time_successful_moves, successful_moves['nbars'], 'go',
-             alpha=0.2, mew=0, label=f'Successful Moves ({len(successful_moves)})')
-    plt.plot(time_failed_moves, failed_moves['nbars'], 'rv',
-             alpha=0.4, ms=10, label=f'Failed Moves ({len(failed_moves)})')
-    plt.xlabel('Time')
-    plt.ylabel('Number of Bars')
-    plt.ylim(-1,93)
-    plt.grid()
-    plt.legend(loc='best')
-
-    plot_file = Path('number_of_bars_moving.png')
-    plt.savefig(plot_file, bbox_inches='tight', pad_inches=0.10)
-#     plt.show()
-
-
-##-------------------------------------------------------------------------
-## Plot: rotator position in move vs. time (color code failures)
-##-------------------------------------------------------------------------
-def plot_rotposn(history_table):
-    print('Plotting rotator position in move')
-    rot_history_table = history_table[21028:]
-    moves = rot_history_table[rot_history_table['status'] == 'Moving']
-    successful_moves = moves[moves['MoveFailed'] == 'False']
-    failed_moves = moves[moves['MoveFailed'] == 'True']
-    time_successful_moves = [datetime.strptime(x[:19], '%Y-%m-%d %H:%M:%S')\
-                             for x in successful_moves['begin']]
-    time_failed_moves = [datetime.strptime(x[:19], '%Y-%m-%d %H:%M:%S')\
-                         for x in failed_moves['begin']]
-    t0 = time_successful_moves[0]
-    t1 = time_successful_moves[-1]
-
-    plt.figure(figsize=(12,12))
-
-    ax = plt.subplot(3,1,1)
-    plt.title('Rotator Angle')
-    bins = np.arange(-450,360,10)
-    n, bins, _ = plt.hist(successful_moves['ROTPOSN'], bins=bins, color='g', alpha=0.4,
-                          label=f'Successful Moves ({len(successful_moves)})')
-    plt.hist(failed_moves['ROTPOSN'], bins=bins, color='r', alpha=0.1,
-             label=f'Failed Moves ({len(failed_moves)})')
-    plt.legend(loc='best')
-    ax.set_ylim(0, max(n)*1.1)
-    ax.set_ylabel('N Successful Moves')
-
-    failed_ax = ax.twinx()
-    nf, binsf, _ = plt.hist(failed_moves['ROTPOSN'], bins=bins, color='r', alpha=0.4,
-                            label=f'Failed Moves ({len(failed_moves)})')
-    failed_ax.set_ylim(0, max(n)*1.1/50)
-    failed_ax.set_ylabel('N Failed Moves')
-
-    plt.axvspan(170, 190, color='r', alpha=0.1)
-    plt.axvspan(-10, 10, color='r', alpha=0.1)
-    plt.axvspan(-190, -170, color='r', alpha=0.1)
-    plt.axvspan(-370, -350, color='r', alpha=0.1)
-
-    plt.xlabel('ROTPPOSN')
-    plt.xticks(np.arange(-450,390,30))
-    plt.ylabel('N Moves')
-    plt.grid()
-
-    ax = plt.subplot(3,1,2)
-    rate = nf/(n+nf)*100
-    rbins = [(bins[i+1]+bins[i])/2 for i in range(len(bins)-1)]
-    plt.plot(rbins, rate, 'ro')
-    plt.xlabel('ROTPPOSN')
-    plt.xticks(np.arange(-450,390,30))
-    plt.ylabel('Failure Rate (%)')
-    plt.grid()
-
-    plt.subplot(3,1,3)
-    plt.plot(time_successful_moves, successful_moves['ROTPOSN'], 'go',
-             alpha=0.2, mew=0, label=f'Successful Moves ({len(successful_moves)})')
-    plt.plot(time_failed_moves, failed_moves['ROTPOSN'], 'rv',
-             alpha=0.4, ms=10, label=f'Failed Moves ({len(failed_moves)})')
-    plt.axhspan(170, 190, xmin=0, xmax=1, color='r', alpha=0.2)
-    plt.axhspan(-10, 10, xmin=0, xmax=1, color='r', alpha=0.2)
-    plt.axhspan(-190, -170, xmin=0, xmax=1, color='r', alpha=0.2)
-    plt.axhspan(-370, -350, xmin=0, xmax=1, color='r', alpha=0.2)
-    plt.xlabel('Time')
-    plt.ylabel('ROTPOSN')
-    plt.yticks(np.arange(-450,390,90))
-    plt.grid()
-    plt.legend(loc='best')
-
-    plot_file = Path('rotator_position.png')
-    plt.savefig(plot_file, bbox_inches='tight', pad_inches=0.10)
-#     plt.show()
-
-
-##-------------------------------------------------------------------------
-## Plot: failure rate vs. time
-##-------------------------------------------------------------------------
-def plot_fail_rate(history_table):
-    print('Plotting failure rate vs. time')
-    moves = history_table[history_table['status'] == 'Moving']
-    successful_moves = moves[moves['MoveFailed'] == 'False']
-    failed_moves = moves[moves['MoveFailed'] == 'True']
-    time_successful_moves = [datetime.strptime(x[:19], '%Y-%m-%d %H:%M:%S')\
-                             for x in successful_moves['begin']]
-    time_failed_moves = [datetime.strptime(x[:19], '%Y-%m-%d %H:%M:%S')\
-                         for x in failed_moves['begin']]
-    t0 = time_successful_moves[0]
-    t1 = time_successful_moves[-1]
-
-    plt.figure(figsize=(12,12))
-    ax = plt.subplot(2,1,1)
-    n, bins, _ = plt.hist(mdates.date2num(time_successful_moves),
-                          bins=50, color='g', alpha=0.4,
-                          label=f'Successful Moves ({len(successful_moves)})')
-    nf, bins, _ = plt.hist(mdates.date2num(time_failed_moves),
-                           bins=bins, color='r', alpha=0.1,
-                           label=f'Failed Moves ({len(failed_moves)})')
-    plt.legend(loc='best')
-    ax.set_ylim(0, max(n)*1.1)
-    ax.set_ylabel('N Successful Moves')
-    ax.xaxis.set_major_locator(mdates.MonthLocator(interval=6))
-    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
-    plt.xlabel('Time')
-    plt.grid()
-
-    failed_ax = ax.twinx()
-    plt.hist(mdates.date2num(time_failed_moves),
-             bins=bins, color='r', alpha=0.4,
-             label=f'Failed Moves ({len(failed_moves)})')
-    failed_ax.set_ylim(0, max(n)*1.1/50)
-    failed_ax.set_ylabel('N Failed Moves')
-
-    ax = plt.subplot(2,1,2)
-    failrate = [nf[i]/(nf[i]+n[i])*100 if n[i] > 0 else 0 for i,s in enumerate(n)]
-    failuncert = [nf[i]/(nf[i]+n[i])*100
-                  if n[i] > 0 else 0 for i,s in enumerate(n)]
-    plt.plot(bins[1:], failrate, 'r-', drawstyle='steps-mid')
-    plt.plot(bins[1:], [0]*len(bins[1:]), 'k-', drawstyle='steps-mid', alpha=0.5)
-    ax.set_ylabel('Move Failure Rate (%)')
-    ax.xaxis.set_major_locator(mdates.MonthLocator(interval=6))
-    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
-    plt.xlabel('Time')
-    plt.grid()
-
-    plot_file = Path('failure_rate.png')
-    plt.savefig(plot_file, bbox_inches='tight', pad_inches=0.10)
-
-
-
 ##-------------------------------------------------------------------------
 ## __main__
 ##-------------------------------------------------------------------------
@@ -584,18 +354,10 @@ if __name__ == '__main__':
                 status_history.extend( status )
 
         history_table = Table(status_history)
-        move_failed = np.zeros(len(history_table), dtype=bool)
-        for i,event in enumerate(history_table):
-            if event['status'] == 'Error':
-                last_status = history_table[i-1]['status']
-                if last_status == 'Moving':
-                    move_failed[i-1] = True
+        move_failed = label_failed_moves(history_table)
         history_table.add_column(Column(move_failed, name='MoveFailed'))
         history_table.write(history_file, format='ascii.fixed_width', overwrite=True)
     else:
         print(f'Reading: {history_file}')
         history_table = Table.read(history_file, format='ascii.fixed_width')
-        plot_nbars(history_table)
-        plot_rotposn(history_table)
-        plot_accel(history_table)
-        plot_fail_rate(history_table)
\ No newline at end of file
+        report(history_table, fmt=args.format, processes=args.processes)
\ No newline at end of file
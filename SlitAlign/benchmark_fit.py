@@ -0,0 +1,124 @@
+#!/usr/env/python
+
+## Import General Tools
+import time
+import argparse
+
+import numpy as np
+from ccdproc import CCDData
+
+from slitAlign import mosfireAlignmentBox, fit_alignment_box
+from box_geometry import get_box_geometry
+from fast_fit import fit_alignment_box_fast
+
+
+##-------------------------------------------------------------------------
+## Synthetic alignment box
+##-------------------------------------------------------------------------
+def make_box(rng, box_size=30, noise=8.):
+    '''Simulate an alignment box region with known truth.
+    '''
+    truth = {'Box X': box_size + rng.uniform(-3, 3),
+             'Box Y': box_size + rng.uniform(-3, 3),
+             'Sky Amplitude': rng.uniform(200, 500),
+             'Star Amplitude': rng.uniform(400, 2000),
+             'sigma': rng.uniform(1.5, 3.0),
+             'offset': rng.uniform(20, 80),
+             }
+    truth['Star X'] = truth['Box X'] + rng.uniform(-4, 4)
+    truth['Star Y'] = truth['Box Y'] + rng.uniform(-8, 8)
+    y, x = np.mgrid[:2*box_size+1, :2*box_size+1]
+    box = mosfireAlignmentBox.evaluate(x, y, 1, truth['Box X'], truth['Box Y'], 22.5, 36.0)
+    star = truth['Star Amplitude']*np.exp(-0.5*((x-truth['Star X'])**2
+                                                + (y-truth['Star Y'])**2)/truth['sigma']**2)
+    data = box*(truth['Sky Amplitude'] + star) + truth['offset']
+    data += rng.normal(0, noise, data.shape)
+    return data, truth
+
+
+##-------------------------------------------------------------------------
+## Box model microbenchmark
+##-------------------------------------------------------------------------
+def select_evaluate(x, y, amplitude, x_0, y_0, x_width, y_width):
+    '''The original np.select implementation of mosfireAlignmentBox.evaluate
+    for comparison.
+    '''
+    x0_of_y = x_0 + (y-y_0)*np.sin(-3.7*np.pi/180)
+    x_range = np.logical_and(x >= x0_of_y - x_width / 2.,
+                             x <= x0_of_y + x_width / 2.)
+    y_range = np.logical_and(y >= y_0 - y_width / 2.,
+                             y <= y_0 + y_width / 2.)
+    return np.select([np.logical_and(x_range, y_range)], [amplitude], 0)
+
+
+def benchmark_model(box_size=30, duration=1.0):
+    '''Print the number of box model evaluations per second.
+    '''
+    geometry = get_box_geometry((2*box_size+1, 2*box_size+1))
+    y, x = np.mgrid[:2*box_size+1, :2*box_size+1]
+    bool_out = np.empty(geometry.shape, dtype=bool)
+    float_out = np.empty(geometry.shape, dtype=np.float64)
+    params = (box_size+0.3, box_size-0.2, 22.5, 36.0)
+    tests = [('np.select (original)', lambda: select_evaluate(x, y, 1, *params)),
+             ('mosfireAlignmentBox.evaluate', lambda: mosfireAlignmentBox.evaluate(x, y, 1, *params)),
+             ('BoxGeometry.evaluate', lambda: geometry.evaluate(*params, out=bool_out)),
+             ('BoxGeometry.evaluate_antialiased', lambda: geometry.evaluate_antialiased(*params, out=float_out)),
+            ]
+    print(f'Box model evaluations on a {2*box_size+1}x{2*box_size+1} grid')
+    for name, fn in tests:
+        n = 0
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < duration:
+            for i in range(100):
+                fn()
+            n += 100
+        rate = n / (time.perf_counter() - t0)
+        print(f'  {name:>34s}: {rate:10,.0f} evaluations/s')
+
+
+def run(fitfn, regions):
+    t0 = time.perf_counter()
+    results = [fitfn(region) for region in regions]
+    return results, time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    p = argparse.ArgumentParser(description='''
+    Compare fit_alignment_box and fit_alignment_box_fast on synthetic boxes.
+    ''')
+    p.add_argument("-n", "--nboxes", dest="nboxes", type=int,
+        default=50,
+        help="Number of synthetic boxes.")
+    p.add_argument("--model", dest="model",
+        default=False, action="store_true",
+        help="Benchmark box model evaluations instead of fits.")
+    args = p.parse_args()
+
+    if args.model is True:
+        benchmark_model()
+        raise SystemExit
+
+    rng = np.random.default_rng(0)
+    boxes = [make_box(rng) for i in range(args.nboxes)]
+    regions = [CCDData(b[0], unit='adu') for b in boxes]
+    truths = [b[1] for b in boxes]
+
+    print(f'Fitting {args.nboxes} synthetic alignment boxes')
+    for name, fitfn in [('astropy', fit_alignment_box), ('fast', fit_alignment_box_fast)]:
+        results, elapsed = run(fitfn, regions)
+        dx = np.array([r['Star X']-t['Star X'] for r,t in zip(results, truths)])
+        dy = np.array([r['Star Y']-t['Star Y'] for r,t in zip(results, truths)])
+        bx = np.array([r['Box X']-t['Box X'] for r,t in zip(results, truths)])
+        by = np.array([r['Box Y']-t['Box Y'] for r,t in zip(results, truths)])
+        print(f'{name:>8s}: {elapsed/args.nboxes*1000:7.1f} ms/box')
+        print(f'  star position error rms = {np.std(dx):.3f}, {np.std(dy):.3f} pix  '
+              f'max = {np.max(np.abs(dx)):.3f}, {np.max(np.abs(dy)):.3f} pix')
+        print(f'   box position error rms = {np.std(bx):.3f}, {np.std(by):.3f} pix  '
+              f'max = {np.max(np.abs(bx)):.3f}, {np.max(np.abs(by)):.3f} pix')
+        if name == 'astropy':
+            astropy_time = elapsed
+        else:
+            print(f'Speed up: {astropy_time/elapsed:.1f}x')
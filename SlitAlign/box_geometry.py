@@ -0,0 +1,83 @@
+#!/usr/env/python
+
+## Import General Tools
+import numpy as np
+
+
+##-------------------------------------------------------------------------
+## Slit angle
+##-------------------------------------------------------------------------
+## Shared by slitAlign and fast_fit, which import the geometry from here so
+## that both use the same cache of BoxGeometry instances, also when
+## slitAlign is run as a script.
+slit_angle = -3.7 # in degrees
+sin_slit_angle = np.sin(slit_angle*np.pi/180)
+
+
+##-------------------------------------------------------------------------
+## Box Geometry
+##-------------------------------------------------------------------------
+class BoxGeometry(object):
+    '''Pixel grid of an alignment box region with the slit angle shear
+    precomputed, for repeated evaluation of the alignment box at different
+    positions and sizes.
+
+    In the sheared coordinate xs = x - y*sin(slit_angle) the slit edges are
+    vertical, so the box is |xs - (x_0 - y_0*sin(slit_angle))| <= x_width/2
+    and |y - y_0| <= y_width/2, where the second test is per row.  Scratch
+    arrays are reused between calls, so an instance should not be shared
+    between threads.
+    '''
+    def __init__(self, shape):
+        ny, nx = shape
+        self.shape = (ny, nx)
+        self.y, self.x = np.mgrid[:ny, :nx].astype(np.float64)
+        self.xs = self.x - self.y*sin_slit_angle
+        self.rows = np.arange(ny, dtype=np.float64)
+        for a in [self.x, self.y, self.xs, self.rows]:
+            a.flags.writeable = False
+        self.scratch = np.empty(self.shape, dtype=np.float64)
+        self.row_scratch = np.empty(ny, dtype=np.float64)
+
+    def evaluate(self, x_0, y_0, x_width, y_width, out=None):
+        '''Boolean mask of the pixels inside the box (same as
+        mosfireAlignmentBox.evaluate with amplitude 1).
+        '''
+        if out is None:
+            out = np.empty(self.shape, dtype=bool)
+        np.subtract(self.xs, x_0 - y_0*sin_slit_angle, out=self.scratch)
+        np.abs(self.scratch, out=self.scratch)
+        np.less_equal(self.scratch, x_width/2., out=out)
+        np.subtract(self.rows, y_0, out=self.row_scratch)
+        np.abs(self.row_scratch, out=self.row_scratch)
+        out &= (self.row_scratch <= y_width/2.)[:,np.newaxis]
+        return out
+
+    def evaluate_antialiased(self, x_0, y_0, x_width, y_width, out=None):
+        '''Fraction of each pixel inside the box, with the edges ramping
+        linearly from 0 to 1 over one pixel, so the model varies smoothly
+        with sub-pixel changes in position and size.
+        '''
+        if out is None:
+            out = np.empty(self.shape, dtype=np.float64)
+        np.subtract(self.xs, x_0 - y_0*sin_slit_angle, out=out)
+        np.abs(out, out=out)
+        np.subtract(x_width/2. + 0.5, out, out=out)
+        np.clip(out, 0, 1, out=out)
+        np.subtract(self.rows, y_0, out=self.row_scratch)
+        np.abs(self.row_scratch, out=self.row_scratch)
+        np.subtract(y_width/2. + 0.5, self.row_scratch, out=self.row_scratch)
+        np.clip(self.row_scratch, 0, 1, out=self.row_scratch)
+        out *= self.row_scratch[:,np.newaxis]
+        return out
+
+
+box_geometries = {}
+
+def get_box_geometry(shape):
+    '''Return the (cached) BoxGeometry for a region shape.
+    '''
+    shape = tuple(shape)
+    if shape not in box_geometries:
+        box_geometries[shape] = BoxGeometry(shape)
+    return box_geometries[shape]
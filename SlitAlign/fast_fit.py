@@ -0,0 +1,245 @@
+#!/usr/env/python
+
+## Import General Tools
+import numpy as np
+from scipy import ndimage
+from scipy.optimize import least_squares
+from astropy import units as u
+
+from box_geometry import get_box_geometry
+from timing import span
+
+
+##-------------------------------------------------------------------------
+## Model of star in alignment box
+##-------------------------------------------------------------------------
+## The model is the same as the astropy compound model used in
+## fit_alignment_box:  box*(sky + star) + offset
+## but with the box held fixed while fitting, so the remaining parameters
+## are smooth and have analytic derivatives.
+##   p = [offset, sky, amplitude, x_mean, y_mean, x_stddev, y_stddev]
+##
+## Pixels outside of the fixed box only constrain the offset, and the sum of
+## their squared residuals is exactly n_out*(offset - mean_out)**2 plus a
+## constant.  They are therefore replaced by that single residual, leaving
+## only the pixels inside the box in the fit.
+def star_model(p, x, y):
+    offset, sky, amplitude, x_mean, y_mean, x_stddev, y_stddev = p
+    gauss = np.exp(-0.5*((x-x_mean)**2/x_stddev**2 + (y-y_mean)**2/y_stddev**2))
+    return sky + amplitude*gauss + offset
+
+
+def residuals(p, x, y, data, n_out, mean_out):
+    result = np.empty(len(x)+1)
+    result[:-1] = star_model(p, x, y) - data
+    result[-1] = np.sqrt(n_out)*(p[0] - mean_out)
+    return result
+
+
+def jacobian(p, x, y, data, n_out, mean_out):
+    offset, sky, amplitude, x_mean, y_mean, x_stddev, y_stddev = p
+    dx = x - x_mean
+    dy = y - y_mean
+    gauss = np.exp(-0.5*(dx**2/x_stddev**2 + dy**2/y_stddev**2))
+    agauss = amplitude*gauss
+    jac = np.zeros((len(x)+1, 7))
+    jac[:-1,0] = 1
+    jac[:-1,1] = 1
+    jac[:-1,2] = gauss
+    jac[:-1,3] = agauss*dx/x_stddev**2
+    jac[:-1,4] = agauss*dy/y_stddev**2
+    jac[:-1,5] = agauss*dx**2/x_stddev**3
+    jac[:-1,6] = agauss*dy**2/y_stddev**3
+    jac[-1,0] = np.sqrt(n_out)
+    return jac
+
+
+##-------------------------------------------------------------------------
+## fit_CSU_edges_fast
+##-------------------------------------------------------------------------
+def parabolic_peak(profile, i):
+    '''Sub-pixel position of the extremum at index i of profile.
+    '''
+    if i <= 0 or i >= len(profile)-1:
+        return float(i)
+    a, b, c = profile[i-1], profile[i], profile[i+1]
+    denominator = a - 2*b + c
+    if denominator == 0:
+        return float(i)
+    return i + 0.5*(a - c)/denominator
+
+
+def fit_CSU_edges_fast(profile):
+    '''Closed form replacement for fit_CSU_edges.  The edges are the minimum
+    and maximum of the gradient profile located to sub-pixel precision with
+    a parabola, with the same validity checks as the Gaussian fit.  Unlike
+    fit_CSU_edges the edge positions are not padded and rounded to whole
+    pixels, so they can be used directly as the box size and position.
+    '''
+    imin = int(np.argmin(profile))
+    imax = int(np.argmax(profile))
+    if profile[imin] < -1 and profile[imax] > 1 and imin > imax:
+        return parabolic_peak(profile, imax), parabolic_peak(profile, imin)
+    return None, None
+
+
+##-------------------------------------------------------------------------
+## fit_star
+##-------------------------------------------------------------------------
+def fit_star(p0, x, y, box, data, lower, upper):
+    '''Fit the star, sky and offset with the box fixed.
+    '''
+    inside = box > 0
+    n_out = np.sum(~inside)
+    mean_out = np.mean(data[~inside]) if n_out > 0 else 0
+    fit = least_squares(residuals, p0, jac=jacobian, bounds=(lower, upper),
+                        args=(x[inside], y[inside], data[inside], n_out, mean_out),
+                        method='trf')
+    return fit.x
+
+
+##-------------------------------------------------------------------------
+## refine_box
+##-------------------------------------------------------------------------
+def refine_box(p, geometry, data, box_params, step=0.25, extent=0.5,
+               antialias=False):
+    '''With the star and sky fixed, search small shifts of the box center
+    (first in x, then in y) for the position which minimizes the residuals.
+    With antialias the box edges are sub-pixel, so the residuals vary
+    smoothly and the minimum is interpolated between the grid points.
+    '''
+    x_0, y_0, x_width, y_width = box_params
+    shifts = np.arange(-extent, extent+step/2, step)
+    inside = star_model(p, geometry.x, geometry.y) - p[0]
+    outside = data - p[0]
+    if antialias is True:
+        box = np.empty(geometry.shape, dtype=np.float64)
+        def chisq(x_c, y_c):
+            geometry.evaluate_antialiased(x_c, y_c, x_width, y_width, out=box)
+            return np.sum((box*inside - outside)**2)
+    else:
+        box = np.empty(geometry.shape, dtype=bool)
+        def chisq(x_c, y_c):
+            geometry.evaluate(x_c, y_c, x_width, y_width, out=box)
+            return np.sum((np.where(box, inside, 0) - outside)**2)
+
+    def best_shift(values):
+        i = int(np.argmin(values))
+        if antialias is True:
+            return step*(parabolic_peak(np.array(values), i) - i) + shifts[i]
+        return shifts[i]
+
+    x_0 = x_0 + best_shift([chisq(x_0+s, y_0) for s in shifts])
+    y_0 = y_0 + best_shift([chisq(x_0, y_0+s) for s in shifts])
+    return x_0, y_0
+
+
+##-------------------------------------------------------------------------
+## fit_alignment_box_fast
+##-------------------------------------------------------------------------
+def fit_alignment_box_fast(region, box_size=30, verbose=False, seeing=None,
+                           medfilt=False, antialias=True):
+    '''Drop in replacement for fit_alignment_box using
+    scipy.optimize.least_squares with an analytic Jacobian.
+
+    The box is estimated once from the CSU edges (see fit_CSU_edges_fast),
+    held fixed while the star and sky are fit, and then refined at the end
+    (with sub-pixel box edges if antialias is set).
+    '''
+    pixelscale = u.pixel_scale(0.1798*u.arcsec/u.pixel)
+    data = np.asarray(getattr(region, 'data', region), dtype=np.float64)
+    if medfilt is True:
+        with span('median_filter'):
+            data = ndimage.median_filter(data, size=(3,3))
+
+    # Estimate center of alignment box
+    threshold_pct = 80
+    window = data > np.percentile(data, threshold_pct)
+    alignment_box_position = ndimage.center_of_mass(window)
+    offset_val = np.median(data[~window])
+
+    # Determine fluctuations in sky
+    sky_amplitude = np.median(data[window])
+    sky_fluctuations = np.std(data[window])
+
+    # Detect box edges, falling back to the center of mass and typical box
+    # size if the edges are not found.  The data are clipped at the sky level
+    # so that a star near an edge does not dominate the gradient profiles.
+    box_params = [alignment_box_position[1], alignment_box_position[0], 22.5, 36.0]
+    with span('fit_CSU_edges_fast'):
+        clipped = np.minimum(data, np.percentile(data, 95))
+        h_edges = fit_CSU_edges_fast(np.sum(np.gradient(clipped, axis=1), axis=0))
+        v_edges = fit_CSU_edges_fast(np.sum(np.gradient(clipped, axis=0), axis=1))
+    if h_edges[0] is not None and h_edges[1]-h_edges[0] >= 10:
+        box_params[0] = (h_edges[0]+h_edges[1])/2
+        box_params[2] = h_edges[1]-h_edges[0]
+    if v_edges[0] is not None and v_edges[1]-v_edges[0] >= 10:
+        box_params[1] = (v_edges[0]+v_edges[1])/2
+        box_params[3] = v_edges[1]-v_edges[0]
+
+    # Estimate stellar position
+    maxr = np.max(data)
+    starloc = np.unravel_index(np.argmax(data), data.shape)
+    star_amplitude = maxr - sky_amplitude
+    star_sigma = star_amplitude / sky_fluctuations
+    if star_sigma < 5:
+        if verbose: print(f'No star detected.  sigma={star_sigma:.1f}')
+        return [None]*4
+    else:
+        if verbose: print(f'Detected peak pixel {star_sigma:.1f} sigma above sky.')
+
+    # Parameter bounds (same limits as fit_alignment_box)
+    stddev_min, stddev_max = 1, 4
+    if seeing is not None and seeing > 0:
+        sigma = (seeing / 2.355 * u.arcsec).to(u.pixel, equivalencies=pixelscale).value
+        stddev_min = max(2, sigma-1)
+        stddev_max = min(sigma+1, 4)
+    lower = [-np.inf, 0, 5*sky_fluctuations, -np.inf, -np.inf, stddev_min, stddev_min]
+    upper = [np.inf, np.inf, np.inf, np.inf, np.inf, stddev_max, stddev_max]
+    p0 = np.array([offset_val, sky_amplitude, star_amplitude,
+                   starloc[1], starloc[0], 2, 2], dtype=np.float64)
+    p0 = np.clip(p0, np.array(lower)+1e-6, np.array(upper)-1e-6)
+
+    geometry = get_box_geometry(data.shape)
+    x = geometry.x.ravel()
+    y = geometry.y.ravel()
+    z = data.ravel()
+
+    # Fit star and sky with the box fixed, refine box, then refit
+    box = geometry.evaluate(*box_params).ravel()
+    with span('fit_star'):
+        p = fit_star(p0, x, y, box, z, lower, upper)
+    with span('refine_box'):
+        box_x, box_y = refine_box(p, geometry, data, box_params, antialias=antialias)
+    if box_x != box_params[0] or box_y != box_params[1]:
+        box_params[0], box_params[1] = box_x, box_y
+        box = geometry.evaluate(*box_params).ravel()
+        with span('fit_star'):
+            p = fit_star(p, x, y, box, z, lower, upper)
+
+    offset, sky_amplitude, star_amplitude, star_x, star_y, x_stddev, y_stddev = p
+    FWHMx = 2*(2*np.log(2))**0.5*x_stddev * u.pix
+    FWHMy = 2*(2*np.log(2))**0.5*y_stddev * u.pix
+    FWHM = (FWHMx**2 + FWHMy**2)**0.5/2**0.5
+    FWHMarcsec = FWHM.to(u.arcsec, equivalencies=pixelscale)
+    star_flux = 2*np.pi*star_amplitude*x_stddev*y_stddev
+
+    if verbose: print(f"  Box X Center = {box_params[0]:.0f}")
+    if verbose: print(f"  Box Y Center = {box_params[1]:.0f}")
+    if verbose: print(f"  Sky Brightness = {sky_amplitude:.0f} ADU")
+    if verbose: print(f"  Stellar FWHM = {FWHMarcsec:.2f}")
+    if verbose: print(f"  Stellar Xpos = {star_x:.0f}")
+    if verbose: print(f"  Stellar Xpos = {star_y:.0f}")
+    if verbose: print(f"  Stellar Amplitude = {star_amplitude:.0f} ADU")
+    if verbose: print(f"  Stellar Flux (fit) = {star_flux:.0f} ADU")
+
+    result = {'Star X': star_x,
+              'Star Y': star_y,
+              'Star Amplitude': star_amplitude,
+              'Sky Amplitude': sky_amplitude,
+              'FWHM pix': FWHM.value,
+              'FWHM arcsec': FWHMarcsec,
+              'Box X': box_params[0],
+              'Box Y': box_params[1],
+             }
+    return result
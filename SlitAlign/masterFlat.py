@@ -0,0 +1,161 @@
+#!/usr/env/python
+
+## Import General Tools
+import os
+import argparse
+from contextlib import ExitStack
+
+import numpy as np
+from astropy.io import fits
+from ccdproc import CCDData
+
+
+##-------------------------------------------------------------------------
+## Streaming combine
+##-------------------------------------------------------------------------
+## The frames are memory mapped and combined a tile of rows at a time.  The
+## number of rows in a tile is chosen so that the stack of one tile
+## (nframes*tile_rows*ncols values) fits in max_memory, so peak memory stays
+## at a few times max_memory as the number of frames grows (until a tile is
+## a single row).  The result is the same as create_master_flat in
+## slitAlign: dark subtraction, sigma clipping of the (unscaled) stack about
+## the mean as in Combiner.sigma_clipping, scaling of each frame by the
+## inverse of its mean unclipped value, and a median combine.
+def read_tile(frames, rows, dark=None):
+    stack = np.array([frame[rows] for frame in frames], dtype=np.float64)
+    if dark is not None:
+        stack -= dark[rows]
+    return stack
+
+
+def clip_tile(stack, low=3, high=3, center=np.mean):
+    '''Return the mask of values more than low (high) standard deviations
+    below (above) the center (by default the mean, as in
+    Combiner.sigma_clipping) of each pixel.
+    '''
+    baseline = center(stack, axis=0)
+    deviation = np.std(stack, axis=0)
+    return (stack < baseline - low*deviation) | (stack > baseline + high*deviation)
+
+
+def tile_size(nframes, ncols, max_memory=256*2**20, itemsize=8):
+    '''Number of rows per tile for which the stack of nframes tiles of ncols
+    columns fits in max_memory bytes.
+    '''
+    return max(1, int(max_memory // (nframes*ncols*itemsize)))
+
+
+def tiles(nrows, tile_rows):
+    for start in range(0, nrows, tile_rows):
+        yield slice(start, min(start+tile_rows, nrows))
+
+
+def combine_frames(files, dark=None, scale=True, sigma=3, tile_rows=None,
+                   max_memory=256*2**20, verbose=False):
+    '''Median combine a list of frames (e.g. flats) tile by tile.  If dark (a
+    file or an array) is given it is subtracted from each frame first.  If scale is set each
+    frame is normalized by its mean before combining.  Unless tile_rows is
+    given, it is chosen from max_memory (bytes).  Returns the combined image
+    as a numpy array.
+    '''
+    with ExitStack() as stack:
+        frames = [stack.enter_context(fits.open(f, memmap=True))[0].data
+                  for f in files]
+        dark_data = dark
+        if isinstance(dark, str):
+            dark_data = stack.enter_context(fits.open(dark, memmap=True))[0].data
+        nrows, ncols = frames[0].shape
+        nframes = len(frames)
+        if tile_rows is None:
+            tile_rows = tile_size(nframes, ncols, max_memory=max_memory)
+        if verbose:
+            print(f'  Combining {tile_rows} rows at a time')
+
+        # First pass: mean of the unclipped values of each frame
+        scales = np.ones(nframes)
+        if scale is True:
+            sums = np.zeros(nframes)
+            counts = np.zeros(nframes)
+            for rows in tiles(nrows, tile_rows):
+                data = read_tile(frames, rows, dark=dark_data)
+                mask = clip_tile(data, low=sigma, high=sigma)
+                sums += np.sum(np.where(mask, 0, data), axis=(1,2))
+                counts += np.sum(~mask, axis=(1,2))
+            scales = counts / sums
+            if verbose:
+                for f,s in zip(files, scales):
+                    print(f'  {f}: mean = {1/s:.1f}')
+
+        # Second pass: median of the scaled, clipped values
+        combined = np.empty(frames[0].shape, dtype=np.float64)
+        for rows in tiles(nrows, tile_rows):
+            data = read_tile(frames, rows, dark=dark_data)
+            mask = clip_tile(data, low=sigma, high=sigma)
+            data *= scales[:,np.newaxis,np.newaxis]
+            data[mask] = np.nan
+            combined[rows] = np.nanmedian(data, axis=0)
+    return combined
+
+
+def combine_darks(darkfiles, tile_rows=None, max_memory=256*2**20,
+                  verbose=False):
+    '''Median combine (without scaling) a list of darks.  A single dark is
+    returned as its file name, so it is memory mapped rather than copied.
+    '''
+    if len(darkfiles) == 1:
+        return darkfiles[0]
+    return combine_frames(darkfiles, scale=False, tile_rows=tile_rows,
+                          max_memory=max_memory, verbose=verbose)
+
+
+def make_master_flat(flatfiles, darkfiles=None, output='masterflat.fits',
+                     tile_rows=None, max_memory=256*2**20, verbose=False):
+    '''Build a master flat from any number of flat frames (and darks, which
+    are combined first) with bounded memory and write it to output.
+    '''
+    dark = None
+    if darkfiles:
+        dark = combine_darks(darkfiles, tile_rows=tile_rows,
+                             max_memory=max_memory, verbose=verbose)
+    masterflat = combine_frames(flatfiles, dark=dark, scale=True,
+                                tile_rows=tile_rows, max_memory=max_memory,
+                                verbose=verbose)
+    CCDData(masterflat, unit='adu').write(output, overwrite=True)
+    return masterflat
+
+
+if __name__ == '__main__':
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    p = argparse.ArgumentParser(description='''
+    Build a master flat for slitAlign from a list of flat frames.
+    ''')
+    ## add flags
+    p.add_argument("-v", "--verbose", dest="verbose",
+        default=False, action="store_true",
+        help="Be verbose! (default = False)")
+    ## add options
+    p.add_argument("-d", "--dark", dest="darks", type=str, nargs='+',
+        help="Dark files, combined and subtracted from each flat (give the "
+             "flats first, or end the list of darks with --).")
+    p.add_argument("-o", "--output", dest="output", type=str,
+        default='masterflat.fits',
+        help="Output master flat file.")
+    p.add_argument("--tile-rows", dest="tile_rows", type=int,
+        help="Number of rows combined at a time (default from --max-memory).")
+    p.add_argument("--max-memory", dest="max_memory", type=float,
+        default=256,
+        help="Memory (MB) for the stack of one tile of all frames.")
+    ## add arguments
+    p.add_argument('flats', nargs='+',
+                   help="Flat files")
+    args = p.parse_args()
+
+    flatfiles = [os.path.expanduser(f) for f in args.flats]
+    darkfiles = [os.path.expanduser(f) for f in args.darks or []]
+    print(f'Combining {len(flatfiles)} flats in to {args.output}')
+    make_master_flat(flatfiles, darkfiles=darkfiles, output=args.output,
+                     tile_rows=args.tile_rows, max_memory=args.max_memory*2**20,
+                     verbose=args.verbose)
@@ -5,6 +5,9 @@ import sys
 import os
 import argparse
 import logging
+import time
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 
 from matplotlib import pyplot as plt
 
@@ -17,19 +20,24 @@ from astropy.modeling import models, fitting, Fittable2DModel, Parameter
 from astropy.table import Table
 from ccdproc import CCDData, combine, Combiner, flat_correct, trim_image, median_filter
 
+from timing import timer, span
+from box_geometry import sin_slit_angle, get_box_geometry
+
 
 ##-------------------------------------------------------------------------
 ## Create logger object
 ##-------------------------------------------------------------------------
 log = logging.getLogger('MyLogger')
 log.setLevel(logging.DEBUG)
-## Set up console output
+## Set up console output (once, this module may also be imported when run
+## as a script)
 LogConsoleHandler = logging.StreamHandler()
 LogConsoleHandler.setLevel(logging.DEBUG)
 LogFormat = logging.Formatter('%(asctime)s %(levelname)8s: %(message)s',
                               datefmt='%Y-%m-%d %H:%M:%S')
 LogConsoleHandler.setFormatter(LogFormat)
-log.addHandler(LogConsoleHandler)
+if len(log.handlers) == 0:
+    log.addHandler(LogConsoleHandler)
 ## Set up file output
 # LogFileName = None
 # LogFileHandler = logging.FileHandler(LogFileName)
@@ -55,19 +63,9 @@ class mosfireAlignmentBox(Fittable2DModel):
         
         Angle of slit relative to pixels is 3.78 degrees.
         '''
-        slit_angle = -3.7 # in degrees
-        x0_of_y = x_0 + (y-y_0)*np.sin(slit_angle*np.pi/180)
-        
-        x_range = np.logical_and(x >= x0_of_y - x_width / 2.,
-                                 x <= x0_of_y + x_width / 2.)
-        y_range = np.logical_and(y >= y_0 - y_width / 2.,
-                                 y <= y_0 + y_width / 2.)
-        result = np.select([np.logical_and(x_range, y_range)], [amplitude], 0)
-
-        if isinstance(amplitude, u.Quantity):
-            return Quantity(result, unit=amplitude.unit, copy=False)
-        else:
-            return result
+        inside = np.abs(x - x_0 - (y-y_0)*sin_slit_angle) <= x_width / 2.
+        inside &= np.abs(y - y_0) <= y_width / 2.
+        return inside * amplitude
 
     @property
     def input_units(self):
@@ -177,6 +175,137 @@ def fit_transforms(pixels, targets):
     return (off_X, off_Y, off_R, err_R, A)
 
 
+def solve_rigid(pixels, targets, weights, scale=False):
+    '''Least squares rotation and translation (and optionally scale) which
+    maps pixels on to targets, solved in closed form for each row of
+    weights at once.  Pixels and targets are (n, 2) arrays and weights is
+    (k, n).  Returns theta (radians), scale and translation arrays of shape
+    (k,), (k,) and (k, 2), where target = scale*R(theta)*pixel + translation.
+    '''
+    weights = np.atleast_2d(weights).astype(np.float64)
+    wsum = weights.sum(axis=1)
+    cp = np.dot(weights, pixels) / wsum[:,np.newaxis]
+    cq = np.dot(weights, targets) / wsum[:,np.newaxis]
+    P = pixels[np.newaxis,:,:] - cp[:,np.newaxis,:]
+    Q = targets[np.newaxis,:,:] - cq[:,np.newaxis,:]
+    a = np.sum(weights*(P[:,:,0]*Q[:,:,0] + P[:,:,1]*Q[:,:,1]), axis=1)
+    b = np.sum(weights*(P[:,:,0]*Q[:,:,1] - P[:,:,1]*Q[:,:,0]), axis=1)
+    theta = np.arctan2(b, a)
+    if scale is True:
+        s = np.hypot(a, b) / np.sum(weights*np.sum(P**2, axis=2), axis=1)
+    else:
+        s = np.ones(len(theta))
+    cos, sin = s*np.cos(theta), s*np.sin(theta)
+    t = np.column_stack([cq[:,0] - (cos*cp[:,0] - sin*cp[:,1]),
+                         cq[:,1] - (sin*cp[:,0] + cos*cp[:,1])])
+    return theta, s, t
+
+
+def apply_rigid(pixels, theta, s, t):
+    '''Apply each of k transforms from solve_rigid to (n, 2) pixels,
+    returning a (k, n, 2) array.
+    '''
+    cos = (s*np.cos(theta))[:,np.newaxis]
+    sin = (s*np.sin(theta))[:,np.newaxis]
+    x = pixels[np.newaxis,:,0]
+    y = pixels[np.newaxis,:,1]
+    return np.stack([cos*x - sin*y + t[:,0:1], sin*x + cos*y + t[:,1:2]], axis=2)
+
+
+def robust_fit_transforms(pixels, targets, scale=False, threshold=1.5,
+                          nsigma=3, maxiter=10):
+    '''Fit a rotation and translation (and optionally scale) from star pixel
+    positions to target pixel positions, rejecting outlying boxes.
+
+    Every pair of boxes is used as a minimal sample (RANSAC, evaluated as a
+    single vectorized batch) and the sample with the most boxes within
+    threshold pixels is kept.  The fit is then iterated on the inliers,
+    clipping boxes with residuals larger than nsigma times the rms (or the
+    threshold, whichever is larger).  Boxes with a position of None (failed
+    fits) are ignored.
+
+    Returns a dict with the offsets (pixels) and rotation (deg) in the same
+    sense as fit_transforms, their uncertainties, the affine matrix A, and
+    per box residuals (pixels, NaN for failed boxes) and inlier flags.
+    '''
+    n = len(pixels)
+    good = np.array([p is not None and t is not None
+                     and np.all(np.isfinite(p)) and np.all(np.isfinite(t))
+                     for p,t in zip(pixels, targets)], dtype=bool)
+    ngood = np.sum(good)
+    if ngood == 0:
+        raise ValueError('No alignment boxes were fit successfully')
+    fill = lambda x: np.array([x[i] if good[i] else [np.nan, np.nan]
+                               for i in range(n)], dtype=np.float64)
+    pixels = fill(pixels)
+    targets = fill(targets)
+    p = pixels[good]
+    q = targets[good]
+
+    inliers = np.ones(ngood, dtype=bool)
+    if ngood >= 3:
+        # RANSAC over all pairs of boxes
+        i, j = np.triu_indices(ngood, k=1)
+        samples = np.zeros((len(i), ngood))
+        samples[np.arange(len(i)), i] = 1
+        samples[np.arange(len(i)), j] = 1
+        theta, s, t = solve_rigid(p, q, samples, scale=scale)
+        r = np.hypot(*np.moveaxis(q[np.newaxis] - apply_rigid(p, theta, s, t), 2, 0))
+        is_in = r < threshold
+        ninliers = is_in.sum(axis=1)
+        cost = np.sum(np.where(is_in, r**2, 0), axis=1)
+        best = np.lexsort((cost, -ninliers))[0]
+        if ninliers[best] >= 2:
+            inliers = is_in[best]
+
+        # Iterative sigma clipping
+        for iteration in range(maxiter):
+            theta, s, t = solve_rigid(p, q, inliers, scale=scale)
+            r = np.hypot(*(q - apply_rigid(p, theta, s, t)[0]).T)
+            rms = np.sqrt(np.mean(r[inliers]**2))
+            new_inliers = r < max(threshold, nsigma*rms)
+            if np.sum(new_inliers) < 2 or np.all(new_inliers == inliers):
+                break
+            inliers = new_inliers
+    if ngood == 1:
+        theta, s, t = np.zeros(1), np.ones(1), q - p
+    else:
+        theta, s, t = solve_rigid(p, q, inliers, scale=scale)
+    model = apply_rigid(p, theta, s, t)[0]
+    theta, s, t = theta[0], s[0], t[0]
+
+    # Uncertainties from the scatter of the inliers
+    nin = np.sum(inliers)
+    npar = 4 if scale is True else 3
+    residuals = q - model
+    if 2*nin > npar:
+        sigma = np.sqrt(np.sum(residuals[inliers]**2) / (2*nin - npar))
+        lever = np.sum(np.sum((p[inliers] - p[inliers].mean(axis=0))**2, axis=1))
+        err_theta = sigma / np.sqrt(lever)
+        err_t = np.sqrt(sigma**2/nin + np.sum(p[inliers].mean(axis=0)**2)*err_theta**2)
+    else:
+        sigma, err_theta, err_t = np.nan, np.nan, np.nan
+
+    A = np.array([[ s*np.cos(theta), s*np.sin(theta), 0],
+                  [-s*np.sin(theta), s*np.cos(theta), 0],
+                  [t[0], t[1], 1]])
+    box_residuals = np.full((n, 2), np.nan)
+    box_residuals[good] = residuals
+    box_inliers = np.zeros(n, dtype=bool)
+    box_inliers[np.flatnonzero(good)[inliers]] = True
+    return {'Offset X': -t[0],
+            'Offset Y': -t[1],
+            'Rotation': -theta*180/np.pi,
+            'Offset Err': err_t,
+            'Rotation Err': err_theta*180/np.pi,
+            'Scale': s,
+            'rms': sigma,
+            'A': A,
+            'residuals': box_residuals,
+            'inliers': box_inliers,
+            }
+
+
 
 ##-------------------------------------------------------------------------
 ## Fit CSU Edges (copied from CSU initializer code)
@@ -242,10 +371,70 @@ def create_master_flat(filepath='../../../KeckData/MOSFIRE_FCS/',
     masterflat.write('masterflat.fits', overwrite=True)
 
 
+##-------------------------------------------------------------------------
+## Calibration Cache
+##-------------------------------------------------------------------------
+class CalibrationCache(object):
+    '''Darks and flats which have already been loaded, keyed by path and
+    modification time so that a calibration file which is rewritten on disk
+    is reloaded.
+
+    Darks are kept memory mapped.  Flats are stored as the reciprocal of the
+    flat normalized by its mean (as in ccdproc.flat_correct), so reducing an
+    image costs one subtract and one multiply.
+    '''
+    def __init__(self):
+        self.darks = {}
+        self.flats = {}
+
+    def key(self, path):
+        path = os.path.abspath(os.path.expanduser(path))
+        return path, os.stat(path).st_mtime
+
+    def get(self, entries, path, loader):
+        path, mtime = self.key(path)
+        if path not in entries or entries[path][0] != mtime:
+            log.debug(f'Loading calibration {path}')
+            with span('load calibration'):
+                entries[path] = (mtime, loader(path))
+        return entries[path][1]
+
+    def load_dark(self, path):
+        with fits.open(path, memmap=True) as hdul:
+            return hdul[0].data
+
+    def load_flat(self, path):
+        with fits.open(path, memmap=True) as hdul:
+            flat = np.asarray(hdul[0].data, dtype=np.float64)
+        with np.errstate(divide='ignore'):
+            return flat.mean() / flat
+
+    def dark(self, path):
+        return self.get(self.darks, path, self.load_dark)
+
+    def flat(self, path):
+        return self.get(self.flats, path, self.load_flat)
+
+    def clear(self):
+        self.darks = {}
+        self.flats = {}
+
+    def reduce(self, imagefile, dark=None, flat=None):
+        im = CCDData.read(imagefile, unit='adu')
+        data = im.data
+        if dark is not None:
+            data = data - self.dark(dark)
+        if flat is not None:
+            data = data * self.flat(flat)
+        return CCDData(data=data, meta=im.meta, unit=im.unit)
+
+
 ##-------------------------------------------------------------------------
 ## Reduce Image
 ##-------------------------------------------------------------------------
-def reduce_image(imagefile, dark=None, flat=None):
+def reduce_image(imagefile, dark=None, flat=None, cache=None):
+    if cache is not None:
+        return cache.reduce(imagefile, dark=dark, flat=flat)
     im = CCDData.read(imagefile, unit='adu')
     if dark is not None:
         dark = CCDData.read(dark, unit='adu')
@@ -268,6 +457,77 @@ def reduce_image(imagefile, dark=None, flat=None):
 #     return im
 
 
+##-------------------------------------------------------------------------
+## Read Alignment Boxes
+##-------------------------------------------------------------------------
+def read_alignment_boxes(imagefile, dark=None, flat=None, box_size=30,
+                         pixelscale=0.1798, cache=None, combine='mean'):
+    '''Open the image once (memory mapped), read the header and alignment box
+    table (HDU 4), and cut out each alignment box.  The dark and flat are
+    only applied to the cutouts, which are the same as trim_image on the
+    output of reduce_image with fits_section given by the box position.
+
+    If imagefile is a list of images (e.g. several short exposures of a
+    faint target with the same mask), the box positions are taken from the
+    first image and the cutouts from all of the images are combined with
+    the mean (or median if combine='median').
+    '''
+    if cache is None:
+        cache = CalibrationCache()
+    imagefiles = [imagefile] if isinstance(imagefile, str) else list(imagefile)
+    boxes = []
+    with fits.open(imagefiles[0], memmap=True) as hdul:
+        with span('read header'):
+            header = hdul[0].header
+            alignment_box_table = Table(hdul[4].data)
+
+        for box in alignment_box_table:
+            slitno = int(box['Slit_Number'])
+            bar_nos = slit_to_bars(slitno)
+            bar_pos = [header.get(f'B{b:02d}POS') for b in bar_nos]
+            box_pos = np.mean(bar_pos)
+            box_pix = physical_to_pixel([[box_pos, slitno]])[0]
+            boxat = [int(box_pix[0]), int(box_pix[1])]
+            fits_section = f'[{boxat[0]-box_size:d}:{boxat[0]+box_size:d}, '\
+                           f'{boxat[1]-box_size:d}:{boxat[1]+box_size:d}]'
+            # fits_section is 1 indexed and inclusive
+            cutout = (slice(boxat[1]-box_size-1, boxat[1]+box_size),
+                      slice(boxat[0]-box_size-1, boxat[0]+box_size))
+            boxes.append({'slit': slitno,
+                          'boxat': boxat,
+                          'fits_section': fits_section,
+                          'cutout': cutout,
+                          'targ_pos': float(box['Target_to_center_of_slit_distance'])/pixelscale,
+                          })
+
+        cutouts = [[] for box in boxes]
+        def read_cutouts(data):
+            for i,box in enumerate(boxes):
+                cutouts[i].append(np.array(data[box['cutout']], dtype=np.float64))
+
+        with span('read cutouts'):
+            read_cutouts(hdul[0].data)
+            for file in imagefiles[1:]:
+                with fits.open(file, memmap=True) as other:
+                    read_cutouts(other[0].data)
+
+    with span('calibrate'):
+        for i,box in enumerate(boxes):
+            if len(cutouts[i]) == 1:
+                region = cutouts[i][0]
+            elif combine == 'median':
+                region = np.median(cutouts[i], axis=0)
+            else:
+                region = np.mean(cutouts[i], axis=0)
+            cutout = box.pop('cutout')
+            if dark is not None:
+                region -= cache.dark(dark)[cutout]
+            if flat is not None:
+                region *= cache.flat(flat)[cutout]
+            box['region'] = CCDData(data=region, unit='adu')
+    return boxes
+
+
 ##-------------------------------------------------------------------------
 ## fit_alignment_box
 ##-------------------------------------------------------------------------
@@ -275,7 +535,8 @@ def fit_alignment_box(region, box_size=30, verbose=False, seeing=None,
                       medfilt=False):
     pixelscale = u.pixel_scale(0.1798*u.arcsec/u.pixel)
     if medfilt is True:
-        region = median_filter(region, size=(3,3))
+        with span('median_filter'):
+            region = median_filter(region, size=(3,3))
 
     # Estimate center of alignment box
     threshold_pct = 80
@@ -290,12 +551,13 @@ def fit_alignment_box(region, box_size=30, verbose=False, seeing=None,
     sky_fluctuations = np.std(region.data[window])
 
     # Detect box edges
-    gradx = np.gradient(region.data, axis=1)
-    horizontal_profile = np.sum(gradx, axis=0)
-    h_edges = fit_CSU_edges(horizontal_profile)
-    grady = np.gradient(region.data, axis=0)
-    vertical_profile = np.sum(grady, axis=1)
-    v_edges = fit_CSU_edges(vertical_profile)
+    with span('fit_CSU_edges'):
+        gradx = np.gradient(region.data, axis=1)
+        horizontal_profile = np.sum(gradx, axis=0)
+        h_edges = fit_CSU_edges(horizontal_profile)
+        grady = np.gradient(region.data, axis=0)
+        vertical_profile = np.sum(grady, axis=1)
+        v_edges = fit_CSU_edges(vertical_profile)
 
     # Estimate stellar position
     maxr = np.max(region.data)
@@ -305,8 +567,10 @@ def fit_alignment_box(region, box_size=30, verbose=False, seeing=None,
     # Build model of sky, star, & box
     boxamplitude = 1
 
+    x_width = abs(h_edges[0]-h_edges[1]) if h_edges[0] is not None else 22.5
+    y_width = abs(v_edges[0]-v_edges[1]) if v_edges[0] is not None else 36.0
     box = mosfireAlignmentBox(boxamplitude, alignment_box_position[1], alignment_box_position[0],\
-                       abs(h_edges[0]-h_edges[1]), abs(v_edges[0]-v_edges[1]))
+                       x_width, y_width)
     box.amplitude.fixed = True
     box.x_width.min = 10
     box.y_width.min = 10
@@ -357,8 +621,9 @@ def fit_alignment_box(region, box_size=30, verbose=False, seeing=None,
 #     import pdb ; pdb.set_trace()
 
     fitter = fitting.LevMarLSQFitter()
-    y, x = np.mgrid[:2*box_size+1, :2*box_size+1]
-    fit = fitter(model, x, y, region.data)
+    geometry = get_box_geometry((2*box_size+1, 2*box_size+1))
+    with span('LevMar fit'):
+        fit = fitter(model, geometry.x, geometry.y, region.data)
 
     FWHMx = 2*(2*np.log(2))**0.5*fit.x_stddev_2.value * u.pix
     FWHMy = 2*(2*np.log(2))**0.5*fit.y_stddev_2.value * u.pix
@@ -394,47 +659,104 @@ def fit_alignment_box(region, box_size=30, verbose=False, seeing=None,
     return result
 
 
-def analyze_image(imagefile, dark=None, flat=None, box_size=30, medfilt=False,
-                  plot=False, seeing=0, pixelscale=0.1798, verbose=False):
-    im = reduce_image(imagefile, dark=dark, flat=flat)
-    hdul = fits.open(imagefile)
+##-------------------------------------------------------------------------
+## fit_alignment_boxes
+##-------------------------------------------------------------------------
+def get_fitter(fitter='astropy'):
+    '''Return the box fitting function: 'astropy' for the compound model
+    fit_alignment_box or 'fast' for fit_alignment_box_fast.
+    '''
+    if fitter == 'fast':
+        from fast_fit import fit_alignment_box_fast
+        return fit_alignment_box_fast
+    return fit_alignment_box
+
+
+def timed_fit_alignment_box(region, fitter='astropy', **kwargs):
+    '''Run the box fit and return the result along with the time the fit
+    took in seconds.  A fit which raises an exception is treated as a failed
+    fit ([None]*4) so that the box is dropped rather than the whole image.
+    '''
+    fitfn = get_fitter(fitter)
+    t0 = time.perf_counter()
+    try:
+        with span(fitfn.__name__):
+            result = fitfn(region, **kwargs)
+    except Exception as e:
+        log.warning(f'Alignment box fit raised {e}')
+        result = [None]*4
+    return result, time.perf_counter() - t0
+
+
+def fit_alignment_boxes(regions, nprocesses=1, executor=None, **kwargs):
+    '''Fit each region with fit_alignment_box.  If nprocesses > 1 the boxes
+    are fit concurrently in a process pool (or in the executor given, which
+    is left running).  Results are returned in the same order as the
+    regions as a list of (result, fit time) tuples.
+    '''
+    fitfn = partial(timed_fit_alignment_box, **kwargs)
+    if executor is not None:
+        return list(executor.map(fitfn, regions))
+    elif nprocesses is None or nprocesses > 1:
+        with ProcessPoolExecutor(max_workers=nprocesses) as executor:
+            return list(executor.map(fitfn, regions))
+    else:
+        return [fitfn(region) for region in regions]
+
 
-    # Get info about alignment box positions
-    alignment_box_table = Table(hdul[4].data)
+##-------------------------------------------------------------------------
+## analyze_image
+##-------------------------------------------------------------------------
+def analyze_image(imagefile, dark=None, flat=None, box_size=30, medfilt=False,
+                  plot=False, seeing=0, pixelscale=0.1798, verbose=False,
+                  nprocesses=1, fitter='astropy', cache=None, executor=None,
+                  solver='lstsq', combine='mean'):
+    with span('read_alignment_boxes'):
+        boxes = read_alignment_boxes(imagefile, dark=dark, flat=flat,
+                                     box_size=box_size, pixelscale=pixelscale,
+                                     cache=cache, combine=combine)
+
+    # Fit alignment boxes
+    with span('fit_alignment_boxes'):
+        fits_results = fit_alignment_boxes([box['region'] for box in boxes],
+                                           nprocesses=nprocesses, executor=executor,
+                                           box_size=box_size,
+                                           verbose=False, seeing=seeing,
+                                           medfilt=medfilt, fitter=fitter)
 
     if plot == True:
         plt.figure(figsize=(16,6))
 
     pixels = []
     targets = []
-    for i,box in enumerate(alignment_box_table):
-        result = None
-        slitno = int(box['Slit_Number'])
-        bar_nos = slit_to_bars(slitno)
-        bar_pos = [hdul[0].header.get(f'B{b:02d}POS') for b in bar_nos]
-        box_pos = np.mean(bar_pos)
-        box_pix = physical_to_pixel([[box_pos, slitno]])[0]
-        boxat = [int(box_pix[0]), int(box_pix[1])]
-        fits_section = f'[{boxat[0]-box_size:d}:{boxat[0]+box_size:d}, '\
-                       f'{boxat[1]-box_size:d}:{boxat[1]+box_size:d}]'
-        region = trim_image(im, fits_section=fits_section)
-
-        targ_pos = float(box['Target_to_center_of_slit_distance'])/pixelscale
+    for i,box in enumerate(boxes):
+        result, fit_time = fits_results[i]
+        log.info(f"Alignment Box {i+1} (slit {box['slit']}) fit in {fit_time:.2f} s")
+        boxat = box['boxat']
+        region = box['region']
+        targ_pos = box['targ_pos']
 
         if plot == True:
-            plt.subplot(1,len(alignment_box_table),i+1, aspect='equal')
-            plt.title(f"Alignment Box {i+1}\n{fits_section}")
+            plt.subplot(1,len(boxes),i+1, aspect='equal')
+            plt.title(f"Alignment Box {i+1}\n{box['fits_section']}")
             plt.imshow(region.data, origin='lower',
                        vmin=np.percentile(region.data, 85)*0.95,
                        vmax=region.data.max()*1.02)
 
-#         try:
-        result = fit_alignment_box(region, box_size=box_size, verbose=False,
-                                   seeing=seeing, medfilt=medfilt)
+        box['result'] = result
+        box['fit time'] = fit_time
+        if not isinstance(result, dict):
+            log.warning(f"Alignment Box {i+1} (slit {box['slit']}) fit failed")
+            box['result'] = None
+            pixels.append(None)
+            targets.append(None)
+            if plot == True:
+                plt.xticks([], [])
+                plt.yticks([], [])
+            continue
+
         star_pix = np.array([result['Star X']+boxat[0]-box_size,
                              result['Star Y']+boxat[1]-box_size])
-        fitted_box_pix = np.array([result['Box X']+boxat[0]-box_size,
-                                   result['Box Y']+boxat[1]-box_size])
         slitang = 0.22*np.pi/180
         targ_pix_im = (result['Box X']-np.sin(slitang)*targ_pos,
                        result['Box Y']+np.cos(slitang)*targ_pos)
@@ -444,6 +766,8 @@ def analyze_image(imagefile, dark=None, flat=None, box_size=30, medfilt=False,
         targets.append(list(targ_pix))
         pix_err = targ_pix - star_pix
         pos_err = pix_err*pixelscale
+        box['star pix'] = star_pix
+        box['target pix'] = targ_pix
 
         if plot == True:
             cxy = (result['Star X'], result['Star Y'])
@@ -462,15 +786,33 @@ def analyze_image(imagefile, dark=None, flat=None, box_size=30, medfilt=False,
             print(f"  Star Position: {star_pix[0]:.1f}, {star_pix[1]:.1f}")
             print(f"  Target Position: {targ_pix[0]:.1f}, {targ_pix[1]:.1f}")
             print(f"  Position Error: {pos_err[0]:+.2f}, {pos_err[1]:+.2f} arcsec")
-#         except:
-#             print(f'Alignment Box {i+1} failed: {result}')
 
         if plot == True:
             plt.xticks([], [])
             plt.yticks([], [])
 
     # Calculate Transformation
-    off_Xpix, off_Ypix, off_R, err_R, A = fit_transforms(pixels, targets)
+    if solver == 'robust':
+        with span('robust_fit_transforms'):
+            transform = robust_fit_transforms(pixels, targets)
+        off_Xpix, off_Ypix = transform['Offset X'], transform['Offset Y']
+        off_R, err_R = transform['Rotation'], transform['Rotation Err']
+        err_XY = transform['Offset Err'] * pixelscale
+        for i,box in enumerate(boxes):
+            box['residual pix'] = transform['residuals'][i]
+            box['inlier'] = bool(transform['inliers'][i])
+            if box['result'] is not None and not box['inlier']:
+                residual = np.hypot(*transform['residuals'][i])*pixelscale
+                log.warning(f"Alignment Box {i+1} (slit {box['slit']}) rejected: "
+                            f"residual {residual:.2f} arcsec")
+    else:
+        good = [i for i,pix in enumerate(pixels) if pix is not None]
+        if len(good) == 0:
+            raise ValueError('No alignment boxes were fit successfully')
+        with span('fit_transforms'):
+            off_Xpix, off_Ypix, off_R, err_R, A = fit_transforms([pixels[i] for i in good],
+                                                                 [targets[i] for i in good])
+        err_XY = np.nan
 
     off_X = off_Xpix * pixelscale
     off_Y = off_Ypix * pixelscale
@@ -481,13 +823,84 @@ def analyze_image(imagefile, dark=None, flat=None, box_size=30, medfilt=False,
     send_R = off_R if abs(off_R) > th_R else 0
     print()
     print(f"       Calculated   Err  Send        (Threshold)")
-    print(f"Offset X =  {off_X:+.2f}       {send_X:+.2f} arcsec ({th_XY:.2f})")
-    print(f"Offset Y =  {off_Y:+.2f}       {send_Y:+.2f} arcsec ({th_XY:.2f})")
+    # The lstsq solver gives no offset error, leave the column blank
+    err_str = '    ' if np.isnan(err_XY) else f'{err_XY:.2f}'
+    print(f"Offset X =  {off_X:+.2f}  {err_str} {send_X:+.2f} arcsec ({th_XY:.2f})")
+    print(f"Offset Y =  {off_Y:+.2f}  {err_str} {send_Y:+.2f} arcsec ({th_XY:.2f})")
     print(f"Rotation = {off_R:+.3f} {err_R:.3f} {send_R:+.3f} deg   ({th_R:.3f})")
 
     if plot == True:
         plt.show()
 
+    for box in boxes:
+        box.pop('region')
+    return {'image': imagefile,
+            'Offset X': off_X,
+            'Offset Y': off_Y,
+            'Rotation': off_R,
+            'Rotation Err': err_R,
+            'Offset Err': err_XY,
+            'Send X': send_X,
+            'Send Y': send_Y,
+            'Send R': send_R,
+            'boxes': boxes,
+            }
+
+
+##-------------------------------------------------------------------------
+## AlignmentSession
+##-------------------------------------------------------------------------
+class AlignmentSession(object):
+    '''Analyze a series of alignment images (e.g. over a night of mask
+    alignments) with the same calibrations and settings.  The dark and flat
+    are loaded once in to a CalibrationCache and, if fitting in parallel,
+    the process pool is kept running between images.
+
+        with AlignmentSession(dark='dark.fits', flat='masterflat.fits') as session:
+            for imagefile in imagefiles:
+                result = session.analyze(imagefile)
+    '''
+    def __init__(self, dark=None, flat=None, box_size=30, medfilt=False,
+                 seeing=0, pixelscale=0.1798, nprocesses=1, fitter='astropy',
+                 solver='lstsq'):
+        self.dark = dark
+        self.flat = flat
+        self.settings = {'box_size': box_size,
+                         'medfilt': medfilt,
+                         'seeing': seeing,
+                         'pixelscale': pixelscale,
+                         'fitter': fitter,
+                         'solver': solver,
+                         }
+        self.cache = CalibrationCache()
+        # Import the fitter (fast_fit pulls in scipy) at startup rather than
+        # on the first image, before any worker processes are forked
+        get_fitter(fitter)
+        self.executor = None
+        if nprocesses is None or nprocesses > 1:
+            self.executor = ProcessPoolExecutor(max_workers=nprocesses)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def analyze(self, imagefile, **kwargs):
+        '''Run analyze_image on an image using the session calibrations and
+        settings.  Keyword arguments override the session settings.
+        '''
+        settings = dict(self.settings, **kwargs)
+        with span('analyze_image'):
+            return analyze_image(imagefile, dark=self.dark, flat=self.flat,
+                                 cache=self.cache, executor=self.executor,
+                                 **settings)
+
 
 if __name__ == '__main__':
     ##-------------------------------------------------------------------------
@@ -506,6 +919,13 @@ if __name__ == '__main__':
     p.add_argument("-p", "--plot", dest="plot",
         default=False, action="store_true",
         help="Generate plots?")
+    p.add_argument("--fast", dest="fast",
+        default=False, action="store_true",
+        help="Use the fast analytic box fitter.")
+    p.add_argument("--robust", dest="robust",
+        default=False, action="store_true",
+        help="Fit the offset and rotation with outlier rejection instead of a "
+             "least squares affine transform to all boxes.")
     ## add options
     p.add_argument("-d", "--dark", dest="dark", type=str,
         help="Dark file to use.")
@@ -514,9 +934,20 @@ if __name__ == '__main__':
     p.add_argument("-s", "--seeing", dest="seeing", type=float,
         default=0,
         help="Seeing in arcsec.")
+    p.add_argument("-j", "--processes", dest="processes", type=int,
+        default=1,
+        help="Number of processes used to fit alignment boxes (0 = one per CPU).")
+    p.add_argument("--profile", dest="profile", type=str,
+        choices=['table', 'json'],
+        help="Report the time spent in each stage of the analysis.")
+    p.add_argument("--cprofile", dest="cprofile", type=str,
+        help="Write cProfile statistics of the analysis to this file.")
+    p.add_argument("--combine", dest="combine", type=str,
+        default='mean', choices=['mean', 'median'],
+        help="How to stack multiple images.")
     ## add arguments
-    p.add_argument('image', type=str,
-                   help="Image file to analyze")
+    p.add_argument('image', type=str, nargs='+',
+                   help="Image file to analyze (multiple images are stacked)")
     # p.add_argument('allothers', nargs='*',
     #                help="All other arguments")
     args = p.parse_args()
@@ -525,7 +956,27 @@ if __name__ == '__main__':
         args.dark = os.path.expanduser(args.dark)
     if args.flat is not None:
         args.flat = os.path.expanduser(args.flat)
-    args.image = os.path.expanduser(args.image)
-
-    analyze_image(args.image, dark=args.dark, flat=args.flat, box_size=30,
-                  medfilt=args.medfilt, plot=args.plot, seeing=args.seeing)
+    args.image = [os.path.expanduser(image) for image in args.image]
+    if len(args.image) == 1:
+        args.image = args.image[0]
+
+    with AlignmentSession(dark=args.dark, flat=args.flat, box_size=30,
+                          medfilt=args.medfilt, seeing=args.seeing,
+                          nprocesses=args.processes if args.processes > 0 else None,
+                          fitter='fast' if args.fast else 'astropy',
+                          solver='robust' if args.robust else 'lstsq') as session:
+        if args.profile is not None:
+            timer.enable()
+        if args.cprofile is not None:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        session.analyze(args.image, plot=args.plot, combine=args.combine)
+        if args.cprofile is not None:
+            profiler.disable()
+            profiler.dump_stats(args.cprofile)
+            log.info(f'Wrote cProfile statistics to {args.cprofile}')
+        if args.profile == 'table':
+            print(timer.report_table())
+        elif args.profile == 'json':
+            print(timer.report_json())
@@ -0,0 +1,224 @@
+#!/usr/env/python
+
+## Import General Tools
+import os
+import io
+import argparse
+import logging
+import time
+from glob import glob
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from astropy.table import Table, vstack
+
+from slitAlign import log, AlignmentSession
+
+image_columns = ['image', 'status', 'offset_x', 'offset_y', 'rotation',
+                 'rotation_err', 'send_x', 'send_y', 'send_r', 'nboxes',
+                 'nfailed', 'analysis_time']
+box_columns = ['image', 'box', 'slit', 'status', 'boxat_x', 'boxat_y',
+               'star_x', 'star_y', 'box_x', 'box_y', 'star_amplitude',
+               'sky_amplitude', 'fwhm_pix', 'fwhm_arcsec', 'star_pix_x',
+               'star_pix_y', 'target_pix_x', 'target_pix_y', 'residual_x',
+               'residual_y', 'fit_time']
+
+
+##-------------------------------------------------------------------------
+## Worker
+##-------------------------------------------------------------------------
+## Each worker process holds its own AlignmentSession, so the calibrations
+## are loaded once per process (the memory mapped dark is shared through the
+## page cache) rather than once per image.
+session = None
+
+def init_worker(dark=None, flat=None, settings=None):
+    global session
+    log.setLevel(logging.WARNING)
+    session = AlignmentSession(dark=dark, flat=flat, **(settings or {}))
+
+
+def box_row(imagefile, i, box):
+    result = box.get('result', None)
+    row = {'image': imagefile, 'box': i+1, 'slit': box['slit'],
+           'boxat_x': box['boxat'][0], 'boxat_y': box['boxat'][1],
+           'fit_time': box.get('fit time', np.nan)}
+    if isinstance(result, dict):
+        row['status'] = 'ok' if box.get('inlier', True) else 'rejected'
+        row['star_x'] = result['Star X']
+        row['star_y'] = result['Star Y']
+        row['box_x'] = result['Box X']
+        row['box_y'] = result['Box Y']
+        row['star_amplitude'] = result['Star Amplitude']
+        row['sky_amplitude'] = result['Sky Amplitude']
+        row['fwhm_pix'] = result['FWHM pix']
+        row['fwhm_arcsec'] = result['FWHM arcsec'].value
+        row['star_pix_x'], row['star_pix_y'] = box['star pix']
+        row['target_pix_x'], row['target_pix_y'] = box['target pix']
+        if 'residual pix' in box:
+            row['residual_x'], row['residual_y'] = box['residual pix']
+    else:
+        row['status'] = 'failed'
+    return row
+
+
+def analyze(imagefile):
+    '''Analyze one image in a worker.  Returns the image row and a list of
+    box rows.
+    '''
+    t0 = time.perf_counter()
+    row = {'image': imagefile}
+    boxes = []
+    try:
+        with redirect_stdout(io.StringIO()):
+            result = session.analyze(imagefile)
+        row['status'] = 'ok'
+        row['offset_x'] = result['Offset X']
+        row['offset_y'] = result['Offset Y']
+        row['rotation'] = result['Rotation']
+        row['rotation_err'] = result['Rotation Err']
+        row['send_x'] = result['Send X']
+        row['send_y'] = result['Send Y']
+        row['send_r'] = result['Send R']
+        boxes = [box_row(imagefile, i, box) for i,box in enumerate(result['boxes'])]
+    except Exception as e:
+        row['status'] = f'error: {e}'
+    row['nboxes'] = len(boxes)
+    row['nfailed'] = len([box for box in boxes if box['status'] == 'failed'])
+    row['analysis_time'] = time.perf_counter() - t0
+    return row, boxes
+
+
+##-------------------------------------------------------------------------
+## Columnar output
+##-------------------------------------------------------------------------
+def make_table(rows, columns):
+    '''Build a table from a list of row dicts, filling missing numeric
+    values with NaN.
+    '''
+    data = {}
+    for col in columns:
+        values = [row.get(col, None) for row in rows]
+        if col in ['image', 'status']:
+            data[col] = np.array([str(v) for v in values], dtype=str)
+        elif col in ['box', 'slit', 'boxat_x', 'boxat_y', 'nboxes', 'nfailed']:
+            data[col] = np.array([-1 if v is None else v for v in values], dtype=int)
+        else:
+            data[col] = np.array([np.nan if v is None else v for v in values], dtype=float)
+    return Table(data, names=columns)
+
+
+def read_table(filename, columns):
+    if os.path.exists(filename):
+        return Table.read(filename)
+    return make_table([], columns)
+
+
+def save(images, boxes, image_rows, box_rows, image_file, box_file):
+    '''Append the new rows to the tables and write them out.
+    '''
+    if len(image_rows) > 0:
+        images = vstack([images, make_table(image_rows, image_columns)])
+    if len(box_rows) > 0:
+        boxes = vstack([boxes, make_table(box_rows, box_columns)])
+    images.write(image_file, overwrite=True)
+    boxes.write(box_file, overwrite=True)
+    return images, boxes
+
+
+##-------------------------------------------------------------------------
+## run_batch
+##-------------------------------------------------------------------------
+def run_batch(imagefiles, image_file='slitAlign_images.fits',
+              box_file='slitAlign_boxes.fits', nprocesses=None,
+              checkpoint=20, retry=False, dark=None, flat=None, **kwargs):
+    '''Analyze many images in a process pool and write the results to a
+    table with one row per image and a table with one row per box.
+    Keyword arguments are AlignmentSession settings.  Images already in
+    the image table are skipped (unless they errored and retry is set) and
+    the tables are written every checkpoint images, so an interrupted run
+    can be resumed.
+    '''
+    images = read_table(image_file, image_columns)
+    boxes = read_table(box_file, box_columns)
+    done = set(images['image'])
+    if retry is True:
+        redo = images['status'] != 'ok'
+        done -= set(images['image'][redo])
+        boxes = boxes[~np.isin(boxes['image'], images['image'][redo])]
+        images = images[~redo]
+    done |= set([image_file, box_file])
+    todo = [f for f in imagefiles if f not in done]
+    print(f'Analyzing {len(todo)} images ({len(set(imagefiles) & done)} already done)')
+
+    image_rows = []
+    box_rows = []
+    with ProcessPoolExecutor(max_workers=nprocesses, initializer=init_worker,
+                             initargs=(dark, flat, kwargs)) as executor:
+        results = executor.map(analyze, todo, chunksize=4)
+        for row, rows in results:
+            print(f"  {row['image']}: {row['status']} ({row['nfailed']} failed boxes)")
+            image_rows.append(row)
+            box_rows.extend(rows)
+            if len(image_rows) >= checkpoint:
+                images, boxes = save(images, boxes, image_rows, box_rows,
+                                     image_file, box_file)
+                image_rows = []
+                box_rows = []
+    images, boxes = save(images, boxes, image_rows, box_rows, image_file, box_file)
+    return images, boxes
+
+
+if __name__ == '__main__':
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    p = argparse.ArgumentParser(description='''
+    Run the slit alignment analysis over many archival images and tabulate
+    the results per image and per alignment box.
+    ''')
+    ## add flags
+    p.add_argument("--fast", dest="fast",
+        default=False, action="store_true",
+        help="Use the fast analytic box fitter.")
+    p.add_argument("--robust", dest="robust",
+        default=False, action="store_true",
+        help="Fit the offset and rotation with outlier rejection instead of a "
+             "least squares affine transform to all boxes.")
+    p.add_argument("--retry", dest="retry",
+        default=False, action="store_true",
+        help="Re-analyze images which previously failed.")
+    ## add options
+    p.add_argument("-d", "--dark", dest="dark", type=str,
+        help="Dark file to use.")
+    p.add_argument("-f", "--flat", dest="flat", type=str,
+        help="Master flat file to use.")
+    p.add_argument("-j", "--processes", dest="processes", type=int,
+        default=0,
+        help="Number of processes (0 = one per CPU).")
+    p.add_argument("-o", "--output", dest="output", type=str,
+        default='slitAlign',
+        help="Output file prefix (writes <prefix>_images.fits and <prefix>_boxes.fits).")
+    p.add_argument("--checkpoint", dest="checkpoint", type=int,
+        default=20,
+        help="Write the output tables every N images.")
+    ## add arguments
+    p.add_argument('images', nargs='+',
+                   help="Image files or glob patterns")
+    args = p.parse_args()
+
+    imagefiles = []
+    for pattern in args.images:
+        imagefiles.extend(sorted(glob(os.path.expanduser(pattern))))
+
+    run_batch(imagefiles,
+              image_file=f'{args.output}_images.fits',
+              box_file=f'{args.output}_boxes.fits',
+              nprocesses=args.processes if args.processes > 0 else None,
+              checkpoint=args.checkpoint, retry=args.retry,
+              dark=os.path.expanduser(args.dark) if args.dark else None,
+              flat=os.path.expanduser(args.flat) if args.flat else None,
+              fitter='fast' if args.fast else 'astropy',
+              solver='robust' if args.robust else 'lstsq')
@@ -0,0 +1,242 @@
+#!/usr/env/python
+
+## Import General Tools
+import os
+import argparse
+import json
+import time
+from datetime import datetime as dt
+from fnmatch import fnmatch
+
+import numpy as np
+from astropy.io import fits
+from astropy import units as u
+
+from slitAlign import log, AlignmentSession
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+
+##-------------------------------------------------------------------------
+## Identify complete alignment frames
+##-------------------------------------------------------------------------
+def is_complete(filename):
+    '''A FITS file is complete when its size is a whole number of 2880 byte
+    blocks and the data of the last HDU (per its header) ends at the end of
+    the file.
+    '''
+    try:
+        size = os.path.getsize(filename)
+        if size == 0 or size % 2880 != 0:
+            return False
+        with fits.open(filename, memmap=True) as hdul:
+            hdul.readall()
+            info = hdul[-1].fileinfo()
+    except (OSError, ValueError):
+        return False
+    return info['datLoc'] + info['datSpan'] == size
+
+
+def is_alignment_frame(filename):
+    '''MOSFIRE alignment frames have the alignment box table in HDU 4.
+    '''
+    try:
+        with fits.open(filename, memmap=True) as hdul:
+            return len(hdul) > 4 and hdul[4].data is not None\
+                   and 'Slit_Number' in hdul[4].columns.names
+    except (OSError, ValueError, AttributeError):
+        return False
+
+
+##-------------------------------------------------------------------------
+## Watch a folder for new files
+##-------------------------------------------------------------------------
+def initial_sizes(directory):
+    '''Sizes of the files already in the directory, which are not analyzed.
+    '''
+    sizes = {}
+    for filename in os.listdir(directory):
+        try:
+            sizes[filename] = os.path.getsize(os.path.join(directory, filename))
+        except OSError:
+            pass
+    return sizes
+
+
+def watch_polling(directory, pattern='*.fits', interval=0.5):
+    '''Yield new files which match pattern.  A file is yielded once its
+    size has been unchanged for one polling interval and it is complete, and
+    again if it is later rewritten with a different size.
+    '''
+    seen = initial_sizes(directory)
+    sizes = {}
+    while True:
+        for filename in sorted(os.listdir(directory)):
+            if not fnmatch(filename, pattern):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            if seen.get(filename, None) == size:
+                continue
+            if sizes.get(filename, None) == size and is_complete(path):
+                seen[filename] = size
+                sizes.pop(filename)
+                yield path
+            else:
+                sizes[filename] = size
+        time.sleep(interval)
+
+
+def watch_inotify(directory, pattern='*.fits', timeout=1000):
+    '''Yield new files which match pattern when they are closed after
+    writing (or moved in to the directory).
+    '''
+    inotify = INotify()
+    inotify.add_watch(directory, flags.CLOSE_WRITE | flags.MOVED_TO)
+    seen = initial_sizes(directory)
+    while True:
+        for event in inotify.read(timeout=timeout):
+            if not fnmatch(event.name, pattern):
+                continue
+            path = os.path.join(directory, event.name)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            if seen.get(event.name, None) != size and is_complete(path):
+                seen[event.name] = size
+                yield path
+
+
+def watch(directory, pattern='*.fits', interval=0.5, polling=False):
+    if INotify is None or polling is True:
+        log.info(f'Polling {directory} every {interval:.1f} s')
+        return watch_polling(directory, pattern=pattern, interval=interval)
+    else:
+        log.info(f'Watching {directory} with inotify')
+        return watch_inotify(directory, pattern=pattern)
+
+
+##-------------------------------------------------------------------------
+## Results
+##-------------------------------------------------------------------------
+def to_json(value):
+    '''Convert numpy and astropy values in analyze_image results for JSON.
+    '''
+    if isinstance(value, dict):
+        return {k: to_json(v) for k,v in value.items()}
+    elif isinstance(value, u.Quantity):
+        return to_json(value.value)
+    elif isinstance(value, (list, tuple, np.ndarray)):
+        return [to_json(v) for v in value]
+    elif isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def write_result(result, logfile):
+    with open(logfile, 'a') as FO:
+        FO.write(json.dumps(to_json(result)) + '\n')
+
+
+##-------------------------------------------------------------------------
+## run_daemon
+##-------------------------------------------------------------------------
+def run_daemon(directory, session, logfile='slitAlign.jsonl', pattern='*.fits',
+               interval=0.5, polling=False):
+    '''Analyze each new alignment frame written to directory and append the
+    result to logfile.
+    '''
+    for imagefile in watch(directory, pattern=pattern, interval=interval,
+                           polling=polling):
+        if not is_alignment_frame(imagefile):
+            log.debug(f'Skipping {imagefile}: no alignment boxes')
+            continue
+        log.info(f'Analyzing {imagefile}')
+        t0 = time.perf_counter()
+        try:
+            result = session.analyze(imagefile)
+        except Exception as e:
+            log.error(f'Failed to analyze {imagefile}: {e}')
+            result = {'image': imagefile, 'error': str(e)}
+        result['analyzed'] = dt.utcnow().isoformat(timespec='seconds')
+        result['analysis time'] = time.perf_counter() - t0
+        write_result(result, logfile)
+        log.info(f"Analyzed {imagefile} in {result['analysis time']:.2f} s")
+
+
+if __name__ == '__main__':
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    p = argparse.ArgumentParser(description='''
+    Watch a directory for new MOSFIRE alignment frames and analyze each one
+    as it is written.
+    ''')
+    ## add flags
+    p.add_argument("-m", "--medfilt", dest="medfilt",
+        default=False, action="store_true",
+        help="Median filter images?")
+    p.add_argument("--fast", dest="fast",
+        default=False, action="store_true",
+        help="Use the fast analytic box fitter.")
+    p.add_argument("--robust", dest="robust",
+        default=False, action="store_true",
+        help="Fit the offset and rotation with outlier rejection instead of a "
+             "least squares affine transform to all boxes.")
+    p.add_argument("--poll", dest="poll",
+        default=False, action="store_true",
+        help="Poll the directory even if inotify is available.")
+    ## add options
+    p.add_argument("-d", "--dark", dest="dark", type=str,
+        help="Dark file to use.")
+    p.add_argument("-f", "--flat", dest="flat", type=str,
+        help="Master flat file to use.")
+    p.add_argument("-s", "--seeing", dest="seeing", type=float,
+        default=0,
+        help="Seeing in arcsec.")
+    p.add_argument("-j", "--processes", dest="processes", type=int,
+        default=1,
+        help="Number of processes used to fit alignment boxes (0 = one per CPU).")
+    p.add_argument("-o", "--output", dest="output", type=str,
+        default='slitAlign.jsonl',
+        help="JSON lines file to append results to.")
+    p.add_argument("--pattern", dest="pattern", type=str,
+        default='m*.fits',
+        help="File name pattern of images to analyze.")
+    p.add_argument("--interval", dest="interval", type=float,
+        default=0.5,
+        help="Polling interval in seconds.")
+    ## add arguments
+    p.add_argument('directory', type=str,
+                   help="Directory to watch")
+    args = p.parse_args()
+
+    if args.dark is not None:
+        args.dark = os.path.expanduser(args.dark)
+    if args.flat is not None:
+        args.flat = os.path.expanduser(args.flat)
+
+    with AlignmentSession(dark=args.dark, flat=args.flat, box_size=30,
+                          medfilt=args.medfilt, seeing=args.seeing,
+                          nprocesses=args.processes if args.processes > 0 else None,
+                          fitter='fast' if args.fast else 'astropy',
+                          solver='robust' if args.robust else 'lstsq') as session:
+        # Load the calibrations before the first image arrives
+        if args.dark is not None:
+            session.cache.dark(args.dark)
+        if args.flat is not None:
+            session.cache.flat(args.flat)
+        try:
+            run_daemon(os.path.expanduser(args.directory), session,
+                       logfile=args.output, pattern=args.pattern,
+                       interval=args.interval, polling=args.poll)
+        except KeyboardInterrupt:
+            log.info('Exiting')
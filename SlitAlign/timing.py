@@ -0,0 +1,94 @@
+#!/usr/env/python
+
+## Import General Tools
+import time
+import json
+from contextlib import nullcontext
+
+
+##-------------------------------------------------------------------------
+## Timer
+##-------------------------------------------------------------------------
+class Span(object):
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.timer.stack.append(self.name)
+        # Records are created on entry so the spans dict is ordered parents
+        # first, in the order the spans were first entered
+        self.record = self.timer.spans.setdefault(tuple(self.timer.stack), [0, 0.])
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.record[1] += time.perf_counter() - self.t0
+        self.record[0] += 1
+        self.timer.stack.pop()
+
+
+class Timer(object):
+    '''Nested wall clock timings of named spans of code:
+
+        with timer.span('read'):
+            ...
+
+    Spans opened inside another span are recorded under it.  When the timer
+    is disabled (the default) span() returns a shared no-op context manager,
+    so the instrumentation costs one attribute lookup and call per span.
+    Timings are only collected in the process which enabled the timer, so
+    box fits run in a process pool appear only in their parent span.
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.stack = []
+        self.spans = {}
+        self.null_span = nullcontext()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.stack = []
+        self.spans = {}
+
+    def span(self, name):
+        if self.enabled is False:
+            return self.null_span
+        return Span(self, name)
+
+    def report(self):
+        '''Return the timings as a list of dicts in the order the spans were
+        first entered, parents before children.
+        '''
+        result = []
+        for path, (count, total) in self.spans.items():
+            parent = self.spans.get(path[:-1], None)
+            result.append({'span': '/'.join(path),
+                           'name': path[-1],
+                           'depth': len(path)-1,
+                           'count': count,
+                           'total': total,
+                           'mean': total/count if count > 0 else 0.,
+                           'fraction': total/parent[1] if parent and parent[1] > 0 else 1.0,
+                           })
+        return result
+
+    def report_table(self):
+        lines = [f"{'Span':40s} {'Count':>6s} {'Total ms':>10s} {'Mean ms':>10s} {'Frac':>6s}"]
+        for entry in self.report():
+            name = '  '*entry['depth'] + entry['name']
+            lines.append(f"{name:40s} {entry['count']:6d} {entry['total']*1000:10.2f} "
+                         f"{entry['mean']*1000:10.2f} {entry['fraction']:6.1%}")
+        return '\n'.join(lines)
+
+    def report_json(self):
+        return json.dumps(self.report(), indent=2)
+
+
+timer = Timer()
+span = timer.span
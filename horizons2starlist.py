@@ -5,71 +5,39 @@ import sys
 import os
 import argparse
 import logging
+import hashlib
+import re
+from glob import glob
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime as dt
 from datetime import timedelta as tdelta
 
-import callhorizons
+try:
+    import callhorizons
+except ImportError:
+    callhorizons = None
 
 import numpy as np
+from numpy.polynomial import Chebyshev
+from scipy.interpolate import CubicSpline
 from astropy import units as u
 from astropy.coordinates import SkyCoord
 from astropy.table import Table
 
-##-------------------------------------------------------------------------
-## Parse Command Line Arguments
-##-------------------------------------------------------------------------
-## create a parser object for understanding command-line arguments
-p = argparse.ArgumentParser(description='''
-''')
-## add flags
-p.add_argument("-v", "--verbose", dest="verbose",
-    default=False, action="store_true",
-    help="Be verbose! (default = False)")
-p.add_argument("-f", "--from", dest="fromdate",
-    help="From date for the starlist table (in ISO format)")
-p.add_argument("-t", "--to", dest="todate",
-    help="To date for the starlist table (in ISO format)")
-p.add_argument("-s", "--spacing", dest="spacing",
-    default="1h",
-    help="The spacing for each starlist entry (e.g. 1h or 15m)")
-## add arguments
-p.add_argument('name', type=str,
-               help="The name of the target compatible with JPL horizons")
-args = p.parse_args()
-
-if args.fromdate is None:
-    fromdate = dt.utcnow()
-else:
-    try:
-        fromdate = dt.strptime(args.fromdate, '%Y-%m-%dT%H:%M:%S')
-    except:
-        print('Could not parse from date')
-        raise
-
-if args.todate is None:
-    todate = dt.utcnow() + tdelta(1, 0)
-else:
-    try:
-        todate = dt.strptime(args.todate, '%Y-%m-%dT%H:%M:%S')
-    except:
-        print('Could not parse to date')
-        raise
 
 ##-------------------------------------------------------------------------
 ## Create logger object
 ##-------------------------------------------------------------------------
 log = logging.getLogger('MyLogger')
 log.setLevel(logging.DEBUG)
-## Set up console output
-LogConsoleHandler = logging.StreamHandler()
-if args.verbose is True:
-    LogConsoleHandler.setLevel(logging.DEBUG)
-else:
+if len(log.handlers) == 0:
+    ## Set up console output
+    LogConsoleHandler = logging.StreamHandler()
     LogConsoleHandler.setLevel(logging.INFO)
-LogFormat = logging.Formatter('%(asctime)s %(levelname)8s: %(message)s',
-                              datefmt='%Y-%m-%d %H:%M:%S')
-LogConsoleHandler.setFormatter(LogFormat)
-log.addHandler(LogConsoleHandler)
+    LogFormat = logging.Formatter('%(asctime)s %(levelname)8s: %(message)s',
+                                  datefmt='%Y-%m-%d %H:%M:%S')
+    LogConsoleHandler.setFormatter(LogFormat)
+    log.addHandler(LogConsoleHandler)
 ## Set up file output
 # LogFileName = None
 # LogFileHandler = logging.FileHandler(LogFileName)
@@ -79,9 +47,11 @@ log.addHandler(LogConsoleHandler)
 
 
 ##-------------------------------------------------------------------------
-## Main Program
+## Query Horizons
 ##-------------------------------------------------------------------------
-def main(name, fromdate, todate, obscode=568, spacing='1h'):
+def get_ephemerides(name, fromdate, todate, obscode=568, spacing='1h'):
+    if callhorizons is None:
+        raise ImportError('callhorizons is required to query JPL Horizons')
     log.debug(f'Querying horizons for: "{name}"')
     target = callhorizons.query(name)
     fromstr = fromdate.strftime('%Y-%m-%d %H:%M')
@@ -98,29 +68,439 @@ def main(name, fromdate, todate, obscode=568, spacing='1h'):
     tab = Table(target.data)
     if len(tab) == 0:
         log.error("ephemerides have zero length")
+    return tab
+
+
+##-------------------------------------------------------------------------
+## Ephemeris Cache
+##-------------------------------------------------------------------------
+months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+          'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+def ephemeris_times(tab):
+    '''Times of the ephemeris rows (e.g. "2024-Mar-01 00:00") as datetime64.
+    '''
+    times = np.asarray(tab['datetime'], dtype=str)
+    for i,month in enumerate(months):
+        times = np.char.replace(times, f'-{month}-', f'-{i+1:02d}-')
+    return times.astype('datetime64[s]')
+
+
+def parse_spacing(spacing):
+    '''Spacing (e.g. "1h", "15m" or "1d") as a timedelta64, or None if it
+    is not understood.
+    '''
+    match = re.match(r'^\s*(\d+)\s*([mhd])', spacing)
+    if match is None:
+        return None
+    return np.timedelta64(int(match.group(1)), match.group(2))
+
+
+class EphemerisCache(object):
+    '''Ephemerides saved on disk, keyed by (target, obscode, range, spacing).
+    A request for a time range inside a cached range is served by slicing
+    the cached ephemeris, as long as the requested start time falls on the
+    cached grid.  The key is also kept in the file so that files whose
+    hashed names collide are not mistaken for each other.
+    '''
+    def __init__(self, directory='~/.horizons_cache'):
+        self.directory = os.path.expanduser(directory)
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    def prefix(self, name, obscode, spacing):
+        key = f'{name}|{obscode}|{spacing}'
+        return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+    def filename(self, name, fromdate, todate, obscode, spacing):
+        return os.path.join(self.directory,
+                            f'{self.prefix(name, obscode, spacing)}_'
+                            f'{fromdate:%Y%m%dT%H%M}_{todate:%Y%m%dT%H%M}.ecsv')
+
+    def read(self, filename, name, obscode, spacing):
+        '''Read a cached ephemeris, or None if it is for a different key.
+        '''
+        tab = Table.read(filename, format='ascii.ecsv')
+        key = (tab.meta.get('target'), str(tab.meta.get('obscode')),
+               tab.meta.get('spacing'))
+        if key != (name, str(obscode), spacing):
+            log.warning(f'Cached ephemeris {filename} is for {key}')
+            return None
+        return tab
+
+    def get(self, name, fromdate, todate, obscode=568, spacing='1h'):
+        exact = self.filename(name, fromdate, todate, obscode, spacing)
+        if os.path.exists(exact):
+            log.debug(f'Read cached ephemeris {exact}')
+            tab = self.read(exact, name, obscode, spacing)
+            if tab is not None:
+                return tab
+        step = parse_spacing(spacing)
+        if step is None:
+            return None
+        start = np.datetime64(fromdate, 's')
+        end = np.datetime64(todate, 's')
+        pattern = os.path.join(self.directory,
+                               f'{self.prefix(name, obscode, spacing)}_*.ecsv')
+        for cached in sorted(glob(pattern)):
+            cfrom, cto = os.path.splitext(os.path.basename(cached))[0].split('_')[1:]
+            cfrom = np.datetime64(dt.strptime(cfrom, '%Y%m%dT%H%M'), 's')
+            cto = np.datetime64(dt.strptime(cto, '%Y%m%dT%H%M'), 's')
+            if cfrom <= start and end <= cto and (start - cfrom) % step == np.timedelta64(0):
+                log.debug(f'Slicing cached ephemeris {cached}')
+                tab = self.read(cached, name, obscode, spacing)
+                if tab is None:
+                    continue
+                times = ephemeris_times(tab)
+                return tab[(times >= start) & (times <= end)]
+        return None
+
+    def put(self, tab, name, fromdate, todate, obscode=568, spacing='1h'):
+        if len(tab) == 0:
+            return
+        filename = self.filename(name, fromdate, todate, obscode, spacing)
+        tab.meta['target'] = name
+        tab.meta['obscode'] = str(obscode)
+        tab.meta['spacing'] = spacing
+        tab.write(filename, format='ascii.ecsv', overwrite=True)
+
+
+def fetch_ephemerides(name, fromdate, todate, obscode=568, spacing='1h',
+                      cache=None):
+    '''Ephemeris for one target, from the cache if possible.
+    '''
+    # Horizons is queried at one minute resolution
+    fromdate = fromdate.replace(second=0, microsecond=0)
+    todate = todate.replace(second=0, microsecond=0)
+    if cache is not None:
+        tab = cache.get(name, fromdate, todate, obscode=obscode, spacing=spacing)
+        if tab is not None:
+            return tab
+    tab = get_ephemerides(name, fromdate, todate, obscode=obscode, spacing=spacing)
+    if cache is not None:
+        cache.put(tab, name, fromdate, todate, obscode=obscode, spacing=spacing)
+    return tab
+
+
+def fetch_many(names, fromdate, todate, obscode=568, spacing='1h', cache=None,
+               nthreads=4, coarse=None, method='cubic'):
+    '''Ephemerides for many targets, queried concurrently.  Returns a dict
+    keyed by target name in the order given.  Targets which fail are logged
+    and left out.  If coarse is given, ephemerides are fetched at that
+    spacing and interpolated.
+    '''
+    def fetch(name):
+        try:
+            if coarse is not None:
+                return fetch_interpolated(name, fromdate, todate, obscode=obscode,
+                                          spacing=spacing, coarse=coarse,
+                                          method=method, cache=cache)
+            return fetch_ephemerides(name, fromdate, todate, obscode=obscode,
+                                     spacing=spacing, cache=cache)
+        except Exception as e:
+            log.error(f'Failed to get ephemerides for "{name}": {e}')
+            return None
+
+    with ThreadPoolExecutor(max_workers=nthreads) as executor:
+        tabs = list(executor.map(fetch, names))
+    return {name: tab for name,tab in zip(names, tabs) if tab is not None}
+
+
+##-------------------------------------------------------------------------
+## Interpolate Ephemerides
+##-------------------------------------------------------------------------
+## A coarse ephemeris (e.g. hourly) is interpolated to the starlist spacing
+## rather than querying Horizons at the fine spacing.  RA and Dec (and their
+## rates) use a cubic spline or piecewise Chebyshev fit, V mag is linear, and
+## airmass is interpolated within each stretch of coarse nodes where the
+## target is up (so rising and setting are at the coarse resolution).
+def format_times(times):
+    '''Format datetime64 values like Horizons (e.g. "2024-Mar-01 00:00").
+    '''
+    times = np.asarray(times, dtype='datetime64[m]')
+    chars = np.datetime_as_string(times).astype('U16').view('U1').reshape(-1, 16)
+    year = chars[:,0:4].copy().view('U4').ravel()
+    day = chars[:,8:10].copy().view('U2').ravel()
+    hhmm = chars[:,11:16].copy().view('U5').ravel()
+    month = np.array(months)[times.astype('datetime64[M]').astype(int) % 12]
+    return np.char.add(np.char.add(np.char.add(np.char.add(np.char.add(np.char.add(
+                year, '-'), month), '-'), day), ' '), hhmm)
+
+
+def fit_cubic(x, y):
+    return CubicSpline(x, y)
 
+
+def fit_chebyshev(x, y, degree=7, nodes=10):
+    '''Piecewise Chebyshev fit of degree to (roughly equal) blocks of about
+    nodes intervals.
+    '''
+    nblocks = max(1, int(np.round((len(x)-1)/nodes)))
+    edges = x[np.round(np.linspace(0, len(x)-1, nblocks+1)).astype(int)]
+    fits = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        inblock = (x >= lo) & (x <= hi)
+        fits.append(Chebyshev.fit(x[inblock], y[inblock],
+                                  min(degree, np.sum(inblock)-1)))
+    def evaluate(xnew):
+        xnew = np.asarray(xnew, dtype=float)
+        block = np.clip(np.searchsorted(edges, xnew, side='right')-1, 0, len(fits)-1)
+        result = np.empty(xnew.shape)
+        for i,fit in enumerate(fits):
+            inblock = block == i
+            result[inblock] = fit(xnew[inblock])
+        return result
+    return evaluate
+
+
+fitters = {'cubic': fit_cubic, 'chebyshev': fit_chebyshev}
+
+
+def interpolate_columns(x, tab, xnew, method='cubic'):
+    '''Interpolate the ephemeris columns from times x (hours) to xnew.
+    '''
+    fitter = fitters[method]
+    ra = np.unwrap(np.asarray(tab['RA'], dtype=float), period=360)
+    result = {'RA': fitter(x, ra)(xnew) % 360}
+    for col in ['DEC', 'RA_rate', 'DEC_rate']:
+        result[col] = fitter(x, np.asarray(tab[col], dtype=float))(xnew)
+    result['V'] = np.interp(xnew, x, np.asarray(tab['V'], dtype=float))
+
+    # 1/airmass (roughly sin(altitude)) is smoother than airmass near the
+    # horizon
+    inverse = 1/np.asarray(tab['airmass'], dtype=float)
+    result['airmass'] = np.full(len(xnew), np.nan)
+    up = np.concatenate([[False], ~np.isnan(inverse), [False]]).astype(int)
+    starts = np.where(np.diff(up) == 1)[0]
+    ends = np.where(np.diff(up) == -1)[0]
+    for start, end in zip(starts, ends):
+        inside = (xnew >= x[start]) & (xnew <= x[end-1])
+        if end - start >= 4:
+            result['airmass'][inside] = 1/fitter(x[start:end], inverse[start:end])(xnew[inside])
+        else:
+            result['airmass'][inside] = 1/np.interp(xnew[inside], x[start:end], inverse[start:end])
+    return result
+
+
+def interpolation_error(tab, method='cubic'):
+    '''Estimate the interpolation error by fitting every other node of the
+    coarse ephemeris and comparing with the nodes left out.  Since those fits
+    have twice the node spacing this is a conservative bound.  Returns the
+    maximum errors in position (arcsec) and airmass.
+    '''
+    x = (ephemeris_times(tab) - ephemeris_times(tab)[0]) / np.timedelta64(1, 'h')
+    if len(x) < 9:
+        return {'position': np.nan, 'airmass': np.nan}
+    even = tab[::2]
+    odd = tab[1:-1:2]
+    xodd = x[1:-1:2]
+    predicted = interpolate_columns(x[::2], even, xodd, method=method)
+    dec = np.radians(np.asarray(odd['DEC'], dtype=float))
+    dra = (predicted['RA'] - np.asarray(odd['RA'], dtype=float) + 180) % 360 - 180
+    ddec = predicted['DEC'] - np.asarray(odd['DEC'], dtype=float)
+    position = np.hypot(dra*np.cos(dec), ddec)*3600
+    airmass = np.abs(predicted['airmass'] - np.asarray(odd['airmass'], dtype=float))
+    return {'position': np.nanmax(position),
+            'airmass': np.nanmax(airmass) if np.any(~np.isnan(airmass)) else np.nan}
+
+
+def interpolate_ephemeris(tab, fromdate, todate, spacing='1m', method='cubic'):
+    '''Ephemeris at the given spacing between fromdate and todate,
+    interpolated from a coarser ephemeris table which covers that range.
+    '''
+    times = ephemeris_times(tab)
+    step = parse_spacing(spacing)
+    start = np.datetime64(fromdate, 's')
+    newtimes = np.arange(start, np.datetime64(todate, 's') + np.timedelta64(1, 's'),
+                         step).astype('datetime64[s]')
+    newtimes = newtimes[(newtimes >= times[0]) & (newtimes <= times[-1])]
+    x = (times - times[0]) / np.timedelta64(1, 'h')
+    xnew = (newtimes - times[0]) / np.timedelta64(1, 'h')
+    result = interpolate_columns(x, tab, xnew, method=method)
+    result['datetime'] = format_times(newtimes)
+    return Table(result, names=['datetime', 'RA', 'DEC', 'RA_rate', 'DEC_rate',
+                                'V', 'airmass'])
+
+
+def fetch_interpolated(name, fromdate, todate, obscode=568, spacing='1m',
+                       coarse='1h', method='cubic', cache=None, tolerance=0.1):
+    '''Ephemeris at spacing interpolated from one fetched at the coarse
+    spacing.  The coarse range is extended to whole coarse steps plus one
+    step either side, and a warning is logged if the estimated position
+    error exceeds tolerance (arcsec).
+    '''
+    step = parse_spacing(coarse).astype('timedelta64[s]')
+    start = np.datetime64(fromdate.replace(second=0, microsecond=0), 's')
+    end = np.datetime64(todate, 's')
+    cfrom = start - (start - np.datetime64('2000-01-01T00:00:00')) % step - step
+    cto = end - (end - np.datetime64('2000-01-01T00:00:00')) % step + 2*step
+    tab = fetch_ephemerides(name, cfrom.astype(dt), cto.astype(dt),
+                            obscode=obscode, spacing=coarse, cache=cache)
+    error = interpolation_error(tab, method=method)
+    log.debug(f'  {name}: interpolation error < {error["position"]:.3f} arcsec, '
+              f'{error["airmass"]:.4f} airmass')
+    if error['position'] > tolerance:
+        log.warning(f'{name}: interpolation error bound {error["position"]:.3f} '
+                    f'arcsec exceeds {tolerance:.3f} arcsec, use a finer coarse spacing')
+    fine = interpolate_ephemeris(tab, start.astype(dt), todate, spacing=spacing,
+                                 method=method)
+    fine.meta['interpolation error'] = error
+    return fine
+
+
+##-------------------------------------------------------------------------
+## Format Starlist
+##-------------------------------------------------------------------------
+def sexagesimal(values, precision=2, sign=False):
+    '''Format an array of values (hours or degrees) as "dd mm ss.ss"
+    strings, matching SkyCoord.to_string("hmsdms", sep=" ") (including its
+    rounding of the seconds and carry in to the minutes).
+    '''
+    values = np.asarray(values, dtype=float)
+    df, d = np.modf(np.abs(values))
+    mf, m = np.modf(df*60)
+    width = 3 + precision if precision > 0 else 2
+    s = np.char.mod(f'%0{width}.{precision}f', mf*60)
+    carry = np.char.startswith(s, '60')
+    s[carry] = f'{0:0{width}.{precision}f}'
+    m = m + carry
+    d = d + (m >= 60)
+    m[m >= 60] = 0
+    result = np.char.add(np.char.add(np.char.mod('%02d ', d), np.char.mod('%02d ', m)), s)
+    if sign is True:
+        result = np.char.add(np.where(np.signbit(values), '-', '+'), result)
+    return result
+
+
+def starlist(tab, name):
+    '''Keck starlist lines for an ephemeris table, with a comment line at
+    the first time the target is down (no airmass).
+    '''
     name = name.replace("/", "")
     name = name.replace(" ", "_")
 
-    wasup = True
-    for entry in tab:
-        time = (entry['datetime'].split(' ')[1]).replace(':', '')
-        starlistname = f'{name[0:9]:s}_{time:s}'
-        if np.isnan(float(entry['airmass'])) == True:
-            if wasup == True:
-                print(f"# Target {name} is down at {time}")
-                wasup = False
-        else:
-            line = [f'{starlistname:15s}']
-            coord = SkyCoord(entry['RA'], entry['DEC'], frame='fk5', unit=(u.deg, u.deg))
-            line.append(f'{coord.to_string("hmsdms", sep=" ", precision=2)}')
-            line.append(f'{coord.equinox.jyear:.2f}')
-            line.append(f'dra={float(entry["RA_rate"])/15*3600:.3f}')
-            line.append(f'ddec={float(entry["DEC_rate"])*3600:.3f}')
-            line.append(f'vmag={float(entry["V"]):.2f}')
-            line.append(f'# airmass={float(entry["airmass"]):.2f}')
-            print(' '.join(line))
+    times = np.char.replace(np.char.partition(np.asarray(tab['datetime'], dtype=str), ' ')[:,2], ':', '')
+    airmass = np.asarray(tab['airmass'], dtype=float)
+    up = ~np.isnan(airmass)
+
+    lines = np.empty(len(tab), dtype=object)
+    if np.any(up):
+        coord = SkyCoord(np.asarray(tab['RA'], dtype=float)[up],
+                         np.asarray(tab['DEC'], dtype=float)[up],
+                         frame='fk5', unit=(u.deg, u.deg))
+        fields = [np.char.mod('%-15s', np.char.add(f'{name[0:9]:s}_', times[up])),
+                  np.char.add(np.char.add(sexagesimal(coord.ra.hour), ' '),
+                              sexagesimal(coord.dec.deg, sign=True)),
+                  np.full(np.sum(up), f'{coord.equinox.jyear:.2f}'),
+                  np.char.mod('dra=%.3f', np.asarray(tab['RA_rate'], dtype=float)[up]/15*3600),
+                  np.char.mod('ddec=%.3f', np.asarray(tab['DEC_rate'], dtype=float)[up]*3600),
+                  np.char.mod('vmag=%.2f', np.asarray(tab['V'], dtype=float)[up]),
+                  np.char.mod('# airmass=%.2f', airmass[up]),
+                  ]
+        line = fields[0]
+        for field in fields[1:]:
+            line = np.char.add(np.char.add(line, ' '), field)
+        lines[up] = line
+    if not np.all(up):
+        down = np.argmin(up)
+        lines[down] = f"# Target {name} is down at {times[down]}"
+    return [line for line in lines if line is not None]
+
+
+##-------------------------------------------------------------------------
+## Main Program
+##-------------------------------------------------------------------------
+def main(names, fromdate, todate, obscode=568, spacing='1h', output=None,
+         cache=None, nthreads=4, coarse=None, method='cubic'):
+    if isinstance(names, str):
+        names = [names]
+    tabs = fetch_many(names, fromdate, todate, obscode=obscode, spacing=spacing,
+                      cache=cache, nthreads=nthreads, coarse=coarse,
+                      method=method)
+    lines = []
+    for name, tab in tabs.items():
+        lines.extend(starlist(tab, name))
+    contents = ''.join([line + '\n' for line in lines])
+    if output is None:
+        sys.stdout.write(contents)
+    else:
+        with open(output, 'w') as FO:
+            FO.write(contents)
 
 
 if __name__ == '__main__':
-    main(args.name, fromdate, todate, spacing=args.spacing)
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    ## create a parser object for understanding command-line arguments
+    p = argparse.ArgumentParser(description='''
+    ''')
+    ## add flags
+    p.add_argument("-v", "--verbose", dest="verbose",
+        default=False, action="store_true",
+        help="Be verbose! (default = False)")
+    p.add_argument("-f", "--from", dest="fromdate",
+        help="From date for the starlist table (in ISO format)")
+    p.add_argument("-t", "--to", dest="todate",
+        help="To date for the starlist table (in ISO format)")
+    p.add_argument("-s", "--spacing", dest="spacing",
+        default="1h",
+        help="The spacing for each starlist entry (e.g. 1h or 15m)")
+    p.add_argument("-o", "--output", dest="output",
+        help="Write the starlist to this file instead of stdout")
+    p.add_argument("--targets", dest="targets",
+        help="File with the names of more targets, one per line")
+    p.add_argument("--cache-dir", dest="cache_dir",
+        default='~/.horizons_cache',
+        help="Directory in which to cache ephemerides")
+    p.add_argument("--no-cache", dest="nocache",
+        default=False, action="store_true",
+        help="Do not read or write the ephemeris cache")
+    p.add_argument("-j", "--threads", dest="threads", type=int,
+        default=4,
+        help="Number of concurrent Horizons queries")
+    p.add_argument("-i", "--interpolate", dest="coarse",
+        help="Query Horizons at this coarser spacing (e.g. 1h) and interpolate")
+    p.add_argument("--method", dest="method",
+        default='cubic', choices=['cubic', 'chebyshev'],
+        help="Interpolation method")
+    ## add arguments
+    p.add_argument('names', type=str, nargs='*',
+                   help="The names of the targets compatible with JPL horizons")
+    args = p.parse_args()
+
+    names = list(args.names)
+    if args.targets is not None:
+        with open(args.targets, 'r') as FO:
+            names.extend([line.strip() for line in FO
+                          if line.strip() != '' and not line.startswith('#')])
+    if len(names) == 0:
+        p.error('No targets given')
+
+    if args.verbose is True:
+        for handler in log.handlers:
+            handler.setLevel(logging.DEBUG)
+
+    if args.fromdate is None:
+        fromdate = dt.utcnow()
+    else:
+        try:
+            fromdate = dt.strptime(args.fromdate, '%Y-%m-%dT%H:%M:%S')
+        except:
+            print('Could not parse from date')
+            raise
+
+    if args.todate is None:
+        todate = dt.utcnow() + tdelta(1, 0)
+    else:
+        try:
+            todate = dt.strptime(args.todate, '%Y-%m-%dT%H:%M:%S')
+        except:
+            print('Could not parse to date')
+            raise
+
+    cache = None if args.nocache is True else EphemerisCache(args.cache_dir)
+    main(names, fromdate, todate, spacing=args.spacing, output=args.output,
+         cache=cache, nthreads=args.threads, coarse=args.coarse,
+         method=args.method)
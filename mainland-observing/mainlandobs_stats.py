@@ -1,21 +1,127 @@
 import sys
-import os
+import argparse
+from pathlib import Path
 
-from datetime import datetime as dt
+import numpy as np
+from astropy.table import Table, Column
 
-import pymysql
-import pymysql.cursors
+from schedule_db import ScheduleDB
 
-import numpy as np
-from astropy.table import Table, Column, vstack
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from utils.reporting import pyplot, render
+
+
+names = ['Status', 'Telescope', 'ReqNo', 'AllocInst', 'Site', 'Instrument', 'Portion', 'FromDate', 'Mode', 'NumNights', 'Principal']
+dtypes = ['a20', 'a8', 'i8', 'a20', 'a20', 'a20', 'a20', 'a20', 'a20', 'i4', 'a40']
+
+## Weight
+count = {'Full Night': 1, 'Full': 1, 'First Half': 0.5, 'Second Half': 0.5,
+         'Other': 0, 'K1': 1, 'K2': 1, 'K1+K2': 2, 'None': 0}
+
+
+## ------------------------------------------------------------------------
+## Query
+## ------------------------------------------------------------------------
+def semester_of(dates):
+    '''Semester (e.g. 2005.5 for 2005B, which runs 2005-08-01 to 2006-01-31)
+    of an array of YYYY-MM-DD date strings.
+    '''
+    dates = np.asarray(dates).astype('datetime64[D]')
+    year = dates.astype('datetime64[Y]').astype(int) + 1970
+    month = dates.astype('datetime64[M]').astype(int) % 12 + 1
+    return np.where(month >= 8, year + 0.5, np.where(month >= 2, year, year - 0.5))
+
+
+def fetch_requests(db, date1, date2, chunk_size=1000):
+    '''Fetch all approved mainland observing requests with FromDate between
+    date1 and date2 from a ScheduleDB in a single parameterized query and
+    return them as a Table with a Semester column.  Rows are streamed from
+    the server in chunks and the table is built once at the end.
+    '''
+    sql = (f"select {','.join(names)} from mainlandObs "
+           "where FromDate between %s and %s "
+           f"and status = 'approved' order by FromDate")
+    columns = [[] for name in names]
+    for colnames, rows in db.query(sql, (date1, date2), chunk_size=chunk_size):
+        for i,column in enumerate(zip(*rows)):
+            columns[i].extend(column)
+
+    iFromDate = names.index('FromDate')
+    columns[iFromDate] = [str(date)[:10] for date in columns[iFromDate]]
+    tab = Table([np.array(column, dtype=dtype) if len(column) > 0
+                 else np.zeros(0, dtype=dtype)
+                 for column, dtype in zip(columns, dtypes)], names=names)
+    tab.add_column(Column(semester_of(tab['FromDate'].astype(str)),
+                          name='Semester', dtype='f4'))
+    return tab
+
+
+def lookup(column, mapping):
+    '''Vectorized mapping of the values in a string column through a dict.
+    '''
+    values, inverse = np.unique(np.asarray(column).astype(str), return_inverse=True)
+    return np.array([mapping[value] for value in values], dtype=float)[inverse]
+
+
+def add_weights(tab):
+    '''Add the Weight (nights, scaled by portion of night) and Unscaled
+    Weight columns.
+    '''
+    telescope = lookup(tab['Telescope'], count)
+    portion = lookup(tab['Portion'], count)
+    nights = np.asarray(tab['NumNights'], dtype=float)
+    tab.add_column(Column(telescope * portion * nights, name='Weight'))
+    tab.add_column(Column(telescope * nights, name='Unscaled Weight'))
+    return tab
+
+
+def first_use(tab, modes=('Eavesdrop', 'Mainland Only')):
+    '''Table of the first FromDate on which each site was used in each mode
+    ('-' if never), in a single pass over the requests sorted by FromDate.
+    Sites appear in the order in which they were first used.
+    '''
+    first = {}
+    for sites, mode, date in zip(tab['Site'].astype(str), tab['Mode'].astype(str),
+                                 tab['FromDate'].astype(str)):
+        if mode not in modes:
+            continue
+        for site in sites.split(' '):
+            if site != 'Other':
+                first.setdefault(site, {}).setdefault(mode, date)
+    sitenames = list(first.keys())
+    return Table([np.array(sitenames, dtype='a20')]
+                 + [np.array([first[site].get(mode, '-') for site in sitenames],
+                             dtype='a10') for mode in modes],
+                 names=('Site',) + tuple(modes))
+
+
+def plot_use_by_semester(stab):
+    '''Bar chart of Mainland Only and Eavesdrop nights by semester.
+    '''
+    plt = pyplot()
+    plt.figure(figsize=(16,9), dpi=300)
+    ax1 = plt.gca()
+    plt.bar(stab['Semester'], stab['Mainland Only Nights'],
+            width=0.4, color='b', alpha=0.9, label='Mainland Only')
+    plt.bar(stab['Semester'], stab['Mainland Only Nights']+stab['Eavesdrop Nights'],
+            width=0.4, color='b', alpha=0.3, label='Eavesdrop')
+    plt.ylim(0,300)
+    plt.xticks(np.arange(2006, 2034), ["{:02d}".format(x-2000) for x in np.arange(2006, 2034)])
+    plt.xlim(2006, 2018.5)
+    plt.grid(axis='x')
+    plt.xlabel('Semester')
+    plt.ylabel('Nights')
+
+    plt.legend(loc='best')
+
+    ax2 = ax1.twinx()
+    plt.ylabel('Fraction of Total Nights')
+    plt.ylim(0,300./365.*2./2.)
+    plt.grid(axis='y')
 
-import matplotlib as mpl
-mpl.rcParams['font.size'] = 24
-import matplotlib.pyplot as plt
 
-def main():
+def main(dsn=None, fmt='png'):
 
-    colormap = plt.cm.gist_ncar
     semesters = {2005.5: ('2005-08-01', '2006-01-31'),
                  2006.0: ('2006-02-01', '2006-07-31'),
                  2006.5: ('2006-08-01', '2007-01-31'),
@@ -49,43 +155,14 @@ def main():
 #     if not os.path.exists(table_file):
     print('Querying SQL Database')
 
-    # Connect to the database
-    connection = pymysql.connect(host='mysqlserver',
-                                 user='sched',
-                                 password='sched',
-                                 db='schedules',
-                                 cursorclass=pymysql.cursors.DictCursor)
-
-    names = ['Status', 'Telescope', 'ReqNo', 'AllocInst', 'Site', 'Instrument', 'Portion', 'FromDate', 'Mode', 'NumNights', 'Principal']
-    dtypes = ['a20', 'a8', 'i8', 'a20', 'a20', 'a20', 'a20', 'a20', 'a20', 'i4', 'a40']
-
-    try:
-        tab = None
-        for semester in sorted(semesters.keys()):
-            fields = "ReqNo,FromDate,NumNights,Portion,Telescope,Instrument,AllocInst,Site,Mode,Principal,Status"
-            table = "mainlandObs"
-            date1, date2 = semesters[semester]
-            conditions = ["FromDate between '{}' and '{}'".format(date1, date2),
-                          "status = 'approved'"]
-            condition = "where {}".format(" and ".join(conditions))
-            sql = "select {} from {} {}".format(fields, table, condition)
-            with connection.cursor() as cursor:
-                cursor.execute(sql)
-                result = cursor.fetchall()
-                print('{}: found {:d} mainland requests'.format(semester, len(result)))
-            
-                if len(result) > 0:
-                    new = Table(result, names=names, dtype=dtypes)
-                    sem = Column([semester]*len(new), name='Semester', dtype='f4')
-                    new.add_column(sem)
-                    if not tab:
-                        tab = new
-                    else:
-                        tab = vstack([tab, new])
-            
-
-    finally:
-        connection.close()
+    first = sorted(semesters.keys())[0]
+    last = sorted(semesters.keys())[-1]
+    with ScheduleDB(dsn) as db:
+        tab = fetch_requests(db, semesters[first][0], semesters[last][1])
+
+    for semester in sorted(semesters.keys()):
+        nrequests = np.sum(tab['Semester'] == semester)
+        print('{}: found {:d} mainland requests'.format(semester, nrequests))
 
 #     tab.write(table_file)
 
@@ -96,13 +173,7 @@ def main():
     ## Do not use 2017A semester requests
 #     tab.remove_rows(tab['Semester'] == 2017.0)
 
-    ## Weight
-    count = {'Full Night': 1, 'Full': 1, 'First Half': 0.5, 'Second Half': 0.5,
-             'Other': 0, 'K1': 1, 'K2': 1, 'K1+K2': 2, 'None': 0}
-    weight = [ count[x['Telescope']] * count[x['Portion']] * float(x['NumNights']) for x in tab ]
-    unscaledweight = [ count[x['Telescope']] * float(x['NumNights']) for x in tab ]
-    tab.add_column(Column(weight, name='Weight'))
-    tab.add_column(Column(unscaledweight, name='Unscaled Weight'))
+    add_weights(tab)
 
 #     print(tab[tab['Site'] == 'ANU'])
 
@@ -110,19 +181,7 @@ def main():
     ## Number of Sites Over Time
     ## ------------------------------------------------------------------------
     tab.sort('FromDate')
-    sitestab = Table(names=('Site', 'Eavesdrop', 'Mainland Only'), dtype=('a20', 'a10', 'a10'))
-
-    for i,entry in enumerate(tab):
-        sites = entry['Site'].split(' ')
-        for site in sites:
-            if site not in sitestab['Site'].data.astype(str) and site != 'Other':
-                if entry['Mode'] == 'Mainland Only':
-                    sitestab.add_row((site, '-', entry['FromDate']))
-                elif entry['Mode'] == 'Eavesdrop':
-                    sitestab.add_row((site, entry['FromDate'], '-'))
-            elif entry['Mode'] in ['Eavesdrop', 'Mainland Only']:
-                if sitestab[np.where(sitestab['Site'].data.astype(str) == site)][entry['Mode']] == b'-':
-                    sitestab[entry['Mode']][np.where(sitestab['Site'].data.astype(str) == site)] = entry['FromDate']
+    sitestab = first_use(tab)
 
     print('First use date by site and mode:')
     print(sitestab)
@@ -143,27 +202,8 @@ def main():
         eavesdrop_sum = sum(eavesdrop['Weight'])
         stab.add_row((thissemester[0]['Semester'], eavesdrop_sum, mainlandonly_sum))
 
-    plt.figure(figsize=(16,9), dpi=300)
-    ax1 = plt.gca()
-    plt.bar(stab['Semester'], stab['Mainland Only Nights'],
-            width=0.4, color='b', alpha=0.9, label='Mainland Only')
-    plt.bar(stab['Semester'], stab['Mainland Only Nights']+stab['Eavesdrop Nights'],
-            width=0.4, color='b', alpha=0.3, label='Eavesdrop')
-    plt.ylim(0,300)
-    plt.xticks(np.arange(2006, 2034), ["{:02d}".format(x-2000) for x in np.arange(2006, 2034)])
-    plt.xlim(2006, 2018.5)
-    plt.grid(axis='x')
-    plt.xlabel('Semester')
-    plt.ylabel('Nights')
-
-    plt.legend(loc='best')
-    
-    ax2 = ax1.twinx()
-    plt.ylabel('Fraction of Total Nights')
-    plt.ylim(0,300./365.*2./2.)
-    plt.grid(axis='y')
-
-    plt.savefig('use_by_semester.png', dpi=300, bbox_inches='tight', pad_inches=0.1)
+    render(plot_use_by_semester, stab, 'use_by_semester.png', fmt=fmt,
+           rc={'font.size': 24}, dpi=300, bbox_inches='tight', pad_inches=0.1)
 
 
     ## ------------------------------------------------------------------------
@@ -260,5 +300,17 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    ## create a parser object for understanding command-line arguments
+    p = argparse.ArgumentParser(description='''
+    Statistics of mainland observing requests.
+    ''')
+    p.add_argument("--dsn", dest="dsn", type=str,
+        help="Database DSN, e.g. sqlite:///mainland.sqlite for a snapshot "
+             "(default from MAINLANDOBS_DSN or ~/.mainlandobs.yml).")
+    p.add_argument("--format", dest="format", type=str,
+        default='png', choices=['png', 'svg', 'pdf', 'data'],
+        help="Output format of the plot (data writes the plotted data as JSON)")
+    args = p.parse_args()
+
+    main(dsn=args.dsn, fmt=args.format)
 
@@ -0,0 +1,154 @@
+#!/usr/env/python
+
+## Import General Tools
+import os
+import logging
+
+import yaml
+import numpy as np
+from astropy.table import Table, Column
+
+log = logging.getLogger('SiteUseAnalysis')
+
+progID_names = {'Y': 'yale',
+                'N': 'nasa',
+                'U': 'uc',
+                'C': 'caltech',
+                'H': 'uh',
+                'E': 'engineering',
+                'S': 'subaru',
+                'K': 'keck',
+                'O': 'northwestern',
+                'R': 'noirlab',
+                'W': 'swinburne',
+                'Z': 'z',
+                'D': 'd',
+                'J': 'jwst',
+                }
+
+progID_city = {'yale': 'New York',
+               'nasa': 'City and County of Denver',
+               'jwst': 'City and County of Denver',
+               'uc': 'San Francisco',
+               'caltech': 'Los Angeles',
+               'cit': 'Los Angeles',
+               'uh': 'Honolulu',
+               'engineering': 'Waimea',
+               'subaru': 'Tokyo',
+               'keck': 'Waimea',
+               'northwestern': 'Chicago',
+               'noirlab': 'City and County of Denver',
+               'swinburne': 'Melbourne',
+               'z': 'Waimea',
+               'd': 'Waimea',
+               'other': 'Waimea',
+               }
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+##-------------------------------------------------------------------------
+## Footprints by City
+##-------------------------------------------------------------------------
+def read_origin_cities(filename=os.path.join(here, 'origin_airports.txt')):
+    return list(Table.read(filename, format='ascii.csv')['City'])
+
+
+def read_footprints(filename=os.path.join(here, 'emissions_by_city.yml'),
+                    method=None, origins=None):
+    '''Round trip footprint (tCO2e) per traveller by city from the travel
+    footprint YAML file, using the mean footprint or that of one method
+    (e.g. ademe-rfi).  Each origin city (e.g. Denver) is also added under
+    its own name.  Waimea (at the summit) has no footprint.
+    '''
+    with open(filename, 'r') as FO:
+        contents = yaml.safe_load(FO)
+    if method is None:
+        cities = contents['cities']
+    else:
+        cities = contents['footprints'][method]['cities']
+    footprints = {entry['city']: entry['footprint']/1000 for entry in cities}
+    for origin in (origins or []):
+        matches = [city for city in footprints if origin in city]
+        if origin not in footprints and len(matches) == 1:
+            footprints[origin] = footprints[matches[0]]
+        elif len(matches) == 0:
+            log.warning(f'No footprint for origin city {origin}')
+    footprints['Waimea'] = 0.
+    return footprints
+
+
+##-------------------------------------------------------------------------
+## Emissions Model
+##-------------------------------------------------------------------------
+class EmissionsModel(object):
+    '''Travel emissions of HQ observers.  The footprint of the home city of
+    each program code letter is held in an array indexed by the letter, so
+    the emissions of a whole schedule are a single gather.  Observers can
+    be given their own origin cities with a dict of observer name to city.
+    '''
+    def __init__(self, filename=os.path.join(here, 'emissions_by_city.yml'),
+                 method=None, origins_file=os.path.join(here, 'origin_airports.txt'),
+                 observer_origins=None):
+        self.footprints = read_footprints(filename, method=method,
+                                          origins=read_origin_cities(origins_file))
+        self.observer_origins = observer_origins or {}
+        for observer, city in self.observer_origins.items():
+            if city not in self.footprints:
+                raise KeyError(f'No footprint for {city} (origin of {observer})')
+        self.code_emissions = np.full(128, np.nan)
+        self.code_city = np.full(128, '', dtype=object)
+        for code, progID in progID_names.items():
+            city = progID_city[progID]
+            self.code_city[ord(code)] = city
+            self.code_emissions[ord(code)] = self.footprints[city]
+
+    def codes(self, projcodes):
+        '''Index in to the code arrays of each program code letter.
+        '''
+        letters = np.char.upper(np.asarray(projcodes, dtype='U1'))
+        index = letters.view(np.int32).astype(int) % 128
+        unknown = np.isnan(self.code_emissions[index])
+        if np.any(unknown):
+            raise KeyError(f'Unknown program codes: {sorted(set(letters[unknown].tolist()))}')
+        return index
+
+    def observer_emissions(self, observers, locations, default_city):
+        '''Emissions and travel description of the HQ observers of one
+        program, using the observer's own origin city where known.
+        '''
+        cities = {}
+        for observer, location in zip(observers.split(','), locations.split(',')):
+            if location.strip() == 'HQ':
+                city = self.observer_origins.get(observer.strip(), default_city)
+                cities[city] = cities.get(city, 0) + 1
+        emissions = sum([n*self.footprints[city] for city,n in cities.items()])
+        travel = ', '.join([f'{n} x {city}' for city,n in cities.items()
+                            if self.footprints[city] > 0.001])
+        return emissions, travel
+
+    def estimate(self, sched):
+        '''Add the Travel and Emissions (tCO2e) columns to a schedule with
+        ProjCode and HQ (number of HQ observers) columns.
+        '''
+        index = self.codes(sched['ProjCode'])
+        hq = np.asarray(sched['HQ'], dtype=int)
+        epp = self.code_emissions[index]
+        emissions = hq*epp
+        travel = np.where((hq > 0) & (epp > 0.001),
+                          np.char.add(np.char.add(hq.astype(str), ' x '),
+                                      self.code_city[index].astype(str)),
+                          '')
+        if len(self.observer_origins) > 0 and 'Observers' in sched.colnames:
+            travel = travel.astype(object)
+            known = set(self.observer_origins.keys())
+            for i in np.where(hq > 0)[0]:
+                observers = set([o.strip() for o in sched['Observers'][i].split(',')])
+                if len(observers & known) > 0:
+                    emissions[i], travel[i] = self.observer_emissions(
+                            sched['Observers'][i], sched['Location'][i],
+                            self.code_city[index[i]])
+            travel = travel.astype(str)
+        sched.add_column(Column(data=travel, name='Travel'))
+        sched.add_column(Column(data=emissions, name='Emissions'))
+        return sched
@@ -0,0 +1,182 @@
+#!/usr/env/python
+
+## Import General Tools
+import os
+import argparse
+import json
+import logging
+
+import yaml
+import numpy as np
+from astropy.table import Table
+
+log = logging.getLogger('SiteUseAnalysis')
+
+group_list = ['HQ', 'UC', 'CIT', 'IfA+US', 'Australia', 'Other']
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+##-------------------------------------------------------------------------
+## Columnar Frame of Nights
+##-------------------------------------------------------------------------
+def night_frame(nights, groups=group_list):
+    '''Convert the table of nights once to arrays: datetime64 dates, total
+    observers, emissions and the count and fraction of observers in each
+    group.  Nights with no observers are dropped.
+    '''
+    counts = np.array([np.asarray(nights[group], dtype=float) for group in groups])
+    totals = counts.sum(axis=0)
+    dates = np.array(nights['Date'], dtype='datetime64[D]')
+    for date in dates[totals == 0]:
+        log.warning(f"Observer count is 0 on {date}")
+    keep = totals > 0
+    return {'dates': dates[keep],
+            'totals': totals[keep],
+            'emissions': np.asarray(nights['Emissions'], dtype=float)[keep],
+            'groups': list(groups),
+            'counts': counts[:,keep],
+            'fractions': counts[:,keep]/totals[keep],
+            }
+
+
+##-------------------------------------------------------------------------
+## Statistics
+##-------------------------------------------------------------------------
+def read_windows(filename=os.path.join(here, 'stats_windows.yml')):
+    '''Read the periods to compare, converting their dates to datetime64.
+    '''
+    with open(filename, 'r') as FO:
+        windows = yaml.safe_load(FO)
+    for kind in windows.keys():
+        for window in windows[kind]:
+            window['start'] = np.datetime64(str(window['start']), 'D')
+            window['end'] = np.datetime64(str(window['end']), 'D')
+    return windows
+
+
+def window_stats(values, mask):
+    values = values[mask]
+    if len(values) == 0:
+        return {'n': 0, 'mean': np.nan, 'median': np.nan, 'std': np.nan}
+    return {'n': int(len(values)),
+            'mean': float(np.mean(values)),
+            'median': float(np.median(values)),
+            'std': float(np.std(values))}
+
+
+def rolling_mean(values, n):
+    '''Mean over a window of n samples with the same alignment as
+    np.convolve(values, np.ones(n)/n, mode='same'), but near the ends the
+    mean is taken over the samples which exist rather than padding with
+    zeros.
+    '''
+    values = np.asarray(values, dtype=float)
+    if n <= 1 or len(values) == 0:
+        return values.copy()
+    cumsum = np.concatenate([[0.], np.cumsum(values)])
+    index = np.arange(len(values))
+    lo = np.clip(index - n//2, 0, len(values))
+    hi = np.clip(index + (n-1)//2 + 1, 0, len(values))
+    return (cumsum[hi] - cumsum[lo]) / (hi - lo)
+
+
+def compute_site_stats(nights, smoothing=1, windows=None, groups=group_list):
+    '''Statistics of site use and emissions: the smoothed series and, for
+    each window in the config, the statistics of the nightly observer count
+    (total and HQ) or emissions.
+    '''
+    if windows is None:
+        windows = read_windows()
+    frame = night_frame(nights, groups=groups)
+    dates = frame['dates']
+    iHQ = frame['groups'].index('HQ')
+
+    stats = {'smoothing': smoothing,
+             'dates': dates,
+             'groups': frame['groups'],
+             'fractions': np.array([rolling_mean(f, smoothing) for f in frame['fractions']]),
+             'totals': rolling_mean(frame['totals'], smoothing),
+             'emissions': rolling_mean(frame['emissions'], smoothing),
+             'windows': {},
+             }
+    for kind in windows.keys():
+        stats['windows'][kind] = []
+        for window in windows[kind]:
+            mask = (dates >= window['start']) & (dates <= window['end'])
+            result = dict(window)
+            if kind == 'observers':
+                result['total'] = window_stats(frame['totals'], mask)
+                result['HQ'] = window_stats(frame['counts'][iHQ], mask)
+            else:
+                result[kind] = window_stats(frame[kind], mask)
+            stats['windows'][kind].append(result)
+    return stats
+
+
+def finite(value):
+    '''Replace NaN (e.g. statistics of an empty window) with None for JSON.
+    '''
+    if isinstance(value, dict):
+        return {k: finite(v) for k,v in value.items()}
+    elif isinstance(value, list):
+        return [finite(v) for v in value]
+    elif isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def to_json(stats, series=True):
+    '''Statistics as JSON, with or without the smoothed nightly series.
+    '''
+    result = {'smoothing': stats['smoothing'],
+              'first night': str(stats['dates'][0]) if len(stats['dates']) > 0 else None,
+              'last night': str(stats['dates'][-1]) if len(stats['dates']) > 0 else None,
+              'windows': {kind: [dict(window, start=str(window['start']),
+                                      end=str(window['end']))
+                                 for window in windows]
+                          for kind, windows in stats['windows'].items()},
+              }
+    if series is True:
+        result['series'] = {'dates': [str(d) for d in stats['dates']],
+                            'totals': stats['totals'].tolist(),
+                            'emissions': stats['emissions'].tolist(),
+                            'fractions': {group: f.tolist() for group, f
+                                          in zip(stats['groups'], stats['fractions'])},
+                            }
+    return json.dumps(finite(result), indent=2, allow_nan=False, default=str)
+
+
+if __name__ == '__main__':
+    ## create a parser object for understanding command-line arguments
+    p = argparse.ArgumentParser(description='''
+    Compute site use statistics from a table of nights (as written by
+    site_use.py) without plotting, and write them as JSON.
+    ''')
+    ## add flags
+    p.add_argument("--series", dest="series",
+        default=False, action="store_true",
+        help="Include the smoothed nightly series.")
+    ## add options
+    p.add_argument("-s", "--smoothing", dest="smoothing", type=int,
+        default=30,
+        help="Number of nights to smooth over.")
+    p.add_argument("-w", "--windows", dest="windows", type=str,
+        default=os.path.join(here, 'stats_windows.yml'),
+        help="YAML file of the periods to compare.")
+    p.add_argument("-o", "--output", dest="output", type=str,
+        help="Output JSON file (default is stdout).")
+    ## add arguments
+    p.add_argument('nights', type=str,
+                   help="Table of nights (e.g. nights_from_2018-02-01.csv)")
+    args = p.parse_args()
+
+    stats = compute_site_stats(Table.read(args.nights, format='ascii.csv'),
+                               smoothing=args.smoothing,
+                               windows=read_windows(args.windows))
+    output = to_json(stats, series=args.series)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, 'w') as FO:
+            FO.write(output + '\n')
@@ -6,64 +6,33 @@ import argparse
 import logging
 import re
 from pathlib import Path
+import yaml
 import numpy as np
 from astropy.table import Table, Column, vstack
 from datetime import datetime, timedelta
 
 from telescopeSchedule import get_telsched, get_observer_info_from_lastname
+from emissions import EmissionsModel
+from site_stats import group_list, compute_site_stats, read_windows
 
-from matplotlib import pyplot as plt
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from utils.reporting import pyplot, pixel_width, decimate, render_all
 
 site_list = sorted(['ANU', 'CIT', 'UCB', 'UCD', 'UCLA', 'UCSD', 'UCI', 'UCR',
                     'Yale', 'USRA', 'NU', 'HQ', 'IfA', 'Stanford', 'Swinburne',
                     'UCSB', 'UCSC', 'IPAC'])
 site_list.append('Other')
 
-group_list = ['HQ', 'UC', 'CIT', 'IfA+US', 'Australia', 'Other']
 colors = ['r', 'b', 'y', 'k', 'k', 'g']
 alphas = [0.2, 0.4, 0.4, 0.4, 0.2, 0.4]
+figsize = (16,8)
+dpi = 100
 
 group_members = {'UC': ['UCB', 'UCD', 'UCLA', 'UCSD', 'UCI', 'UCR', 'UCSB', 'UCSC'],
                  'IfA+US': ['Yale', 'USRA', 'NU', 'IfA', 'Stanford', 'IPAC'],
                  'Australia': ['ANU', 'Swinburne'],
                 }
 
-progID_names = {'Y': 'yale',
-                'N': 'nasa',
-                'U': 'uc',
-                'C': 'caltech',
-                'H': 'uh',
-                'E': 'engineering',
-                'S': 'subaru',
-                'K': 'keck', 
-                'O': 'northwestern',
-                'R': 'noirlab',
-                'W': 'swinburne', 
-                'Z': 'z',
-                'D': 'd',
-                'J': 'jwst',
-                }
-
-progID_city = {'yale': 'New York',
-               'nasa': 'City and County of Denver',
-               'jwst': 'City and County of Denver',
-               'uc': 'San Francisco',
-               'caltech': 'Los Angeles',
-               'cit': 'Los Angeles',
-               'uh': 'Honolulu',
-               'engineering': 'Waimea',
-               'subaru': 'Tokyo',
-               'keck': 'Waimea',
-               'northwestern': 'Chicago',
-               'noirlab': 'City and County of Denver',
-               'swinburne': 'Melbourne',
-               'z': 'Waimea',
-               'd': 'Waimea',
-               'other': 'Waimea',
-               }
-
-
-
 ##-------------------------------------------------------------------------
 ## Parse Command Line Arguments
 ##-------------------------------------------------------------------------
@@ -71,6 +40,19 @@ progID_city = {'yale': 'New York',
 p = argparse.ArgumentParser(description='''
 ''')
 ## add options
+p.add_argument("--origins", dest="origins", type=str,
+    help="YAML file mapping observer names to their origin cities.")
+p.add_argument("--footprint-method", dest="method", type=str,
+    choices=['ademe-rfi', 'defra-rfi', 'my-climate-rfi'],
+    help="Footprint method (default is the mean of all methods).")
+p.add_argument("-w", "--windows", dest="windows", type=str,
+    help="YAML file of the periods to compare (default stats_windows.yml).")
+p.add_argument("--format", dest="format", type=str,
+    default='png', choices=['png', 'svg', 'pdf', 'data'],
+    help="Output format of the plots (data writes the plotted data as JSON)")
+p.add_argument("-j", "--processes", dest="processes", type=int,
+    default=1,
+    help="Number of processes used to render the plots")
 # p.add_argument("--partner", dest="partner", type=str,
 #     choices=['NASA', 'UC', 'CIT'],
 #     help="Restrict to one partner?")
@@ -169,32 +151,11 @@ def group_sites(sched):
 
 
 
-def estimate_emissions(sched):
+def estimate_emissions(sched, model=None):
     log.info('Estimating Emissions')
-    emissions_table = Table.read('emissions_by_city.csv', format='ascii.csv')
-    progID_emissions = {}
-    for progID in progID_city.keys():
-        city = progID_city[progID]
-        if city == 'Waimea':
-            progID_emissions[progID] = 0
-        else:
-            w = emissions_table['city'] == city
-            progID_emissions[progID] = float(emissions_table[w]['co2_kg']/1000)
-
-    travel = []
-    emissions = []
-    for entry in sched:
-        inst = progID_names[entry['ProjCode'][0].upper()]
-        epp = progID_emissions[inst]
-        if entry['HQ'] > 0 and epp > 0.001:
-            travel.append(f"{entry['HQ']} x {progID_city[inst]}")
-        else:
-            travel.append('')
-        emissions.append(entry['HQ']*epp)
-    sched.add_column(Column(data=travel, name='Travel'))
-    sched.add_column(Column(data=emissions, name='Emissions'))
-
-    return sched
+    if model is None:
+        model = EmissionsModel()
+    return model.estimate(sched)
 
 
 def build_table_per_night(sched):
@@ -220,92 +181,48 @@ def build_table_per_night(sched):
     return nights
 
 
-def plot_site_use(nights, smoothing=1):
-    log.info('Plotting site use')
+def window_lines(windows, key, fmt):
+    return '\n'.join([f"{w['name']} ({w['start']} to {w['end']}) " + fmt(w[key])
+                      for w in windows])
 
-    smoothing_func = np.ones(smoothing)/smoothing
-    dates = []
-    observer_totals = []
-    emissions = []
-    observer_counts = {}
-    observer_fractions = {}
-    for group in group_list:
-        observer_counts[group] = []
-        observer_fractions[group] = []
-    for night in nights:
-        observer_count = 0
-        for group in group_list:
-            observer_count += night[group]
-        if observer_count == 0:
-            print(f"Observer count is 0 on {night['Date']}")
-        else:
-            dates.append(datetime.strptime(night['Date'], '%Y-%m-%d'))
-            observer_totals.append(observer_count)
-            emissions.append(night['Emissions'])
-            for group in group_list:
-                observer_counts[group].append(night[group])
-                observer_fractions[group].append(night[group]/observer_count)
-
-    # Pre-pandemic observer count
-    pre_date_strings = ['2018-02-01', '2020-02-28']
-    pre_dates = [datetime.strptime(pre_date_strings[0], '%Y-%m-%d'),
-                 datetime.strptime(pre_date_strings[1], '%Y-%m-%d')]
-    wpre = np.where((np.array(dates) >= pre_dates[0]) & (np.array(dates) <= pre_dates[1]))
-    pre_mean_observer_count = np.mean(np.array(observer_totals)[wpre])
-    pre_median_observer_count = np.median(np.array(observer_totals)[wpre])
-    pre_std_observer_count = np.std(np.array(observer_totals)[wpre])
-    pre_mean_HQobserver_count = np.mean(np.array(observer_counts['HQ'])[wpre])
-    pre_median_HQobserver_count = np.median(np.array(observer_counts['HQ'])[wpre])
-    pre_std_HQobserver_count = np.std(np.array(observer_counts['HQ'])[wpre])
-
-    # Post-pandemic observer count
-    post_date_strings = ['2022-07-01', '2024-04-30']
-    post_dates = [datetime.strptime(post_date_strings[0], '%Y-%m-%d'),
-                  datetime.strptime(post_date_strings[1], '%Y-%m-%d')]
-    wpost = np.where((np.array(dates) >= post_dates[0]) & (np.array(dates) <= post_dates[1]))
-    post_mean_observer_count = np.mean(np.array(observer_totals)[wpost])
-    post_median_observer_count = np.median(np.array(observer_totals)[wpost])
-    post_std_observer_count = np.std(np.array(observer_totals)[wpost])
-    post_mean_HQobserver_count = np.mean(np.array(observer_counts['HQ'])[wpost])
-    post_median_HQobserver_count = np.median(np.array(observer_counts['HQ'])[wpost])
-    post_std_HQobserver_count = np.std(np.array(observer_counts['HQ'])[wpost])
 
-    HQtitle_str = (f"Site Use Over Time (data smoothed over {smoothing} nights)\n"
-                   f"Pre-pandemic ({pre_date_strings[0]} to {pre_date_strings[1]}) "
-                   f"{pre_mean_HQobserver_count:.1f} mean HQ observers per night ({pre_median_HQobserver_count:.1f} median) [std dev = {pre_std_HQobserver_count:.1f}]\n"
-                   f"Post-pandemic ({post_date_strings[0]} to {post_date_strings[1]}) "
-                   f"{post_mean_HQobserver_count:.1f} mean HQ observers per night ({post_median_HQobserver_count:.1f} median) [std dev = {post_std_HQobserver_count:.1f}]"
-                   )
-    print(HQtitle_str)
-    print()
+def figure_data(stats, key, npixels=pixel_width(figsize, dpi)):
+    '''Series for one figure, decimated to the pixel width of the figure.
+    '''
+    fractions = dict(zip(stats['groups'], stats['fractions']))
+    series = decimate(stats['dates'], stats[key],
+                      *[fractions[group] for group in group_list],
+                      npixels=npixels)
+    dates = series[0]
+    margin_days = int((dates[-1] - dates[0]).astype(int)*0.16)
+    return {'dates': dates,
+            key: series[1],
+            'fractions': dict(zip(group_list, series[2:])),
+            'windows': stats['windows']['observers' if key == 'totals' else key],
+            'xlim': [dates[0], dates[-1]+np.timedelta64(margin_days, 'D')],
+            }
 
-    title_str = (f"Site Use Over Time (data smoothed over {smoothing} nights)\n"
-                 f"Pre-pandemic ({pre_date_strings[0]} to {pre_date_strings[1]}) "
-                 f"{pre_mean_observer_count:.1f} mean observers per night ({pre_median_observer_count:.1f} median) [std dev = {pre_std_observer_count:.1f}]\n"
-                 f"Post-pandemic ({post_date_strings[0]} to {post_date_strings[1]}) "
-                 f"{post_mean_observer_count:.1f} mean observers per night ({post_median_observer_count:.1f} median) [std dev = {post_std_observer_count:.1f}]"
-                 )
-    print(title_str)
 
+def draw_site_use(data):
     log.info('Building figure')
-    plt.figure(figsize=(16,8))
-    plt.title(title_str)
+    plt = pyplot()
+    dates = data['dates']
+    plt.figure(figsize=figsize)
+    plt.title(data['title'])
     previous_fracs = np.zeros(len(dates))
     for i,group in enumerate(group_list):
-        smoothed_fractions = np.convolve(observer_fractions[group], smoothing_func, mode='same')
         plt.fill_between(dates,
                          previous_fracs,
-                         previous_fracs+smoothed_fractions,
+                         previous_fracs+data['fractions'][group],
                          facecolor=colors[i], alpha=alphas[i],
                          step='post',
                          label=group)
-        previous_fracs += smoothed_fractions
+        previous_fracs += data['fractions'][group]
     # Plot these just to get on legend
     plt.plot(dates, [-1]*len(dates), 'k-', label='N Observers')
-    plt.plot(dates, [-1]*len(dates),
-             'r-', label='Pre-pandemic\nMean', alpha=0.5)
-    plt.plot(dates, [-1]*len(dates),
-             'b-', label='Post-pandemic\nMean', alpha=0.5)
+    for w in data['windows']:
+        plt.plot(dates, [-1]*len(dates),
+                 f"{w['color']}-", label='\n'.join(w['label'].rsplit(' ', 1)), alpha=0.5)
 
     plt.grid()
     plt.ylim(0, 1.0)
@@ -323,89 +240,37 @@ def plot_site_use(nights, smoothing=1):
     plt.arrow(v3, 0, dx=0, dy=0.06, color='k')
     plt.annotate('v3.0', (v3, 0.07), color='k')
 
-    smoothed_observer_totals = np.convolve(observer_totals, smoothing_func, mode='same')
-
     cax = plt.gca().twinx()
-    cax.plot(dates, smoothed_observer_totals, 'k-', label='N Observers')
-    cax.plot(pre_dates, [pre_mean_observer_count]*2,
-             'r-', label='Pre-pandemic Mean', alpha=0.5)
-    cax.plot(post_dates, [post_mean_observer_count]*2,
-             'b-', label='Post-pandemic Mean', alpha=0.5)
+    cax.plot(dates, data['totals'], 'k-', label='N Observers')
+    for w in data['windows']:
+        cax.plot([w['start'], w['end']], [w['total']['mean']]*2,
+                 f"{w['color']}-", label=w['label'], alpha=0.5)
     cax.set_ylabel('Number of Observers per Night')
     cax.set_ylim(0, 15)
 
-    margin_frac = 0.16
-    margin_days = (max(dates) - min(dates)).days*margin_frac
-    plt.xlim(dates[0], dates[-1]+timedelta(days=margin_days))
-
-    margin_frac = 0.16
-    margin_days = (max(dates) - min(dates)).days*margin_frac
-    plt.xlim(dates[0], dates[-1]+timedelta(days=margin_days))
-
+    plt.xlim(*data['xlim'])
     log.info("Saving figure")
-    plt.savefig('Site_Use_Over_Time.png', bbox_inches='tight')
-
-    #---------------------
-    ## Emissions Plot
-    #---------------------
-
-    # Pre-pandemic emissions averages
-    pre_date_strings = ['2018-02-01', '2020-02-21']
-    pre_dates = [datetime.strptime(pre_date_strings[0], '%Y-%m-%d'),
-                  datetime.strptime(pre_date_strings[1], '%Y-%m-%d')]
-    wpre = np.where((np.array(dates) >= pre_dates[0]) & (np.array(dates) <= pre_dates[1]))
-    pre_mean_emissions = np.mean(np.array(emissions)[wpre])
-    pre_median_emissions = np.median(np.array(emissions)[wpre])
-    pre_std_emissions = np.std(np.array(emissions)[wpre])
-
-    # Shutdown emissions averages
-    sd_date_strings = ['2020-05-31', '2021-06-30']
-    sd_dates = [datetime.strptime(sd_date_strings[0], '%Y-%m-%d'),
-                  datetime.strptime(sd_date_strings[1], '%Y-%m-%d')]
-    wsd = np.where((np.array(dates) >= sd_dates[0]) & (np.array(dates) <= sd_dates[1]))
-    sd_mean_emissions = np.mean(np.array(emissions)[wsd])
-    sd_median_emissions = np.median(np.array(emissions)[wsd])
-    sd_std_emissions = np.std(np.array(emissions)[wsd])
-
-    # Post-pandemic emissions averages
-    post_date_strings = ['2022-07-01', '2024-04-30']
-    post_dates = [datetime.strptime(post_date_strings[0], '%Y-%m-%d'),
-                  datetime.strptime(post_date_strings[1], '%Y-%m-%d')]
-    wpost = np.where((np.array(dates) >= post_dates[0]) & (np.array(dates) <= post_dates[1]))
-    post_mean_emissions = np.mean(np.array(emissions)[wpost])
-    post_median_emissions = np.median(np.array(emissions)[wpost])
-    post_std_emissions = np.std(np.array(emissions)[wpost])
-
-    title_str = (f"Emissions Over Time (data smoothed over {smoothing} nights)\n"
-                 f"Pre-pandemic ({pre_date_strings[0]} to {pre_date_strings[1]}) "
-                 f"{pre_mean_emissions:.2f} tCO2e/night ({pre_mean_emissions*365:.0f} tCO2e/year)\n"
-                 f"HQ Shutdown ({sd_date_strings[0]} to {sd_date_strings[1]}) "
-                 f"{sd_mean_emissions:.2f} tCO2e/night ({sd_mean_emissions*365:.0f} tCO2e/year)\n"
-                 f"Post-pandemic ({post_date_strings[0]} to {post_date_strings[1]}) "
-                 f"{post_mean_emissions:.2f} tCO2e/night ({post_mean_emissions*365:.0f} tCO2e/year)"
-                 )
-    print(title_str)
 
+
+def draw_emissions(data):
     log.info('Building emissions figure')
-    plt.figure(figsize=(16,8))
-    plt.title(title_str)
+    plt = pyplot()
+    dates = data['dates']
+    plt.figure(figsize=figsize)
+    plt.title(data['title'])
 
-    smoothed_fractions = np.convolve(observer_fractions['HQ'], smoothing_func, mode='same')
     plt.fill_between(dates,
-                     np.zeros(len(smoothed_fractions)),
-                     smoothed_fractions,
+                     np.zeros(len(dates)),
+                     data['fractions']['HQ'],
                      facecolor=colors[0], alpha=alphas[0],
                      step='post',
                      label='HQ')
 
     # Plot these just to get on legend
     plt.plot(dates, [-1]*len(dates), 'k-', label='Emissions')
-    plt.plot(dates, [-1]*len(dates),
-             'r-', label='Pre-pandemic\nMean', alpha=0.5)
-    plt.plot(dates, [-1]*len(dates),
-             'g-', label='HQ Closed\nMean', alpha=0.5)
-    plt.plot(dates, [-1]*len(dates),
-             'b-', label='Post-pandemic\nMean', alpha=0.5)
+    for w in data['windows']:
+        plt.plot(dates, [-1]*len(dates),
+                 f"{w['color']}-", label='\n'.join(w['label'].rsplit(' ', 1)), alpha=0.5)
 
     plt.grid()
     plt.ylim(0, 1.0)
@@ -413,24 +278,49 @@ def plot_site_use(nights, smoothing=1):
     plt.legend(loc='best')
 
     cax = plt.gca().twinx()
-    smoothed_emissions = np.convolve(emissions, smoothing_func, mode='same')
-    cax.plot(dates, smoothed_emissions, 'k-',
+    cax.plot(dates, data['emissions'], 'k-',
                   label='Emissions',
                   drawstyle='steps-post')
-    cax.plot(pre_dates, [pre_mean_emissions]*2,
-             'r-', label='Pre-pandemic Mean', alpha=0.5)
-    cax.plot(sd_dates, [sd_mean_emissions]*2,
-             'g-', label='HQ Closed Mean', alpha=0.5)
-    cax.plot(post_dates, [post_mean_emissions]*2,
-             'b-', label='Post-pandemic Mean', alpha=0.5)
+    for w in data['windows']:
+        cax.plot([w['start'], w['end']], [w['emissions']['mean']]*2,
+                 f"{w['color']}-", label=w['label'], alpha=0.5)
     cax.set_ylabel('Emissions (tCO2e / night)')
 
-    margin_frac = 0.16
-    margin_days = (max(dates) - min(dates)).days*margin_frac
-    plt.xlim(dates[0], dates[-1]+timedelta(days=margin_days))
-
+    plt.xlim(*data['xlim'])
     log.info("Saving figure")
-    plt.savefig('Emissions_Over_Time.png', bbox_inches='tight')
+
+
+def plot_site_use(nights, smoothing=1, windows=None, fmt='png', processes=1):
+    log.info('Plotting site use')
+    stats = compute_site_stats(nights, smoothing=smoothing, windows=windows)
+    observer_windows = stats['windows']['observers']
+    emissions_windows = stats['windows']['emissions']
+
+    HQtitle_str = (f"Site Use Over Time (data smoothed over {smoothing} nights)\n"
+                   + window_lines(observer_windows, 'HQ',
+                        lambda s: f"{s['mean']:.1f} mean HQ observers per night ({s['median']:.1f} median) [std dev = {s['std']:.1f}]")
+                   )
+    print(HQtitle_str)
+    print()
+
+    site_use = figure_data(stats, 'totals')
+    site_use['title'] = (f"Site Use Over Time (data smoothed over {smoothing} nights)\n"
+                 + window_lines(observer_windows, 'total',
+                      lambda s: f"{s['mean']:.1f} mean observers per night ({s['median']:.1f} median) [std dev = {s['std']:.1f}]")
+                 )
+    print(site_use['title'])
+
+    emissions = figure_data(stats, 'emissions')
+    emissions['title'] = (f"Emissions Over Time (data smoothed over {smoothing} nights)\n"
+                 + window_lines(emissions_windows, 'emissions',
+                      lambda s: f"{s['mean']:.2f} tCO2e/night ({s['mean']*365:.0f} tCO2e/year)")
+                 )
+    print(emissions['title'])
+
+    render_all([(draw_site_use, site_use, 'Site_Use_Over_Time.png', {'bbox_inches': 'tight'}),
+                (draw_emissions, emissions, 'Emissions_Over_Time.png', {'bbox_inches': 'tight'}),
+                ], fmt=fmt, processes=processes)
+    return stats
 
 
 def collect_NASA_site_statistics(sched):
@@ -472,7 +362,12 @@ if __name__ == '__main__':
         log.info('Querying database')
         sched = get_sched_full(from_date=from_date)
         sched = group_sites(sched)
-        sched = estimate_emissions(sched)
+        observer_origins = None
+        if args.origins is not None:
+            with open(args.origins, 'r') as FO:
+                observer_origins = yaml.safe_load(FO)
+        model = EmissionsModel(method=args.method, observer_origins=observer_origins)
+        sched = estimate_emissions(sched, model=model)
         sched.write(file, format='ascii.csv')
         nights = build_table_per_night(sched)
         nights.write(nights_file, format='ascii.csv')
@@ -481,6 +376,8 @@ if __name__ == '__main__':
         sched = Table.read(file)
         nights = Table.read(nights_file)
 
-    plot_site_use(nights, smoothing=30)
+    windows = read_windows(args.windows) if args.windows is not None else None
+    plot_site_use(nights, smoothing=30, windows=windows,
+                  fmt=args.format, processes=args.processes)
 
     collect_NASA_site_statistics(sched)
\ No newline at end of file
@@ -0,0 +1,10 @@
+import sys
+from pathlib import Path
+
+## The tools are run as scripts from their own directories and import their
+## siblings directly, so put each of those directories on the path.
+root = Path(__file__).resolve().parents[1]
+for directory in [root, root/'mainland-observing', root/'MOSFIRE',
+                  root/'MOSFIRE'/'CSU_Odometer', root/'HIRES-history']:
+    if str(directory) not in sys.path:
+        sys.path.insert(0, str(directory))
@@ -0,0 +1,42 @@
+-- Sample of the mainlandObs table of the schedules database.
+create table mainlandObs (ReqNo integer, FromDate date, NumNights integer, Portion text, Telescope text, Instrument text, AllocInst text, Site text, Mode text, Principal text, Status text);
+insert into mainlandObs values (1, '2009-04-10', 3, 'Other', 'K1', 'HIRES', 'HIRES', 'Swinburne IfA', 'Mainland Only', 'PI0', 'approved');
+insert into mainlandObs values (2, '2008-12-27', 1, 'Other', 'K1', 'NIRC2', 'HIRES', 'ANU Caltech', 'Other', 'PI1', 'approved');
+insert into mainlandObs values (3, '2006-11-11', 1, 'Other', 'K2', 'NIRC2', 'HIRES', 'Yale', 'Eavesdrop', 'PI2', 'approved');
+insert into mainlandObs values (4, '2007-09-17', 3, 'Second Half', 'K2', 'LRIS', 'HIRES', 'Other IfA', 'Eavesdrop', 'PI3', 'approved');
+insert into mainlandObs values (5, '2008-11-15', 2, 'Full Night', 'K1', 'NIRC2', 'HIRES', 'Other', 'Mainland Only', 'PI4', 'approved');
+insert into mainlandObs values (6, '2007-07-22', 3, 'Second Half', 'K2', 'NIRC2', 'HIRES', 'UCSD Other', 'Mainland Only', 'PI5', 'approved');
+insert into mainlandObs values (7, '2007-01-05', 1, 'Full Night', 'K1', 'LRIS', 'HIRES', 'IfA', 'Other', 'PI6', 'denied');
+insert into mainlandObs values (8, '2006-04-19', 2, 'Other', 'K2', 'HIRES', 'HIRES', 'Caltech UCLA', 'Eavesdrop', 'PI0', 'approved');
+insert into mainlandObs values (9, '2009-05-09', 3, 'Second Half', 'K2', 'HIRES', 'HIRES', 'UCB Caltech', 'Other', 'PI1', 'approved');
+insert into mainlandObs values (10, '2005-11-11', 3, 'Second Half', 'K2', 'LRIS', 'HIRES', 'Caltech', 'Other', 'PI2', 'approved');
+insert into mainlandObs values (11, '2008-01-26', 2, 'Second Half', 'K1', 'HIRES', 'HIRES', 'ANU IfA', 'Mainland Only', 'PI3', 'approved');
+insert into mainlandObs values (12, '2008-10-04', 2, 'Other', 'K2', 'NIRC2', 'HIRES', 'UCSD', 'Eavesdrop', 'PI4', 'approved');
+insert into mainlandObs values (13, '2007-04-12', 1, 'Second Half', 'K2', 'NIRC2', 'HIRES', 'Caltech Yale', 'Mainland Only', 'PI5', 'approved');
+insert into mainlandObs values (14, '2007-02-08', 3, 'Full Night', 'K1', 'LRIS', 'HIRES', 'ANU UCSD', 'Mainland Only', 'PI6', 'approved');
+insert into mainlandObs values (15, '2007-06-26', 1, 'Other', 'K1+K2', 'NIRC2', 'HIRES', 'ANU Swinburne', 'Other', 'PI0', 'approved');
+insert into mainlandObs values (16, '2009-02-09', 2, 'Full Night', 'K1+K2', 'LRIS', 'HIRES', 'UCLA Caltech', 'Mainland Only', 'PI1', 'approved');
+insert into mainlandObs values (17, '2005-09-10', 3, 'Other', 'K2', 'NIRC2', 'HIRES', 'UCSD', 'Eavesdrop', 'PI2', 'approved');
+insert into mainlandObs values (18, '2007-01-01', 3, 'Full Night', 'K1+K2', 'LRIS', 'HIRES', 'UCB UCSD', 'Eavesdrop', 'PI3', 'approved');
+insert into mainlandObs values (19, '2008-07-16', 3, 'Full Night', 'K1', 'LRIS', 'HIRES', 'UCLA UCSD', 'Eavesdrop', 'PI4', 'denied');
+insert into mainlandObs values (20, '2005-08-14', 1, 'Second Half', 'K1+K2', 'NIRC2', 'HIRES', 'ANU UCSD', 'Mainland Only', 'PI5', 'approved');
+insert into mainlandObs values (21, '2007-03-25', 2, 'First Half', 'K1+K2', 'LRIS', 'HIRES', 'UCSD Swinburne', 'Eavesdrop', 'PI6', 'denied');
+insert into mainlandObs values (22, '2007-07-28', 3, 'Full Night', 'K2', 'LRIS', 'HIRES', 'Yale Other', 'Mainland Only', 'PI0', 'approved');
+insert into mainlandObs values (23, '2007-10-20', 1, 'Other', 'K2', 'LRIS', 'HIRES', 'Swinburne Other', 'Other', 'PI1', 'denied');
+insert into mainlandObs values (24, '2005-07-21', 3, 'Second Half', 'K1', 'LRIS', 'HIRES', 'Swinburne Caltech', 'Mainland Only', 'PI2', 'approved');
+insert into mainlandObs values (25, '2006-04-08', 2, 'Full Night', 'K1', 'NIRC2', 'HIRES', 'IfA', 'Eavesdrop', 'PI3', 'approved');
+insert into mainlandObs values (26, '2009-04-15', 1, 'First Half', 'K1', 'LRIS', 'HIRES', 'IfA Caltech', 'Mainland Only', 'PI4', 'approved');
+insert into mainlandObs values (27, '2006-04-22', 2, 'Other', 'K1+K2', 'LRIS', 'HIRES', 'UCB Caltech', 'Other', 'PI5', 'approved');
+insert into mainlandObs values (28, '2007-10-26', 2, 'First Half', 'K1+K2', 'LRIS', 'HIRES', 'UCSD IfA', 'Mainland Only', 'PI6', 'approved');
+insert into mainlandObs values (29, '2006-06-28', 2, 'Second Half', 'K1+K2', 'LRIS', 'HIRES', 'UCB', 'Mainland Only', 'PI0', 'denied');
+insert into mainlandObs values (30, '2008-09-19', 1, 'Second Half', 'K1+K2', 'LRIS', 'HIRES', 'Swinburne UCLA', 'Mainland Only', 'PI1', 'approved');
+insert into mainlandObs values (31, '2007-12-21', 1, 'Full Night', 'K1', 'NIRC2', 'HIRES', 'Yale', 'Mainland Only', 'PI2', 'approved');
+insert into mainlandObs values (32, '2009-02-26', 3, 'Second Half', 'K1+K2', 'NIRC2', 'HIRES', 'Swinburne Yale', 'Mainland Only', 'PI3', 'approved');
+insert into mainlandObs values (33, '2007-04-27', 3, 'Other', 'K2', 'HIRES', 'HIRES', 'UCLA UCSD', 'Eavesdrop', 'PI4', 'approved');
+insert into mainlandObs values (34, '2008-01-14', 3, 'Full Night', 'K1+K2', 'NIRC2', 'HIRES', 'UCB', 'Mainland Only', 'PI5', 'denied');
+insert into mainlandObs values (35, '2008-04-17', 1, 'Other', 'K1+K2', 'LRIS', 'HIRES', 'Other Yale', 'Other', 'PI6', 'approved');
+insert into mainlandObs values (36, '2009-01-02', 1, 'Full Night', 'K1', 'HIRES', 'HIRES', 'Caltech Other', 'Eavesdrop', 'PI0', 'approved');
+insert into mainlandObs values (37, '2006-07-14', 1, 'Other', 'K1', 'LRIS', 'HIRES', 'Yale', 'Eavesdrop', 'PI1', 'approved');
+insert into mainlandObs values (38, '2005-08-26', 1, 'Full Night', 'K1', 'LRIS', 'HIRES', 'Swinburne', 'Mainland Only', 'PI2', 'approved');
+insert into mainlandObs values (39, '2007-04-27', 3, 'Other', 'K2', 'NIRC2', 'HIRES', 'Swinburne', 'Other', 'PI3', 'approved');
+insert into mainlandObs values (40, '2008-02-16', 1, 'Full Night', 'K1+K2', 'NIRC2', 'HIRES', 'Swinburne', 'Eavesdrop', 'PI4', 'approved');
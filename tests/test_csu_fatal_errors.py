@@ -0,0 +1,51 @@
+import sys
+import json
+import importlib
+from pathlib import Path
+
+import pytest
+
+data = Path(__file__).resolve().parent / 'data'
+
+
+@pytest.fixture(scope='module')
+def csu_fatal_errors():
+    # The script parses its command line on import
+    argv = sys.argv
+    sys.argv = ['csu_fatal_errors.py', '--nodcs']
+    try:
+        yield importlib.import_module('csu_fatal_errors')
+    finally:
+        sys.argv = argv
+
+
+def test_parse_eavesdrop_log_golden(csu_fatal_errors, capsys):
+    '''The history and printed report match those of the original regex
+    per transition parser on a sample log.
+    '''
+    expected = json.load(open(data / 'csu_eavesdrop_history.json'))
+    history = csu_fatal_errors.parse_eavesdrop_log(data / 'csu_eavesdrop.log')
+    history = [{k: str(v) if k in ('begin', 'end') else v for k,v in entry.items()}
+               for entry in history]
+    assert history == expected['history']
+    assert capsys.readouterr().out == expected['printed']
+
+
+def test_parse_eavesdrop_log_edge_cases(csu_fatal_errors, capsys):
+    history = csu_fatal_errors.parse_eavesdrop_log(data / 'csu_eavesdrop.log')
+    # An empty mask name does not start a setup
+    assert history[0]['end'].strftime('%H:%M:%S') == '19:19:57'
+    # Only two digit bar numbers with numeric values count as setup targets
+    assert history[1]['status'] == 'Setup'
+    assert history[1]['nbars'] == 3
+    # Text after the value does not change it
+    assert [entry['status'] for entry in history[-3:]] == ['Moving', 'Idle', 'Error']
+
+
+def test_lookup_transition(csu_fatal_errors):
+    lookup = csu_fatal_errors.lookup_transition
+    assert lookup('Idle', 'CSUSetupMaskName', 'long2pos') == ('Setup', 'start_setup')
+    assert lookup('Idle', 'CSUSetupMaskName', '') is None
+    assert lookup('Error', 'CSUSetupMaskName', 'long2pos') is None
+    assert lookup('Moving', 'CSUStatus', 'FATAL ERROR ') == ('Error', 'fatal_error')
+    assert lookup('Idle', 'CSUStatus', 'Something else') is None
@@ -0,0 +1,153 @@
+import threading
+from datetime import datetime as dt
+
+import numpy as np
+import pytest
+
+import horizons2starlist as h2s
+
+
+class StubHorizons(object):
+    '''Local stand in for the callhorizons module.  Each query returns a
+    linear ephemeris on the requested grid, and the queries (and the order
+    in which they finish) are recorded.
+    '''
+    def __init__(self, fail=(), delays=None):
+        self.queries = []
+        self.finished = []
+        self.fail = fail
+        self.delays = delays or {}
+        self.lock = threading.Lock()
+
+    def query(self, name):
+        stub = self
+
+        class Target(object):
+            def set_epochrange(self, fromstr, tostr, spacing):
+                self.epochs = (fromstr, tostr, spacing)
+
+            def get_ephemerides(self, obscode):
+                with stub.lock:
+                    stub.queries.append((name, obscode) + self.epochs)
+                if name in stub.fail:
+                    raise RuntimeError(f'No such target {name}')
+                if name in stub.delays:
+                    stub.delays[name].wait(5)
+                fromstr, tostr, spacing = self.epochs
+                times = np.arange(np.datetime64(fromstr.replace(' ', 'T'), 's'),
+                                  np.datetime64(tostr.replace(' ', 'T'), 's') + np.timedelta64(1, 's'),
+                                  h2s.parse_spacing(spacing)).astype('datetime64[s]')
+                hours = (times - times[0]) / np.timedelta64(1, 'h')
+                offset = 10.*(sum(map(ord, name)) % 10)
+                self.data = {'datetime': h2s.format_times(times),
+                             'RA': offset + 0.01*hours,
+                             'DEC': 20. + 0.001*hours,
+                             'RA_rate': np.full(len(times), 36.),
+                             'DEC_rate': np.full(len(times), 3.6),
+                             'V': np.full(len(times), 15.),
+                             'airmass': 1.2 + 0.01*hours}
+                with stub.lock:
+                    stub.finished.append(name)
+        return Target()
+
+
+@pytest.fixture
+def horizons(monkeypatch):
+    stub = StubHorizons()
+    monkeypatch.setattr(h2s, 'callhorizons', stub)
+    return stub
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return h2s.EphemerisCache(str(tmp_path / 'cache'))
+
+
+fromdate = dt(2024, 3, 1, 6, 0)
+todate = dt(2024, 3, 2, 6, 0)
+
+
+def test_cache_miss_then_hit(horizons, cache):
+    first = h2s.fetch_ephemerides('Ceres', fromdate, todate, cache=cache)
+    assert len(horizons.queries) == 1
+    assert len(first) == 25
+    second = h2s.fetch_ephemerides('Ceres', fromdate, todate, cache=cache)
+    assert len(horizons.queries) == 1
+    assert list(second['datetime']) == list(first['datetime'])
+    assert np.allclose(second['RA'], first['RA'])
+
+
+def test_cache_key_includes_obscode_and_spacing(horizons, cache):
+    h2s.fetch_ephemerides('Ceres', fromdate, todate, cache=cache)
+    h2s.fetch_ephemerides('Ceres', fromdate, todate, obscode=500, cache=cache)
+    h2s.fetch_ephemerides('Ceres', fromdate, todate, spacing='30m', cache=cache)
+    assert len(horizons.queries) == 3
+
+
+def test_narrower_slice_from_cache(horizons, cache):
+    wide = h2s.fetch_ephemerides('Ceres', fromdate, todate, cache=cache)
+    narrow = h2s.fetch_ephemerides('Ceres', dt(2024, 3, 1, 9, 0), dt(2024, 3, 1, 12, 0),
+                                   cache=cache)
+    assert len(horizons.queries) == 1
+    assert list(narrow['datetime']) == list(wide['datetime'][3:7])
+    assert np.allclose(narrow['RA'], wide['RA'][3:7])
+
+
+def test_off_grid_slice_is_a_miss(horizons, cache):
+    h2s.fetch_ephemerides('Ceres', fromdate, todate, cache=cache)
+    h2s.fetch_ephemerides('Ceres', dt(2024, 3, 1, 9, 30), dt(2024, 3, 1, 12, 30),
+                          cache=cache)
+    assert len(horizons.queries) == 2
+
+
+def test_hash_prefix_collision(horizons, cache, monkeypatch):
+    monkeypatch.setattr(h2s.EphemerisCache, 'prefix',
+                        lambda self, name, obscode, spacing: '0'*16)
+    ceres = h2s.fetch_ephemerides('Ceres', fromdate, todate, cache=cache)
+    # Ceres's entry covers Vesta's range under the same prefix, but the target
+    # stored with it does not match, so this is treated as a miss
+    vesta = h2s.fetch_ephemerides('Vesta', dt(2024, 3, 1, 9, 0), dt(2024, 3, 1, 12, 0),
+                                  cache=cache)
+    assert len(horizons.queries) == 2
+    assert not np.allclose(vesta['RA'], ceres['RA'][3:7])
+    # Both entries are kept, and each target is served from its own
+    h2s.fetch_ephemerides('Vesta', dt(2024, 3, 1, 9, 0), dt(2024, 3, 1, 12, 0),
+                          cache=cache)
+    assert len(horizons.queries) == 2
+    h2s.fetch_ephemerides('Ceres', fromdate, todate, cache=cache)
+    assert len(horizons.queries) == 2
+
+
+def test_fetch_many_order(monkeypatch, cache):
+    # The first target finishes last
+    release = threading.Event()
+    stub = StubHorizons(delays={'Ceres': release})
+    monkeypatch.setattr(h2s, 'callhorizons', stub)
+    names = ['Ceres', 'Vesta', 'Pallas', 'Juno']
+    timer = threading.Timer(0.2, release.set)
+    timer.start()
+    tabs = h2s.fetch_many(names, fromdate, todate, cache=cache, nthreads=4)
+    timer.cancel()
+    assert list(tabs.keys()) == names
+    assert stub.finished[-1] == 'Ceres'
+    for name in names:
+        assert np.allclose(tabs[name]['RA'],
+                           h2s.fetch_ephemerides(name, fromdate, todate, cache=cache)['RA'])
+
+
+def test_fetch_many_errors(monkeypatch, cache, caplog):
+    stub = StubHorizons(fail=['Nosuch'])
+    monkeypatch.setattr(h2s, 'callhorizons', stub)
+    names = ['Ceres', 'Nosuch', 'Vesta']
+    with caplog.at_level('ERROR', logger=h2s.log.name):
+        tabs = h2s.fetch_many(names, fromdate, todate, cache=cache, nthreads=2)
+    assert list(tabs.keys()) == ['Ceres', 'Vesta']
+    assert any('Nosuch' in record.getMessage() for record in caplog.records)
+    # A failed target is not cached
+    h2s.fetch_many(['Nosuch'], fromdate, todate, cache=cache)
+    assert [q[0] for q in stub.queries].count('Nosuch') == 2
+
+
+def test_fetch_many_without_callhorizons(monkeypatch):
+    monkeypatch.setattr(h2s, 'callhorizons', None)
+    assert h2s.fetch_many(['Ceres'], fromdate, todate) == {}
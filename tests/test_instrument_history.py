@@ -0,0 +1,38 @@
+import numpy as np
+
+from instrument_history import (year_of, night_fractions, nights_per_year,
+                                instrument_history)
+
+
+def test_year_of():
+    years, valid = year_of(['2018-02-01', '2018-2-1', '1999/12/31', '', '2/1/2018'])
+    assert list(valid) == [True, True, True, False, False]
+    assert list(years[valid]) == [2018, 2018, 1999]
+
+
+def test_night_fractions():
+    instruments = ['HIRES', 'HIRES/LRIS', 'HIRESr/LRIS', 'LRIS/HIRES/NIRC2', '']
+    assert list(night_fractions(instruments)) == [1, 1, 1, 1, 1]
+    assert np.allclose(night_fractions(instruments, split=True), [1, 0.5, 0.5, 1/3, 1])
+    assert list(night_fractions(instruments, instrument='HIRES')) == [1, 1, 0, 1, 0]
+    assert np.allclose(night_fractions(instruments, instrument='HIRES', split=True),
+                       [1, 0.5, 0, 1/3, 0])
+
+
+def test_nights_per_year():
+    years, nights = nights_per_year(np.array([2001, 1999, 2001]), np.array([1, 0.5, 1]))
+    assert list(years) == [1999, 2000, 2001]
+    assert list(nights) == [0.5, 0, 2]
+
+
+def test_instrument_history_skips_bad_dates(tmp_path, capsys):
+    filename = tmp_path / 'HIRES_history.csv'
+    filename.write_text('Date,Instrument\n'
+                        '2018-2-1,HIRES\n'
+                        '2018-02-02,HIRES/LRIS\n'
+                        ',HIRES\n'
+                        '2019-01-01,HIRESr\n')
+    tab = instrument_history(filename, instrument='HIRES', split=True)
+    assert list(tab['year']) == [2018, 2019]
+    assert list(tab['nights']) == [1.5, 0]
+    assert 'Skipping 1 rows' in capsys.readouterr().out
@@ -0,0 +1,123 @@
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pytest
+from astropy.table import Table
+
+from schedule_db import ScheduleDB
+from mainlandobs_stats import names, fetch_requests, first_use
+
+data = Path(__file__).resolve().parent / 'data'
+
+
+@pytest.fixture(scope='module')
+def dsn(tmp_path_factory):
+    filename = tmp_path_factory.mktemp('mainland') / 'mainland.sqlite'
+    connection = sqlite3.connect(filename)
+    with open(data / 'mainlandObs.sql', 'r') as FO:
+        connection.executescript(FO.read())
+    connection.close()
+    return f'sqlite:///{filename}'
+
+
+def expected_rows(dsn, date1, date2):
+    connection = sqlite3.connect(dsn[len('sqlite://'):])
+    rows = connection.execute(f"select {','.join(names)} from mainlandObs "
+                              "where FromDate between ? and ? and status = 'approved' "
+                              "order by FromDate", (date1, date2)).fetchall()
+    connection.close()
+    return rows
+
+
+class ChunkRecorder(object):
+    '''ScheduleDB wrapper which records the size of each chunk of rows.
+    '''
+    def __init__(self, db):
+        self.db = db
+        self.chunks = []
+
+    def query(self, sql, params=(), chunk_size=1000):
+        for columns, rows in self.db.query(sql, params, chunk_size=chunk_size):
+            self.chunks.append(len(rows))
+            yield columns, rows
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 4, 5, 1000])
+def test_fetch_requests_chunked(dsn, chunk_size):
+    # 2006B to 2007B, 13 approved requests
+    date1, date2 = '2006-08-01', '2008-01-31'
+    expected = expected_rows(dsn, date1, date2)
+    assert len(expected) == 13
+    with ScheduleDB(dsn) as db:
+        recorder = ChunkRecorder(db)
+        tab = fetch_requests(recorder, date1, date2, chunk_size=chunk_size)
+    nfull, remainder = divmod(len(expected), chunk_size)
+    assert recorder.chunks == [chunk_size]*nfull + ([remainder] if remainder else [])
+    assert len(tab) == len(expected)
+    assert [tuple(row) for row in tab[names].as_array().tolist()] \
+        == [tuple(v.encode() if isinstance(v, str) else v for v in row) for row in expected]
+    assert set(tab['Semester']) == {2006.5, 2007.0, 2007.5}
+
+
+def test_fetch_requests_semesters(dsn):
+    with ScheduleDB(dsn) as db:
+        tab = fetch_requests(db, '2005-08-01', '2009-01-31', chunk_size=7)
+    dates = tab['FromDate'].astype(str)
+    assert list(dates) == sorted(dates)
+    assert np.all(tab['Semester'][dates < '2006-02-01'] == 2005.5)
+    assert np.all(tab['Semester'][(dates >= '2008-08-01') & (dates < '2009-02-01')] == 2008.5)
+
+
+def test_fetch_requests_empty(dsn):
+    with ScheduleDB(dsn) as db:
+        tab = fetch_requests(db, '2020-01-01', '2020-12-31', chunk_size=3)
+    assert len(tab) == 0
+    assert tab.colnames == names + ['Semester']
+
+
+def nested_loop_first_use(tab):
+    '''The original first use table, built by searching the table of sites
+    for every site of every request.  The "site != 'Other'" check is added
+    to the second branch, where the original raised with current numpy.
+    '''
+    sitestab = Table(names=('Site', 'Eavesdrop', 'Mainland Only'), dtype=('a20', 'a10', 'a10'))
+    for i,entry in enumerate(tab):
+        sites = entry['Site'].split(' ')
+        for site in sites:
+            if site not in sitestab['Site'].data.astype(str) and site != 'Other':
+                if entry['Mode'] == 'Mainland Only':
+                    sitestab.add_row((site, '-', entry['FromDate']))
+                elif entry['Mode'] == 'Eavesdrop':
+                    sitestab.add_row((site, entry['FromDate'], '-'))
+            elif entry['Mode'] in ['Eavesdrop', 'Mainland Only'] and site != 'Other':
+                if sitestab[np.where(sitestab['Site'].data.astype(str) == site)][entry['Mode']] == b'-':
+                    sitestab[entry['Mode']][np.where(sitestab['Site'].data.astype(str) == site)] = entry['FromDate']
+    return sitestab
+
+
+def test_first_use_matches_nested_loop(dsn):
+    with ScheduleDB(dsn) as db:
+        tab = fetch_requests(db, '2005-08-01', '2009-07-31')
+    tab.sort('FromDate')
+    expected = nested_loop_first_use(tab)
+    result = first_use(tab)
+    assert len(expected) > 5
+    assert result.colnames == expected.colnames
+    assert result.dtype == expected.dtype
+    for name in expected.colnames:
+        assert list(result[name]) == list(expected[name])
+
+
+def test_first_use_small():
+    tab = Table(rows=[('UCB Other', 'Eavesdrop', '2006-01-03'),
+                      ('ANU', 'Other', '2006-01-04'),
+                      ('ANU UCB', 'Mainland Only', '2006-02-01'),
+                      ('UCB', 'Mainland Only', '2006-03-01'),
+                      ('ANU', 'Eavesdrop', '2006-04-01')],
+                names=('Site', 'Mode', 'FromDate'), dtype=('a20', 'a20', 'a20'))
+    result = first_use(tab)
+    assert list(result['Site']) == ['UCB', 'ANU']
+    assert list(result['Eavesdrop']) == ['2006-01-03', '2006-04-01']
+    assert list(result['Mainland Only']) == ['2006-02-01', '2006-02-01']
+    assert first_use(tab[:0]).colnames == ['Site', 'Eavesdrop', 'Mainland Only']
@@ -0,0 +1,66 @@
+import json
+
+import numpy as np
+import pytest
+
+import odometer_engine as engine
+
+
+def write_log(directory, start_hour, nhours):
+    '''A CSU.log in a folder named by date, with bar 1 moving 1 mm and bar 2
+    moving 2 mm every hour on 2024 Mar 1.
+    '''
+    directory.mkdir()
+    lines = []
+    for hour in range(start_hour, start_hour+nhours):
+        for bar in [1, 2]:
+            lines.append(f'Mar  1 {hour:02d}:00:00 csu CSU: Record=<{bar:02d},OK,{bar*hour+1:.3f},0')
+    log_file = directory / 'CSU.log'
+    log_file.write_text('\n'.join(lines) + '\n')
+    return str(log_file)
+
+
+class NoScan(object):
+    def __init__(self, *args, **kwargs):
+        raise AssertionError('Log files were rescanned')
+
+
+@pytest.fixture
+def log_files(tmp_path):
+    # Hours 0-9 and 5-14: the second log overlaps the first from 05:00 to 09:00
+    return [write_log(tmp_path / '20240301', 0, 10),
+            write_log(tmp_path / '20240302', 5, 10)]
+
+
+def test_overlap_counted_once(log_files):
+    results = engine.analyze_log_files(log_files, nprocesses=1)
+    nmoves = sum(np.array(result['nmoves']) for result in results.values())
+    mileage = sum(np.array(result['odometer']) for result in results.values())
+    # One move per bar per hour from 01:00 to 14:00, 09:00 is in the first log
+    assert list(nmoves[:2]) == [14, 14]
+    assert list(mileage[:2]) == [14, 28]
+    assert list(results[log_files[1]]['nmoves'][:2]) == [5, 5]
+    assert 'trimmed' not in results[log_files[1]]
+
+
+def test_trimmed_result_cached(log_files, monkeypatch):
+    first = engine.analyze_log_files(log_files, nprocesses=1)
+    with open(engine.cache_file(log_files[1])) as FO:
+        cached = json.load(FO)
+    assert cached['nmoves'][:2] == [9, 9]
+    assert list(cached['trimmed'].keys()) == ['2024-03-01T05:00:00/2024-03-01T09:00:00']
+    # The second run is served entirely from the cache
+    monkeypatch.setattr(engine, 'ProcessPoolExecutor', NoScan)
+    second = engine.analyze_log_files(log_files, nprocesses=1)
+    assert second == first
+
+
+def test_trimmed_cache_keyed_by_excluded_ranges(log_files, monkeypatch):
+    engine.analyze_log_files(log_files, nprocesses=1)
+    # Without the first log nothing is excluded and the untrimmed result is used
+    monkeypatch.setattr(engine, 'ProcessPoolExecutor', NoScan)
+    results = engine.analyze_log_files(log_files[1:], nprocesses=1)
+    assert results[log_files[1]]['nmoves'][:2] == [9, 9]
+    # A different overlap is a miss
+    with pytest.raises(AssertionError, match='rescanned'):
+        engine.analyze_log_files([log_files[1], log_files[0]], nprocesses=1)
@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+
+from schedule_db import ScheduleDB
+
+
+@pytest.fixture
+def db(tmp_path):
+    filename = tmp_path / 'numbers.sqlite'
+    connection = sqlite3.connect(filename)
+    connection.execute('create table numbers (n integer)')
+    connection.executemany('insert into numbers values (?)', [(i,) for i in range(10)])
+    connection.commit()
+    connection.close()
+    with ScheduleDB(f'sqlite:///{filename}', pool_size=2) as db:
+        yield db
+
+
+def test_query_chunks(db):
+    chunks = [rows for columns, rows in
+              db.query('select n from numbers where n >= %s order by n', (3,), chunk_size=3)]
+    assert [len(rows) for rows in chunks] == [3, 3, 1]
+    assert [row[0] for rows in chunks for row in rows] == list(range(3, 10))
+
+
+def test_abandoned_query_returns_connection(db):
+    for i in range(3*db.pool_size):
+        for columns, rows in db.query('select n from numbers', chunk_size=2):
+            break
+        assert db.nconnections == 1
+        assert db.pool.qsize() == 1
+
+
+def test_abandoned_query_garbage_collected(db):
+    for i in range(3*db.pool_size):
+        query = db.query('select n from numbers', chunk_size=2)
+        next(query)
+        del query
+        assert db.pool.qsize() == 1
+
+
+def test_failed_query_closes_connection(db):
+    with pytest.raises(sqlite3.OperationalError):
+        list(db.query('select n from no_such_table'))
+    assert db.nconnections == 0
+    assert db.pool.qsize() == 0
+    assert len(list(db.query('select n from numbers'))) == 1
+
+
+def test_failed_check_gives_up_slot(db, monkeypatch):
+    outage = {'down': False}
+
+    def check(connection):
+        if outage['down']:
+            raise sqlite3.OperationalError('server has gone away')
+    monkeypatch.setattr(db.backend, 'check', check)
+    for i in range(2*db.pool_size):
+        list(db.query('select n from numbers'))
+        assert db.pool.qsize() == 1
+        outage['down'] = True
+        with pytest.raises(sqlite3.OperationalError):
+            list(db.query('select n from numbers'))
+        assert db.nconnections == 0
+        outage['down'] = False
+    # Once the server is back, the pool still has all of its slots
+    for i in range(db.pool_size):
+        with db.connection():
+            pass
+    assert db.nconnections == 1
+
+
+def test_failed_connect_gives_up_slot(db, monkeypatch):
+    def connect():
+        raise sqlite3.OperationalError('unable to open database file')
+    monkeypatch.setattr(db.backend, 'connect', connect)
+    for i in range(2*db.pool_size):
+        with pytest.raises(sqlite3.OperationalError):
+            list(db.query('select n from numbers'))
+        assert db.nconnections == 0
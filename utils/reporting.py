@@ -0,0 +1,129 @@
+## Import General Tools
+import os
+import json
+from pathlib import Path
+from datetime import date, datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+##-------------------------------------------------------------------------
+## Lazy matplotlib
+##-------------------------------------------------------------------------
+## Report scripts only pay for importing matplotlib when they draw a figure,
+## and use the non-interactive Agg backend unless MPLBACKEND says otherwise.
+formats = ['png', 'svg', 'pdf', 'data']
+_pyplot = None
+
+def pyplot():
+    global _pyplot
+    if _pyplot is None:
+        import matplotlib
+        if os.getenv('MPLBACKEND', default=None) is None:
+            matplotlib.use('Agg')
+        from matplotlib import pyplot as plt
+        _pyplot = plt
+    return _pyplot
+
+
+##-------------------------------------------------------------------------
+## Decimation
+##-------------------------------------------------------------------------
+def pixel_width(figsize=(16,8), dpi=100):
+    return int(figsize[0]*dpi)
+
+
+def decimate(x, *ys, npixels=1600, how='mean'):
+    '''Reduce series with more points than npixels to npixels bins before
+    drawing.  Each bin is represented by its first x value and the mean (or
+    max) of the y values in it, so step plots keep their area (or peaks).
+    Returns x and the decimated ys.
+    '''
+    x = np.asarray(x)
+    if len(x) <= npixels:
+        return (x,) + tuple(np.asarray(y) for y in ys)
+    edges = np.linspace(0, len(x), npixels+1).astype(int)
+    starts = edges[:-1]
+    counts = np.diff(edges)
+    result = [x[starts]]
+    for y in ys:
+        y = np.asarray(y, dtype=float)
+        if how == 'max':
+            result.append(np.maximum.reduceat(y, starts))
+        else:
+            result.append(np.add.reduceat(y, starts)/counts)
+    return tuple(result)
+
+
+##-------------------------------------------------------------------------
+## Rendering
+##-------------------------------------------------------------------------
+def to_json(value):
+    '''Convert numpy values in figure data for JSON.
+    '''
+    if isinstance(value, dict):
+        return {str(k): to_json(v) for k,v in value.items()}
+    elif hasattr(value, 'colnames'):
+        # astropy Table
+        return {name: to_json(value[name]) for name in value.colnames}
+    elif isinstance(value, (list, tuple)):
+        return [to_json(v) for v in value]
+    elif isinstance(value, np.ndarray):
+        if value.dtype.kind in 'MOSU':
+            return [to_json(v) for v in value.tolist()]
+        return to_json(value.tolist())
+    elif isinstance(value, (np.datetime64, date, datetime)):
+        return str(value)
+    elif isinstance(value, bytes):
+        return value.decode()
+    elif isinstance(value, np.generic):
+        return to_json(value.item())
+    elif isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+def output_file(filename, fmt='png'):
+    suffix = '.json' if fmt == 'data' else f'.{fmt}'
+    return Path(filename).with_suffix(suffix)
+
+
+def render(plot, data, filename, fmt='png', rc=None, **kwargs):
+    '''Draw a figure with plot(data) and save it to filename with the
+    suffix for fmt.  With fmt='data' the figure is not drawn and the data
+    are written as JSON instead.  Keyword arguments go to savefig.
+    '''
+    filename = output_file(filename, fmt=fmt)
+    if fmt == 'data':
+        with open(filename, 'w') as FO:
+            json.dump(to_json(data), FO, indent=2)
+        return filename
+    plt = pyplot()
+    with plt.rc_context(rc or {}):
+        plot(data)
+        plt.savefig(filename, format=fmt, **kwargs)
+    plt.close('all')
+    return filename
+
+
+def _render(args):
+    plot, data, filename, fmt, rc, kwargs = args
+    return render(plot, data, filename, fmt=fmt, rc=rc, **kwargs)
+
+
+def render_all(jobs, fmt='png', processes=1):
+    '''Render several figures, each given as (plot, data, filename) or
+    (plot, data, filename, savefig kwargs), in parallel processes if
+    processes > 1.  The plot functions must be importable module level
+    functions.  Returns the output file names.
+    '''
+    args = []
+    for job in jobs:
+        kwargs = dict(job[3]) if len(job) > 3 else {}
+        rc = kwargs.pop('rc', None)
+        args.append((job[0], job[1], job[2], fmt, rc, kwargs))
+    if processes <= 1 or len(args) <= 1 or fmt == 'data':
+        return [_render(arg) for arg in args]
+    with ProcessPoolExecutor(max_workers=min(processes, len(args))) as executor:
+        return list(executor.map(_render, args))